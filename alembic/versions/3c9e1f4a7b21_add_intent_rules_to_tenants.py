@@ -0,0 +1,26 @@
+"""'add_intent_rules_to_tenants'
+
+Revision ID: 3c9e1f4a7b21
+Revises: 682014ff2072
+Create Date: 2026-10-16 10:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e1f4a7b21'
+down_revision: Union[str, None] = '682014ff2072'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tenants', sa.Column('intent_rules', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tenants', 'intent_rules')
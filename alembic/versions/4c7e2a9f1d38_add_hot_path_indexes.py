@@ -0,0 +1,54 @@
+"""'add_hot_path_indexes'
+
+Revision ID: 4c7e2a9f1d38
+Revises: 9b4f2d8e6a15
+Create Date: 2026-10-16 19:05:12.480221
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c7e2a9f1d38'
+down_revision: Union[str, None] = '9b4f2d8e6a15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (nome, tabela, colunas/expressões) dos índices compostos das consultas do /ai.
+# Usados também por scripts/benchmark_indexes.py.
+COMPOSITE_INDEXES = [
+    ('ix_interactions_user_phone_created_at', 'interactions', ['user_phone', 'created_at']),
+    ('ix_user_addresses_phone_tenant_last_used', 'user_addresses', ['user_phone', 'tenant_id', 'last_used_at']),
+    ('ix_menu_images_tenant_id_id', 'menu_images', ['tenant_id', 'id']),
+    ('ix_promocoes_tenant_id_is_ativa', 'promocoes', ['tenant_id', 'is_ativa']),
+    ('ix_produtos_tenant_id_nome_lower', 'produtos', ['tenant_id', sa.text('lower(nome_produto)')]),
+]
+# Índice trigram para os LIKE '%x%' / ILIKE da ferramenta SQL (só Postgres).
+TRGM_INDEX = ('ix_produtos_nome_produto_trgm', 'produtos', 'nome_produto')
+
+
+def upgrade() -> None:
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+    # CREATE INDEX CONCURRENTLY não roda dentro de transação e não bloqueia escritas nas tabelas.
+    with op.get_context().autocommit_block():
+        for name, table, columns in COMPOSITE_INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True, postgresql_concurrently=is_postgres)
+        if is_postgres:
+            op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            name, table, column = TRGM_INDEX
+            op.create_index(
+                name, table, [column], unique=False, if_not_exists=True,
+                postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}, postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        if is_postgres:
+            op.drop_index(TRGM_INDEX[0], table_name=TRGM_INDEX[1], if_exists=True, postgresql_concurrently=True)
+        for name, table, _ in reversed(COMPOSITE_INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=is_postgres)
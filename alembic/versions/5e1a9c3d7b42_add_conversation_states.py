@@ -0,0 +1,35 @@
+"""'add_conversation_states'
+
+Revision ID: 5e1a9c3d7b42
+Revises: 8d2b6e0c5f13
+Create Date: 2026-10-16 16:41:09.518233
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1a9c3d7b42'
+down_revision: Union[str, None] = '8d2b6e0c5f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'conversation_states',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('value', sa.LargeBinary(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_conversation_states_expires_at'), 'conversation_states', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_conversation_states_expires_at'), table_name='conversation_states')
+    op.drop_table('conversation_states')
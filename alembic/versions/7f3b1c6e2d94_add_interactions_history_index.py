@@ -0,0 +1,35 @@
+"""'add_interactions_history_index'
+
+Revision ID: 7f3b1c6e2d94
+Revises: 4c7e2a9f1d38
+Create Date: 2026-10-16 19:48:33.215907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3b1c6e2d94'
+down_revision: Union[str, None] = '4c7e2a9f1d38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+    # Paginação keyset do histórico: WHERE tenant_id, user_phone ORDER BY created_at DESC, id DESC
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_interactions_tenant_phone_created_id', 'interactions',
+            ['tenant_id', 'user_phone', 'created_at', 'id'],
+            unique=False, if_not_exists=True, postgresql_concurrently=is_postgres,
+        )
+
+
+def downgrade() -> None:
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_interactions_tenant_phone_created_id', table_name='interactions', if_exists=True, postgresql_concurrently=is_postgres)
@@ -0,0 +1,28 @@
+"""'add_response_templates_and_tone_variables'
+
+Revision ID: 8d2b6e0c5f13
+Revises: 3c9e1f4a7b21
+Create Date: 2026-10-16 14:03:52.771940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2b6e0c5f13'
+down_revision: Union[str, None] = '3c9e1f4a7b21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tenants', sa.Column('response_templates', sa.Text(), nullable=True))
+    op.add_column('personalities', sa.Column('tone_variables', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('personalities', 'tone_variables')
+    op.drop_column('tenants', 'response_templates')
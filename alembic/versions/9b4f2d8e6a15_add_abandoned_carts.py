@@ -0,0 +1,44 @@
+"""'add_abandoned_carts'
+
+Revision ID: 9b4f2d8e6a15
+Revises: 5e1a9c3d7b42
+Create Date: 2026-10-16 18:22:47.090316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b4f2d8e6a15'
+down_revision: Union[str, None] = '5e1a9c3d7b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'abandoned_carts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_phone', sa.String(), nullable=False),
+        sa.Column('tenant_id', sa.String(), nullable=False),
+        sa.Column('items', sa.JSON(), nullable=False),
+        sa.Column('address', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('last_activity_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['tenant_id'], ['tenants.tenant_id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_abandoned_carts_id'), 'abandoned_carts', ['id'], unique=False)
+    op.create_index(op.f('ix_abandoned_carts_user_phone'), 'abandoned_carts', ['user_phone'], unique=False)
+    op.create_index(op.f('ix_abandoned_carts_tenant_id'), 'abandoned_carts', ['tenant_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_abandoned_carts_tenant_id'), table_name='abandoned_carts')
+    op.drop_index(op.f('ix_abandoned_carts_user_phone'), table_name='abandoned_carts')
+    op.drop_index(op.f('ix_abandoned_carts_id'), table_name='abandoned_carts')
+    op.drop_table('abandoned_carts')
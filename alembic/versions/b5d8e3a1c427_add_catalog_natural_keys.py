@@ -0,0 +1,83 @@
+"""'add_catalog_natural_keys'
+
+Revision ID: b5d8e3a1c427
+Revises: 7f3b1c6e2d94
+Create Date: 2026-10-16 20:31:07.642118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d8e3a1c427'
+down_revision: Union[str, None] = '7f3b1c6e2d94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Chaves naturais usadas como alvo do INSERT ... ON CONFLICT da importação do catálogo
+# (crud/catalog_crud.py). Nomes são únicos por tenant sem diferenciar maiúsculas.
+NATURAL_KEYS = [
+    ('ux_produtos_tenant_id_nome_lower', 'produtos', 'nome_produto'),
+    ('ux_opcionais_tenant_id_nome_lower', 'opcionais', 'nome_opcional'),
+    ('ux_promocoes_tenant_id_nome_lower', 'promocoes', 'nome_promocao'),
+]
+LINK_KEYS = [
+    ('ux_produto_opcional', 'produto_opcional', ['produto_id', 'opcional_id']),
+    ('ux_produto_promocao', 'produto_promocao', ['produto_id', 'promocao_id']),
+]
+
+
+def _check_duplicates(bind) -> None:
+    duplicates = []
+    for _, table, column in NATURAL_KEYS:
+        rows = bind.execute(sa.text(
+            f"SELECT tenant_id, lower({column}) AS nome, count(*) FROM {table} "
+            f"GROUP BY tenant_id, lower({column}) HAVING count(*) > 1"
+        )).fetchall()
+        duplicates.extend(f"{table}: tenant={row[0]} nome={row[1]!r} ({row[2]}x)" for row in rows)
+    if duplicates:
+        raise RuntimeError(
+            "Existem nomes duplicados no catálogo; renomeie ou remova antes de aplicar a migração:\n"
+            + "\n".join(duplicates)
+        )
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    is_postgres = bind.dialect.name == 'postgresql'
+    _check_duplicates(bind)
+
+    # Ligações repetidas não têm significado: mantém uma de cada par.
+    row_id = 'ctid' if is_postgres else 'rowid'
+    for _, table, (left, right) in LINK_KEYS:
+        op.execute(
+            f"DELETE FROM {table} WHERE {row_id} NOT IN "
+            f"(SELECT min({row_id}) FROM {table} GROUP BY {left}, {right})"
+        )
+
+    with op.get_context().autocommit_block():
+        for name, table, column in NATURAL_KEYS:
+            op.create_index(
+                name, table, ['tenant_id', sa.text(f'lower({column})')],
+                unique=True, if_not_exists=True, postgresql_concurrently=is_postgres,
+            )
+        for name, table, columns in LINK_KEYS:
+            op.create_index(name, table, columns, unique=True, if_not_exists=True, postgresql_concurrently=is_postgres)
+        # Coberto pelo índice único acima.
+        op.drop_index('ix_produtos_tenant_id_nome_lower', table_name='produtos', if_exists=True, postgresql_concurrently=is_postgres)
+
+
+def downgrade() -> None:
+    is_postgres = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_produtos_tenant_id_nome_lower', 'produtos', ['tenant_id', sa.text('lower(nome_produto)')],
+            unique=False, if_not_exists=True, postgresql_concurrently=is_postgres,
+        )
+        for name, table, _ in reversed(LINK_KEYS):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=is_postgres)
+        for name, table, _ in reversed(NATURAL_KEYS):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=is_postgres)
@@ -0,0 +1,26 @@
+"""'add_catalog_version_to_tenants'
+
+Revision ID: c3a7f5e9b812
+Revises: b5d8e3a1c427
+Create Date: 2026-10-16 21:12:44.905316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a7f5e9b812'
+down_revision: Union[str, None] = 'b5d8e3a1c427'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tenants', sa.Column('catalog_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('tenants', 'catalog_version')
@@ -0,0 +1,38 @@
+"""'add_cache_invalidations'
+
+Revision ID: d9f1a3c5e724
+Revises: c3a7f5e9b812
+Create Date: 2026-10-16 23:05:17.328410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9f1a3c5e724'
+down_revision: Union[str, None] = 'c3a7f5e9b812'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'cache_invalidations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('entity', sa.String(), nullable=False),
+        sa.Column('tenant_id', sa.String(), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=True),
+        sa.Column('key', sa.String(), nullable=True),
+        sa.Column('origin', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_cache_invalidations_created_at'), 'cache_invalidations', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_cache_invalidations_created_at'), table_name='cache_invalidations')
+    op.drop_table('cache_invalidations')
@@ -4,7 +4,7 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 import os
 
-from core.database import SessionLocal
+from core.database import SessionLocal, PinnedAsyncSessionLocal
 
 # Configurações de Autenticação JWT (duplicadas para evitar circular import, idealmente viriam de um config central)
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -47,3 +47,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    # A conexão é pega na primeira consulta (o 202 do modo assíncrono não abre nenhuma) e
+    # fica presa à sessão: commits intermediários não a devolvem ao pool nem abrem outra.
+    async with PinnedAsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,46 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+# GET condicional das listagens do painel: o navegador guarda a resposta e revalida com
+# If-None-Match a cada uso (no-cache), recebendo 304 enquanto nada mudou.
+CACHE_CONTROL = "private, no-cache"
+# Cursor da próxima página das listagens paginadas por keyset (ausente na última página).
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+
+def catalog_etag(entity: str, tenant_id: str, catalog_version: int, limit: int, cursor: Optional[int]) -> str:
+    """ETag de uma página do catálogo, derivada da versão do catálogo do tenant (sem ler as linhas)."""
+    return make_etag(entity, tenant_id, catalog_version, limit, cursor)
+
+
+def _opaque(tag: str) -> str:
+    # Comparação fraca (RFC 9110): W/"x" e "x" são equivalentes.
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in header.split(",")}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_list_headers(response: Response, etag: str, next_cursor=None):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = str(next_cursor)
@@ -8,7 +8,15 @@ from starlette.staticfiles import StaticFiles
 from core.logging_config import LOGGING_CONFIG
 from core import models
 from core.database import engine
-from api.routers import tenants, ai, personalities, products, authentication, opcionais, promocoes
+from api.routers import tenants, ai, personalities, products, authentication, opcionais, promocoes, conversations, catalog
+from services.agent_registry import agent_registry
+from services.webhook_queue import webhook_queue, AI_ASYNC_ACK_ENABLED
+from services.interaction_writer import interaction_writer, INTERACTION_WRITE_BEHIND_ENABLED
+from core.conversation_state import get_conversation_state_store, close_conversation_state_store
+from core.invalidation_bus import invalidation_bus
+from core.conversation_lock import conversation_locks
+from core.hash_ring import ConsistentHashRing
+from api.sticky_routing import StickyRoutingMiddleware, STICKY_ROUTING_NODES, STICKY_ROUTING_SELF
 
 # Configuração de Logging
 dictConfig(LOGGING_CONFIG)
@@ -33,7 +41,23 @@ from contextlib import asynccontextmanager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print_application_routes()
+    try:
+        agent_registry.warm_up()
+    except Exception as e:
+        logger.error(f"Falha ao pré-construir os agentes de IA: {e}", exc_info=True)
+    get_conversation_state_store().start()
+    invalidation_bus.start()
+    if INTERACTION_WRITE_BEHIND_ENABLED:
+        interaction_writer.start()
+    if AI_ASYNC_ACK_ENABLED:
+        webhook_queue.start(handler=ai.process_queued_ai_request)
     yield
+    await webhook_queue.stop()
+    # Depois da fila: os últimos jobs ainda geram interações.
+    await interaction_writer.stop()
+    await conversation_locks.close()
+    await close_conversation_state_store()
+    await invalidation_bus.stop()
 
 app = FastAPI(
     title="API de Chatbot com Equipe de IAs (Agno)",
@@ -42,6 +66,11 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Com vários nós, cada conversa é encaminhada sempre ao mesmo nó (dono no anel de hash).
+if STICKY_ROUTING_NODES and STICKY_ROUTING_SELF:
+    app.add_middleware(StickyRoutingMiddleware, ring=ConsistentHashRing(STICKY_ROUTING_NODES), self_node=STICKY_ROUTING_SELF)
+    logger.info(f"Roteamento por conversa ativo: este nó é {STICKY_ROUTING_SELF} em {STICKY_ROUTING_NODES}.")
+
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="templates"), name="static")
 
@@ -60,6 +89,8 @@ app.include_router(personalities.router)
 app.include_router(products.router)
 app.include_router(opcionais.router)
 app.include_router(promocoes.router)
+app.include_router(conversations.router)
+app.include_router(catalog.router)
 
 def print_application_routes():
     """Imprime todas as rotas disponíveis na inicialização da aplicação."""
@@ -1,6 +1,8 @@
 import logging
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from pydantic import ValidationError
 from starlette.concurrency import run_in_threadpool
@@ -10,16 +12,137 @@ import httpx
 
 from crud import tenant_crud, interaction_crud, menu_image_crud
 from core import schemas
+from core import unit_of_work as uow_module
+from core.unit_of_work import unit_of_work
+from core.tenant_cache import get_tenant_snapshot, tenant_cache
+from core.catalog_cache import catalog_cache
+from core.invalidation_bus import invalidation_bus
+from core.conversation_state import get_conversation_state_store
 from services import chat_service, google_maps_service, file_handler
-from api.dependencies import get_db, get_current_user
-from core.database import SessionLocal
+from services.webhook_queue import webhook_queue, QueueFullError, AI_CALLBACK_URL
+from services.intent_router import intent_cache
+from services.message_dedup import message_deduplicator
+from services.interaction_writer import interaction_writer
+from services.conversation_history import conversation_history
+from api.dependencies import get_db, get_async_db, get_current_user
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-@router.post("/ai", response_model=List[schemas.AIWebhookResponsePart], tags=["IA"])
-async def handle_ai_webhook(request: Request, db: Session = Depends(get_db)):
+async def _build_response_parts(ai_result: dict, tenant, db: AsyncSession) -> List[dict]:
+    """Converte o AIResponse (dict) nas partes do webhook (AIWebhookResponsePart)."""
+    response_parts = []
+    text_response = ai_result.get("response_text")
+    human_handoff = ai_result.get("human_handoff", False)
+    send_menu = ai_result.get("send_menu", False)
+
+    if not isinstance(text_response, str):
+        text_response = str(text_response)
+
+    if text_response:
+        response_parts.append({
+            "part_id": 1,
+            "type": "text",
+            "text_content": text_response,
+            "human_handoff": False,
+            "send_menu": False
+        })
+
+    if send_menu:
+        latest_image = await menu_image_crud.get_latest_menu_image_by_tenant_async(db, tenant.tenant_id)
+        if latest_image and latest_image.image_url:
+            try:
+                async with httpx.AsyncClient() as client:
+                    response = await client.get(latest_image.image_url)
+                    response.raise_for_status()
+                    optimized_content = await file_handler.optimize_image(response.content)
+                    image_base64 = base64.b64encode(optimized_content).decode("utf-8")
+
+                response_parts.append({
+                    "part_id": len(response_parts) + 1,
+                    "type": "file",
+                    "human_handoff": False,
+                    "send_menu": True,
+                    "file_details": {
+                        "retrieval_key": "menu_image",
+                        "file_type": "image/jpeg",
+                        "base64_content": image_base64
+                    }
+                })
+            except Exception as e:
+                logger.error(f"Erro ao baixar ou processar imagem do cardápio: {e}", exc_info=True)
+        else:
+            logger.warning(f"send_menu era True, mas nenhuma imagem de cardápio foi encontrada para o tenant {tenant.tenant_id}")
+
+    if human_handoff:
+        response_parts.append({
+            "part_id": len(response_parts) + 1,
+            "type": "validation",
+            "human_handoff": True,
+            "send_menu": False
+        })
+
+    if not response_parts:
+        logger.warning("Nenhuma parte de resposta foi gerada pela IA.")
+
+    return response_parts
+
+async def _process_ai_request(ai_request: schemas.AIWebhookRequest, tenant, db: AsyncSession) -> List[dict]:
+    """Executa o workflow para uma requisição já validada e monta as partes da resposta."""
+    personality_prompt = tenant.prompt
+    
+    file_content = None
+    mimetype = None
+    if ai_request.message_base64 and ai_request.mimetype:
+        try:
+            file_content = base64.b64decode(ai_request.message_base64)
+            mimetype = ai_request.mimetype
+            logger.info(f"Mensagem com mídia recebida. Mimetype: {mimetype}, Tamanho: {len(file_content)} bytes")
+        except Exception as e:
+            logger.error(f"Erro ao decodificar a mensagem em base64: {e}", exc_info=True)
+    
+    logger.info(f"Chamando chat_service.handle_message com os seguintes parâmetros:")
+    # ... (logs de debug)
+
+    ai_result = await chat_service.handle_message(
+        user_id=ai_request.user_phone,
+        session_id=ai_request.whatsapp_message_id,
+        message=ai_request.message_user,
+        tenant_id=ai_request.tenant_id,
+        personality_prompt=personality_prompt,
+        file_content=file_content,
+        mimetype=mimetype,
+        client_latitude=ai_request.latitude,
+        client_longitude=ai_request.longitude
+    )
+
+    logger.info(f"Resposta Estruturada da IA: {ai_result}")
+
+    return await _build_response_parts(ai_result, tenant, db)
+
+async def process_queued_ai_request(payload: dict) -> List[dict]:
+    """Handler dos workers da WebhookQueue: cada job é uma unidade de trabalho própria."""
+    ai_request = schemas.AIWebhookRequest(**payload)
+    async with unit_of_work() as uow:
+        db = uow.db
+        tenant = await get_tenant_snapshot(ai_request.tenant_id, db)
+        if not tenant or not tenant.is_active:
+            raise HTTPException(status_code=404, detail=f"Cliente com o ID '{ai_request.tenant_id}' não foi encontrado ou está inativo.")
+        return await _process_ai_request(ai_request, tenant, db)
+
+@router.post(
+    "/ai",
+    response_model=List[schemas.AIWebhookResponsePart],
+    responses={202: {"model": schemas.AIWebhookAccepted}, 429: {"description": "Fila de mensagens cheia"}},
+    tags=["IA"]
+)
+async def handle_ai_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     logger.info("ROTA /ai ACESSADA!")
+    # A sessão da requisição vira a unidade de trabalho: CRUD, ferramentas e caches a compartilham.
+    async with unit_of_work(session=db):
+        return await _handle_ai_webhook(request, db)
+
+async def _handle_ai_webhook(request: Request, db: AsyncSession):
     try:
         request_body = await request.json()
         logger.info(f"RAW REQUEST BODY RECEIVED: {request_body}")
@@ -41,95 +164,22 @@ async def handle_ai_webhook(request: Request, db: Session = Depends(get_db)):
             logger.error(f"PYDANTIC VALIDATION ERROR: {e.errors()}", exc_info=True)
             raise HTTPException(status_code=422, detail=e.errors())
 
-        tenant = await run_in_threadpool(tenant_crud.get_tenant_by_id, db, tenant_id=ai_request.tenant_id)
+        tenant = await get_tenant_snapshot(ai_request.tenant_id, db)
         if not tenant or not tenant.is_active:
             logger.error(f"Tenant com ID '{ai_request.tenant_id}' não encontrado ou inativo.")
             raise HTTPException(status_code=404, detail=f"Cliente com o ID '{ai_request.tenant_id}' não foi encontrado ou está inativo.")
 
-        personality_prompt = tenant.personality.prompt if tenant.personality and tenant.personality.prompt else "Você é um assistente de IA prestativo."
-        
-        file_content = None
-        mimetype = None
-        if ai_request.message_base64 and ai_request.mimetype:
+        if webhook_queue.running:
+            # Modo assíncrono: confirma o recebimento na hora e entrega a resposta no callback.
             try:
-                file_content = base64.b64decode(ai_request.message_base64)
-                mimetype = ai_request.mimetype
-                logger.info(f"Mensagem com mídia recebida. Mimetype: {mimetype}, Tamanho: {len(file_content)} bytes")
-            except Exception as e:
-                logger.error(f"Erro ao decodificar a mensagem em base64: {e}", exc_info=True)
-        
-        logger.info(f"Chamando chat_service.handle_message com os seguintes parâmetros:")
-        # ... (logs de debug)
-
-        ai_result = await chat_service.handle_message(
-            user_id=ai_request.user_phone,
-            session_id=ai_request.whatsapp_message_id,
-            message=ai_request.message_user,
-            tenant_id=ai_request.tenant_id,
-            personality_prompt=personality_prompt,
-            file_content=file_content,
-            mimetype=mimetype,
-            client_latitude=ai_request.latitude,
-            client_longitude=ai_request.longitude
-        )
-
-        logger.info(f"Resposta Estruturada da IA: {ai_result}")
-
-        response_parts = []
-        text_response = ai_result.get("response_text")
-        human_handoff = ai_result.get("human_handoff", False)
-        send_menu = ai_result.get("send_menu", False)
-
-        if not isinstance(text_response, str):
-            text_response = str(text_response)
-
-        if text_response:
-            response_parts.append({
-                "part_id": 1,
-                "type": "text",
-                "text_content": text_response,
-                "human_handoff": False,
-                "send_menu": False
-            })
-
-        if send_menu:
-            latest_image = await run_in_threadpool(menu_image_crud.get_latest_menu_image_by_tenant, db, tenant.tenant_id)
-            if latest_image and latest_image.image_url:
-                try:
-                    async with httpx.AsyncClient() as client:
-                        response = await client.get(latest_image.image_url)
-                        response.raise_for_status()
-                        optimized_content = await file_handler.optimize_image(response.content)
-                        image_base64 = base64.b64encode(optimized_content).decode("utf-8")
-
-                    response_parts.append({
-                        "part_id": len(response_parts) + 1,
-                        "type": "file",
-                        "human_handoff": False,
-                        "send_menu": True,
-                        "file_details": {
-                            "retrieval_key": "menu_image",
-                            "file_type": "image/jpeg",
-                            "base64_content": image_base64
-                        }
-                    })
-                except Exception as e:
-                    logger.error(f"Erro ao baixar ou processar imagem do cardápio: {e}", exc_info=True)
-            else:
-                logger.warning(f"send_menu era True, mas nenhuma imagem de cardápio foi encontrada para o tenant {tenant.tenant_id}")
-        
-        if human_handoff:
-            response_parts.append({
-                "part_id": len(response_parts) + 1,
-                "type": "validation",
-                "human_handoff": True,
-                "send_menu": False
-            })
-
-        if not response_parts:
-            logger.warning("Nenhuma parte de resposta foi gerada pela IA.")
+                job = webhook_queue.submit(ai_request.model_dump())
+            except QueueFullError as e:
+                logger.warning(f"{e} Mensagem {ai_request.whatsapp_message_id} recusada.")
+                raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+            logger.info(f"Mensagem {ai_request.whatsapp_message_id} enfileirada como job {job.job_id}.")
+            return JSONResponse(status_code=202, content=schemas.AIWebhookAccepted(job_id=job.job_id, status=job.status).model_dump())
 
-        return response_parts
+        return await _process_ai_request(ai_request, tenant, db)
 
     except HTTPException as http_exc:
         raise http_exc
@@ -137,6 +187,38 @@ async def handle_ai_webhook(request: Request, db: Session = Depends(get_db)):
         logger.critical(f"Erro crítico na rota /ai: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Ocorreu um erro interno no servidor: {str(e)}")
 
+@router.get("/ai/jobs/{job_id}", response_model=schemas.AIWebhookCallback, tags=["IA"], dependencies=[Depends(get_current_user)])
+async def get_ai_job(job_id: str):
+    """Consulta o estado de uma mensagem aceita no modo assíncrono."""
+    job = webhook_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job.to_callback()
+
+# Só existe no modo stub (AI_CALLBACK_URL vazia) e exige autenticação, como as demais rotas administrativas.
+if not AI_CALLBACK_URL:
+    @router.post("/ai/callback-stub", status_code=204, tags=["IA"], dependencies=[Depends(get_current_user)])
+    async def ai_callback_stub(callback: schemas.AIWebhookCallback):
+        """Callback local para testes: grava o corpo no stub em memória, consultável em /ai/jobs/{job_id}."""
+        logger.info(f"Callback recebido no stub local para o job {callback.job_id} ({callback.status}).")
+        await webhook_queue.stub.deliver(callback.model_dump())
+
+@router.get("/ai/stats", tags=["IA"], dependencies=[Depends(get_current_user)])
+async def get_ai_stats():
+    """Métricas em processo: estado das conversas, fila do modo assíncrono e caches."""
+    return {
+        "conversation_state": get_conversation_state_store().stats(),
+        "webhook_queue": webhook_queue.stats(),
+        "intent_cache": intent_cache.stats(),
+        "message_dedup": message_deduplicator.stats(),
+        "interaction_writer": interaction_writer.stats(),
+        "conversation_history": conversation_history.stats(),
+        "tenant_cache": {"hits": tenant_cache.hits, "misses": tenant_cache.misses},
+        "catalog_cache": catalog_cache.stats(),
+        "invalidation_bus": invalidation_bus.stats(),
+        "db_connections_per_request": uow_module.stats(),
+    }
+
 @router.post("/calcular-frete", dependencies=[Depends(get_current_user)])
 async def calcular_frete(
     tenant_id: str,
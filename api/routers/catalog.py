@@ -0,0 +1,54 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from sqlalchemy.orm import Session
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+
+from crud import tenant_crud, catalog_crud
+from core import schemas
+from services import catalog_import
+from api.dependencies import get_db, get_current_user
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.post("/catalog/{tenant_id}/import", response_model=schemas.CatalogImportReport, tags=["Catálogo"], dependencies=[Depends(get_current_user)])
+async def import_catalog(
+    tenant_id: str,
+    file: UploadFile = File(...),
+    entidade: Optional[str] = Form(None),
+    dry_run: bool = Form(False),
+    db: Session = Depends(get_db)
+):
+    """
+    Importação em lote do catálogo a partir de um .xlsx (abas produtos, opcionais, promocoes,
+    produto_opcional e produto_promocao) ou de um .csv de uma entidade. Retorna o relatório
+    por linha; com dry_run=true só valida.
+    """
+    tenant = tenant_crud.get_tenant_by_id(db, tenant_id)
+    if not tenant:
+        raise HTTPException(status_code=404, detail="Tenant não encontrado.")
+
+    logger.info(f"Importando catálogo para o tenant {tenant_id}: {file.filename} (entidade={entidade}, dry_run={dry_run})")
+    try:
+        return await run_in_threadpool(catalog_import.import_catalog, db, tenant_id, file.file, file.filename, entidade, dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.post("/catalog/{tenant_id}/produto-opcional", response_model=schemas.ProductOpcionalBatchResult, tags=["Catálogo"], dependencies=[Depends(get_current_user)])
+def batch_product_opcionais(tenant_id: str, batch: schemas.ProductOpcionalBatch, db: Session = Depends(get_db)):
+    """
+    Liga/desliga opcionais de produtos em lote: pares (product_id, opcional_id) e regras
+    (opcionais para todos os produtos de uma categoria, ou do tenant). Os desligamentos são
+    aplicados antes das ligações, tudo em uma transação.
+    """
+    product_ids = {pair.product_id for pair in batch.link + batch.unlink}
+    opcional_ids = {pair.opcional_id for pair in batch.link + batch.unlink}
+    opcional_ids.update(id_ for rule in batch.link_rules + batch.unlink_rules for id_ in rule.opcional_ids)
+
+    foreign = catalog_crud.get_foreign_ids(db, tenant_id, product_ids, opcional_ids)
+    if foreign:
+        raise HTTPException(status_code=404, detail={"message": "Produtos ou opcionais não encontrados para este tenant.", **foreign})
+
+    logger.info(f"Lote de opcionais para o tenant {tenant_id}: {len(batch.link)} ligação(ões), {len(batch.unlink)} desligamento(s), {len(batch.link_rules) + len(batch.unlink_rules)} regra(s)")
+    return catalog_crud.apply_product_opcional_batch(db, tenant_id, batch)
@@ -0,0 +1,26 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from core import schemas
+from api.dependencies import get_async_db, get_current_user
+from services.conversation_history import conversation_history
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("/conversations/{tenant_id}/{user_phone}/history", response_model=schemas.InteractionHistoryPage, tags=["Conversas"], dependencies=[Depends(get_current_user)])
+async def get_conversation_history(tenant_id: str, user_phone: str, limit: int = 20, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    """Histórico da conversa, do mais novo para o mais antigo. Use next_cursor para a página seguinte."""
+    try:
+        turns, next_cursor = await conversation_history.page(db, tenant_id, user_phone, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": [turn.to_dict() for turn in turns], "next_cursor": next_cursor}
+
+@router.get("/conversations/{tenant_id}/{user_phone}/recent", response_model=List[schemas.InteractionHistoryItem], tags=["Conversas"], dependencies=[Depends(get_current_user)])
+async def get_recent_turns(tenant_id: str, user_phone: str, limit: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
+    """Últimos turnos da conversa (janela em memória), do mais antigo para o mais novo."""
+    turns = await conversation_history.recent(db, tenant_id, user_phone, limit=limit)
+    return [turn.to_dict() for turn in turns]
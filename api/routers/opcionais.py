@@ -1,11 +1,13 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional
 
-from crud import opcional_crud
+from crud import opcional_crud, tenant_crud
 from core import schemas
 from api.dependencies import get_db, get_current_user
+from api import http_cache
 from services.agent_manager import load_data_to_vector_db
 from starlette.concurrency import run_in_threadpool
 
@@ -15,15 +17,24 @@ logger = logging.getLogger(__name__)
 @router.post("/opcionais/{tenant_id}", response_model=schemas.Opcional, tags=["Opcionais"], dependencies=[Depends(get_current_user)])
 async def create_opcional(tenant_id: str, opcional: schemas.OpcionalCreate, db: Session = Depends(get_db)):
     logger.info(f"Criando opcional para tenant {tenant_id}: {opcional.nome_opcional}")
-    db_opcional = opcional_crud.create_opcional(db, opcional, tenant_id)
+    try:
+        db_opcional = opcional_crud.create_opcional(db, opcional, tenant_id)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Já existe um opcional com este nome.")
     
     return db_opcional
 
 @router.get("/opcionais/{tenant_id}", response_model=List[schemas.Opcional], tags=["Opcionais"], dependencies=[Depends(get_current_user)])
-def get_opcionais(tenant_id: str, db: Session = Depends(get_db)):
+def get_opcionais(tenant_id: str, request: Request, response: Response, limit: int = 100, cursor: Optional[int] = None, db: Session = Depends(get_db)):
+    etag = http_cache.catalog_etag("opcionais", tenant_id, tenant_crud.get_catalog_version(db, tenant_id), limit, cursor)
+    if http_cache.is_not_modified(request, etag):
+        return http_cache.not_modified(etag)
+
     logger.info(f"Buscando opcionais para o tenant: {tenant_id}")
-    opcionais = opcional_crud.get_opcionais_by_tenant(db, tenant_id)
+    opcionais, next_cursor = opcional_crud.get_opcionais_page(db, tenant_id, limit=limit, after=cursor)
     logger.info(f"Encontrados {len(opcionais)} opcionais para o tenant {tenant_id}.")
+    http_cache.set_list_headers(response, etag, next_cursor)
     return opcionais
 
 @router.put("/opcionais/{tenant_id}/{opcional_id}", response_model=schemas.Opcional, tags=["Opcionais"], dependencies=[Depends(get_current_user)])
@@ -33,7 +44,11 @@ async def update_opcional(tenant_id: str, opcional_id: int, opcional: schemas.Op
     if not db_opcional or db_opcional.tenant_id != tenant_id:
         raise HTTPException(status_code=404, detail="Opcional não encontrado.")
     
-    updated_opcional = opcional_crud.update_opcional(db, opcional_id, opcional)
+    try:
+        updated_opcional = opcional_crud.update_opcional(db, opcional_id, opcional)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Já existe um opcional com este nome.")
     
     return updated_opcional
 
@@ -1,18 +1,26 @@
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from crud import personality_crud
 from core import schemas
+from services.response_templates import parse_tone_variables
 from api.dependencies import get_db, get_current_user
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+def _validate_tone_variables(tone_variables: Optional[str]):
+    try:
+        parse_tone_variables(tone_variables)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 @router.post("/personalities/", response_model=schemas.Personality, tags=["Personalities"], dependencies=[Depends(get_current_user)])
 def create_personality(personality: schemas.PersonalityCreate, db: Session = Depends(get_db)):
     logger.info(f"Tentando criar personalidade: {personality.name}")
+    _validate_tone_variables(personality.tone_variables)
     db_personality = personality_crud.get_personality_by_name(db, name=personality.name)
     if db_personality:
         logger.warning(f"Tentativa de criar personalidade existente: {personality.name}")
@@ -38,6 +46,7 @@ def get_personality_by_name(personality_name: str, db: Session = Depends(get_db)
 @router.put("/personalities/{personality_name}", response_model=schemas.Personality, tags=["Personalities"], dependencies=[Depends(get_current_user)])
 def update_personality(personality_name: str, personality: schemas.PersonalityCreate, db: Session = Depends(get_db)):
     """Atualiza uma personalidade da IA existente."""
+    _validate_tone_variables(personality.tone_variables)
     db_personality = personality_crud.get_personality_by_name(db, name=personality_name)
     if db_personality is None:
         raise HTTPException(status_code=404, detail="Personalidade não encontrada")
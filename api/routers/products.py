@@ -1,11 +1,13 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional
 
-from crud import product_crud, opcional_crud, promocao_crud
+from crud import product_crud, opcional_crud, promocao_crud, tenant_crud
 from core import schemas
 from api.dependencies import get_db, get_current_user
+from api import http_cache
 from services.agent_manager import load_data_to_vector_db
 from starlette.concurrency import run_in_threadpool
 
@@ -16,19 +18,24 @@ logger = logging.getLogger(__name__)
 @router.post("/products/{tenant_id}", response_model=schemas.Product, tags=["Products"], dependencies=[Depends(get_current_user)])
 async def create_product(tenant_id: str, product: schemas.ProductCreate, db: Session = Depends(get_db)):
     logger.info(f"Criando produto para tenant {tenant_id}: {product.nome_produto}")
-    db_product = product_crud.create_product(db, product, tenant_id)
+    try:
+        db_product = product_crud.create_product(db, product, tenant_id)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Já existe um produto com este nome.")
     
     return db_product
 
-@router.get("/products/{tenant_id}", response_model=List[schemas.Product], tags=["Products"], dependencies=[Depends(get_current_user)])
-def get_products(tenant_id: str, db: Session = Depends(get_db)):
+@router.get("/products/{tenant_id}", response_model=List[schemas.ProductListItem], tags=["Products"], dependencies=[Depends(get_current_user)])
+def get_products(tenant_id: str, request: Request, response: Response, limit: int = 100, cursor: Optional[int] = None, db: Session = Depends(get_db)):
+    etag = http_cache.catalog_etag("produtos", tenant_id, tenant_crud.get_catalog_version(db, tenant_id), limit, cursor)
+    if http_cache.is_not_modified(request, etag):
+        return http_cache.not_modified(etag)
+
     logger.info(f"Buscando produtos para o tenant: {tenant_id}")
-    products = product_crud.get_products_by_tenant(db, tenant_id=tenant_id)
+    products, next_cursor = product_crud.get_products_page(db, tenant_id, limit=limit, after=cursor)
     logger.info(f"Encontrados {len(products)} produtos para o tenant {tenant_id}.")
-    # Opcional: Logar os nomes dos produtos para verificação rápida
-    if products:
-        product_names = [p.nome_produto for p in products]
-        logger.debug(f"Nomes dos produtos: {product_names}")
+    http_cache.set_list_headers(response, etag, next_cursor)
     return products
 
 @router.get("/products/{tenant_id}/{product_id}", response_model=schemas.Product, tags=["Products"], dependencies=[Depends(get_current_user)])
@@ -46,7 +53,11 @@ async def update_product(tenant_id: str, product_id: int, product: schemas.Produ
     if not db_product or db_product.tenant_id != tenant_id:
         raise HTTPException(status_code=404, detail="Produto não encontrado.")
     
-    updated_product = product_crud.update_product(db, product_id, product)
+    try:
+        updated_product = product_crud.update_product(db, product_id, product)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Já existe um produto com este nome.")
     
     return updated_product
 
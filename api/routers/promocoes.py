@@ -1,11 +1,13 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional
 
-from crud import promocao_crud
+from crud import promocao_crud, tenant_crud
 from core import schemas
 from api.dependencies import get_db, get_current_user
+from api import http_cache
 from services.agent_manager import load_data_to_vector_db
 from starlette.concurrency import run_in_threadpool
 
@@ -15,15 +17,24 @@ logger = logging.getLogger(__name__)
 @router.post("/promocoes/{tenant_id}", response_model=schemas.Promocao, tags=["Promocoes"], dependencies=[Depends(get_current_user)])
 async def create_promocao(tenant_id: str, promocao: schemas.PromocaoCreate, db: Session = Depends(get_db)):
     logger.info(f"Criando promoção para tenant {tenant_id}: {promocao.nome_promocao}")
-    db_promocao = promocao_crud.create_promocao(db, promocao, tenant_id)
+    try:
+        db_promocao = promocao_crud.create_promocao(db, promocao, tenant_id)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Já existe uma promoção com este nome.")
     
     return db_promocao
 
 @router.get("/promocoes/{tenant_id}", response_model=List[schemas.Promocao], tags=["Promocoes"], dependencies=[Depends(get_current_user)])
-def get_promocoes(tenant_id: str, db: Session = Depends(get_db)):
+def get_promocoes(tenant_id: str, request: Request, response: Response, limit: int = 100, cursor: Optional[int] = None, db: Session = Depends(get_db)):
+    etag = http_cache.catalog_etag("promocoes", tenant_id, tenant_crud.get_catalog_version(db, tenant_id), limit, cursor)
+    if http_cache.is_not_modified(request, etag):
+        return http_cache.not_modified(etag)
+
     logger.info(f"Buscando promoções para o tenant: {tenant_id}")
-    promocoes = promocao_crud.get_promocoes_by_tenant(db, tenant_id)
+    promocoes, next_cursor = promocao_crud.get_promocoes_page(db, tenant_id, limit=limit, after=cursor)
     logger.info(f"Encontradas {len(promocoes)} promoções para o tenant {tenant_id}.")
+    http_cache.set_list_headers(response, etag, next_cursor)
     return promocoes
 
 @router.put("/promocoes/{tenant_id}/{promocao_id}", response_model=schemas.Promocao, tags=["Promocoes"], dependencies=[Depends(get_current_user)])
@@ -33,7 +44,11 @@ async def update_promocao(tenant_id: str, promocao_id: int, promocao: schemas.Pr
     if not db_promocao or db_promocao.tenant_id != tenant_id:
         raise HTTPException(status_code=404, detail="Promoção não encontrada.")
     
-    updated_promocao = promocao_crud.update_promocao(db, promocao_id, promocao)
+    try:
+        updated_promocao = promocao_crud.update_promocao(db, promocao_id, promocao)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Já existe uma promoção com este nome.")
     
     return updated_promocao
 
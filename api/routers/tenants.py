@@ -1,6 +1,6 @@
 import logging
 import os
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import pandas as pd
@@ -11,11 +11,27 @@ from fastapi.responses import PlainTextResponse
 from crud import tenant_crud, product_crud, opcional_crud, promocao_crud, menu_image_crud
 from core import models, schemas
 from services import file_handler, agent_manager
+from core.vector_db import invalidate_vector_db_manager
+from services.intent_router import parse_intent_rules
+from services.response_templates import parse_response_templates
 from api.dependencies import get_db, get_current_user
+from api import http_cache
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+def _validate_intent_rules(intent_rules: Optional[str]):
+    try:
+        parse_intent_rules(intent_rules)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+def _validate_response_templates(response_templates: Optional[str]):
+    try:
+        parse_response_templates(response_templates)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 @router.post("/tenants/config", response_model=schemas.Tenant, tags=["Tenants"], dependencies=[Depends(get_current_user)])
 def get_tenant_config(request: schemas.TenantConfigRequest, db: Session = Depends(get_db)):
     tenant = tenant_crud.get_tenant_by_id(db, tenant_id=request.instancia)
@@ -40,8 +56,13 @@ async def create_tenant(
     longitude: float = Form(...),
     loja_txt: UploadFile = File(...),
     freight_config: Optional[str] = Form(None),
+    intent_rules: Optional[str] = Form(None),
+    response_templates: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
+    _validate_intent_rules(intent_rules)
+    _validate_response_templates(response_templates)
+
     conteudo_loja = await loja_txt.read()
     conteudo_loja = conteudo_loja.decode("utf-8")
     
@@ -54,7 +75,9 @@ async def create_tenant(
         cep=cep,
         latitude=latitude,
         longitude=longitude,
-        freight_config=freight_config
+        freight_config=freight_config,
+        intent_rules=intent_rules,
+        response_templates=response_templates
     )
     
     tenant = tenant_crud.create_tenant(db, tenant_data, conteudo_loja)
@@ -64,11 +87,16 @@ async def create_tenant(
 
     return tenant
 
-@router.get("/tenants/", response_model=List[schemas.Tenant], tags=["Tenants"], dependencies=[Depends(get_current_user)])
-def get_all_tenants(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.get("/tenants/", response_model=List[schemas.TenantListItem], tags=["Tenants"], dependencies=[Depends(get_current_user)])
+def get_all_tenants(request: Request, response: Response, limit: int = 100, cursor: Optional[int] = None, db: Session = Depends(get_db)):
     try:
-        tenants = tenant_crud.get_all_tenants(db, skip=skip, limit=limit)
-        logger.info(f"Clientes recuperados do banco de dados: {tenants}")
+        tenants, next_cursor = tenant_crud.get_tenants_page(db, limit=limit, after=cursor)
+        logger.info(f"{len(tenants)} cliente(s) recuperado(s) do banco de dados.")
+        # A lista de tenants não tem contador de versão: o ETag vem das próprias linhas da página.
+        etag = http_cache.make_etag("tenants", limit, cursor, *(tuple(tenant.values()) for tenant in tenants))
+        if http_cache.is_not_modified(request, etag):
+            return http_cache.not_modified(etag)
+        http_cache.set_list_headers(response, etag, next_cursor)
         return tenants
     except Exception as e:
         logger.error(f"Erro ao buscar clientes no banco de dados: {e}", exc_info=True)
@@ -97,9 +125,14 @@ async def update_tenant(
     url: Optional[str] = Form(None),
     is_active: Optional[bool] = Form(None),
     freight_config: Optional[str] = Form(None),
+    intent_rules: Optional[str] = Form(None),
+    response_templates: Optional[str] = Form(None),
     loja_txt: UploadFile = File(None),
     db: Session = Depends(get_db)
 ):
+    _validate_intent_rules(intent_rules)
+    _validate_response_templates(response_templates)
+
     existing_tenant = tenant_crud.get_tenant_by_id(db, tenant_id)
     if not existing_tenant:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
@@ -115,6 +148,8 @@ async def update_tenant(
         "url": url,
         "is_active": is_active,
         "freight_config": freight_config,
+        "intent_rules": intent_rules,
+        "response_templates": response_templates,
     }
     filtered_update_data = {}
     for key, value in tenant_update_data.items():
@@ -141,7 +176,9 @@ def toggle_tenant_status(tenant_id: str, status_data: dict, db: Session = Depend
 
 @router.delete("/tenants/{tenant_id}", dependencies=[Depends(get_current_user)])
 def delete_tenant(tenant_id: str, db: Session = Depends(get_db)):
-    return tenant_crud.delete_tenant(db, tenant_id)
+    result = tenant_crud.delete_tenant(db, tenant_id)
+    invalidate_vector_db_manager(tenant_id)
+    return result
 
 @router.get("/tenant-data/{tenant_id}", dependencies=[Depends(get_current_user)])
 def get_tenant_data(tenant_id: str, db: Session = Depends(get_db)):
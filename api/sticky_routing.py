@@ -0,0 +1,181 @@
+import os
+import json
+import logging
+import argparse
+from typing import Iterable, List, Optional
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from core.hash_ring import ConsistentHashRing, conversation_routing_key
+
+logger = logging.getLogger(__name__)
+
+# URLs base dos nós (ex.: "http://10.0.0.1:8000,http://10.0.0.2:8000") e a URL deste nó.
+STICKY_ROUTING_NODES = [node.strip().rstrip("/") for node in os.getenv("STICKY_ROUTING_NODES", "").split(",") if node.strip()]
+STICKY_ROUTING_SELF = os.getenv("STICKY_ROUTING_SELF", "").rstrip("/")
+# O /ai pode levar vários segundos no workflow síncrono.
+STICKY_ROUTING_TIMEOUT_SECONDS = float(os.getenv("STICKY_ROUTING_TIMEOUT_SECONDS", "120"))
+STICKY_ROUTING_PATHS = ("/ai",)
+
+# Marca requisições já encaminhadas, para que o nó de destino não encaminhe de novo.
+FORWARDED_HEADER = "x-sticky-forwarded"
+# Cabeçalhos que não podem ser repassados como estão entre cliente, proxy e nó.
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailers",
+    "transfer-encoding", "upgrade", "host", "content-length", "content-encoding",
+}
+
+
+def routing_key_from_body(body: bytes) -> Optional[str]:
+    """Extrai user_phone + tenant_id do corpo do /ai. Retorna None se não for possível."""
+    try:
+        data = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(data, dict) or not data.get("user_phone") or not data.get("tenant_id"):
+        return None
+    return conversation_routing_key(str(data["user_phone"]), str(data["tenant_id"]))
+
+
+def _forward_headers(headers: Iterable) -> dict:
+    forwarded = {}
+    for name, value in headers:
+        name = name.decode("latin-1") if isinstance(name, bytes) else name
+        value = value.decode("latin-1") if isinstance(value, bytes) else value
+        if name.lower() not in HOP_BY_HOP_HEADERS:
+            forwarded[name] = value
+    forwarded[FORWARDED_HEADER] = "1"
+    return forwarded
+
+
+def _to_response(upstream: httpx.Response) -> Response:
+    headers = {name: value for name, value in upstream.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS}
+    return Response(content=upstream.content, status_code=upstream.status_code, headers=headers)
+
+
+async def forward_request(client: httpx.AsyncClient, nodes: List[str], method: str, path: str, query: str, headers: dict, body: bytes) -> Optional[httpx.Response]:
+    """Envia a requisição ao primeiro nó que responder, na ordem de preferência do anel."""
+    url_path = f"{path}?{query}" if query else path
+    for node in nodes:
+        try:
+            return await client.request(method, f"{node}{url_path}", headers=headers, content=body)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            logger.warning(f"Nó {node} indisponível para {path}: {e}. Tentando o próximo do anel.")
+    return None
+
+
+class StickyRoutingMiddleware:
+    """
+    Middleware ASGI que encaminha o /ai ao nó dono da conversa no anel de hash consistente,
+    para que as mensagens de um usuário caiam sempre na mesma réplica e encontrem os caches
+    em processo (tenant, estado da conversa, memória) já aquecidos. Se este nó é o dono,
+    a requisição segue localmente. Se o dono estiver fora do ar, também.
+    """
+
+    def __init__(self, app, ring: ConsistentHashRing, self_node: str, paths=STICKY_ROUTING_PATHS, client: Optional[httpx.AsyncClient] = None):
+        self.app = app
+        self.ring = ring
+        self.self_node = self_node.rstrip("/")
+        self.paths = set(paths)
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=STICKY_ROUTING_TIMEOUT_SECONDS)
+        return self._client
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        if any(name == FORWARDED_HEADER.encode() for name, _ in scope["headers"]):
+            return await self.app(scope, receive, send)
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        key = routing_key_from_body(body)
+        owner = self.ring.get_node(key) if key else None
+        if owner and owner != self.self_node:
+            upstream = await forward_request(
+                self.client, [owner], scope["method"], scope["path"],
+                scope.get("query_string", b"").decode("latin-1"), _forward_headers(scope["headers"]), body
+            )
+            if upstream is not None:
+                return await _to_response(upstream)(scope, receive, send)
+            logger.warning(f"Dono da conversa ({owner}) indisponível. Processando localmente.")
+
+        # O corpo já foi consumido; é entregue de novo à aplicação.
+        body_sent = False
+
+        async def replay():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, replay, send)
+
+
+def create_front_app(ring: ConsistentHashRing, client: Optional[httpx.AsyncClient] = None) -> Starlette:
+    """
+    Processo de entrada independente: recebe todo o tráfego e encaminha o /ai ao dono da
+    conversa (com failover para o próximo nó do anel). As demais rotas vão para o primeiro
+    nó disponível.
+    """
+    http_client = client or httpx.AsyncClient(timeout=STICKY_ROUTING_TIMEOUT_SECONDS)
+
+    async def proxy(request: Request) -> Response:
+        body = await request.body()
+        key = routing_key_from_body(body) if request.url.path in STICKY_ROUTING_PATHS else None
+        nodes = ring.get_nodes(key, len(ring)) if key else ring.nodes
+        upstream = await forward_request(
+            http_client, nodes, request.method, request.url.path, request.url.query, _forward_headers(request.headers.raw), body
+        )
+        if upstream is None:
+            return Response(content="Nenhum nó disponível.", status_code=503)
+        return _to_response(upstream)
+
+    async def ring_status(request: Request) -> Response:
+        return Response(content=json.dumps({"nodes": ring.nodes}), media_type="application/json")
+
+    async def shutdown():
+        await http_client.aclose()
+
+    methods = ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"]
+    return Starlette(
+        routes=[
+            Route("/_ring", ring_status, methods=["GET"]),
+            Route("/{path:path}", proxy, methods=methods),
+        ],
+        on_shutdown=[shutdown],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Processo de entrada com roteamento por conversa (hash consistente).")
+    parser.add_argument("--nodes", default=",".join(STICKY_ROUTING_NODES), help="URLs base dos nós, separadas por vírgula.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    nodes = [node.strip().rstrip("/") for node in args.nodes.split(",") if node.strip()]
+    if not nodes:
+        parser.error("Informe ao menos um nó em --nodes ou em STICKY_ROUTING_NODES.")
+    logger.info(f"Roteador iniciado com os nós: {nodes}")
+    uvicorn.run(create_front_app(ConsistentHashRing(nodes)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import os
+import time
+import logging
+import threading
+import unicodedata
+from dataclasses import dataclass, asdict
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+
+from core import models
+from core.invalidation_bus import ENTITY_CATALOG, ENTITY_TENANT, InvalidationEvent, register_handler
+from core.unit_of_work import run_sync
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre as conferências de catalog_version no banco. As alterações do catálogo
+# invalidam o snapshot pelo barramento (core/invalidation_bus.py); a conferência cobre um
+# evento perdido ou um worker com o barramento desligado.
+CATALOG_CACHE_REVALIDATE_SECONDS = float(os.getenv("CATALOG_CACHE_REVALIDATE_SECONDS", "5"))
+
+
+def normalize_name(text: Optional[str]) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados: "  X-Búrguer " -> "x-burguer"."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(without_accents.lower().split())
+
+
+@dataclass(frozen=True)
+class OpcionalSnapshot:
+    id: int
+    nome: str
+    tipo: str
+    preco: float
+
+    @classmethod
+    def from_model(cls, opcional) -> "OpcionalSnapshot":
+        return cls(
+            id=opcional.id_opcional,
+            nome=opcional.nome_opcional,
+            tipo=opcional.tipo_opcional,
+            preco=float(opcional.preco_adicional or 0.0),
+        )
+
+
+@dataclass(frozen=True)
+class PromocaoSnapshot:
+    id: int
+    nome: str
+    descricao_para_ia: Optional[str]
+    condicao_json: Optional[Dict[str, Any]]
+    acao_json: Optional[Dict[str, Any]]
+    is_ativa: bool
+
+    @classmethod
+    def from_model(cls, promocao) -> "PromocaoSnapshot":
+        return cls(
+            id=promocao.id_promocao,
+            nome=promocao.nome_promocao,
+            descricao_para_ia=promocao.descricao_para_ia,
+            condicao_json=promocao.condicao_json,
+            acao_json=promocao.acao_json,
+            is_ativa=bool(promocao.is_ativa),
+        )
+
+
+@dataclass(frozen=True)
+class ProductSnapshot:
+    id: int
+    nome: str
+    descricao: Optional[str]
+    categoria: Optional[str]
+    preco_base: float
+    tempo_preparo_min: Optional[int]
+    disponivel_hoje: Optional[str]
+    opcionais: Tuple[OpcionalSnapshot, ...]
+    promocoes: Tuple[PromocaoSnapshot, ...]
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """
+    Cópia imutável do catálogo de um tenant (produtos com opcionais e promoções) usada no
+    caminho do /ai, indexada por id, nome normalizado e categoria normalizada.
+    """
+    tenant_id: str
+    version: Optional[int]  # None se o tenant não existe
+    products: Mapping[int, ProductSnapshot]
+    opcionais: Mapping[int, OpcionalSnapshot]
+    promocoes: Mapping[int, PromocaoSnapshot]
+    products_by_name: Mapping[str, ProductSnapshot]
+    products_by_category: Mapping[str, Tuple[ProductSnapshot, ...]]
+
+    @classmethod
+    def build(cls, tenant_id: str, version: Optional[int], products: List[ProductSnapshot], opcionais: List[OpcionalSnapshot], promocoes: List[PromocaoSnapshot]) -> "CatalogSnapshot":
+        by_name: Dict[str, ProductSnapshot] = {}
+        by_category: Dict[str, List[ProductSnapshot]] = {}
+        for product in products:
+            # Nomes que só diferem pelo acento colidem: vale o produto mais antigo.
+            by_name.setdefault(normalize_name(product.nome), product)
+            by_category.setdefault(normalize_name(product.categoria), []).append(product)
+        return cls(
+            tenant_id=tenant_id,
+            version=version,
+            products=MappingProxyType({product.id: product for product in products}),
+            opcionais=MappingProxyType({opcional.id: opcional for opcional in opcionais}),
+            promocoes=MappingProxyType({promocao.id: promocao for promocao in promocoes}),
+            products_by_name=MappingProxyType(by_name),
+            products_by_category=MappingProxyType({category: tuple(items) for category, items in by_category.items()}),
+        )
+
+    def product(self, product_id: int) -> Optional[ProductSnapshot]:
+        return self.products.get(product_id)
+
+    def product_by_name(self, name: str) -> Optional[ProductSnapshot]:
+        return self.products_by_name.get(normalize_name(name))
+
+    def products_in_category(self, category: str) -> Tuple[ProductSnapshot, ...]:
+        return self.products_by_category.get(normalize_name(category), ())
+
+    def active_promotions(self) -> List[PromocaoSnapshot]:
+        return [promocao for promocao in self.promocoes.values() if promocao.is_ativa]
+
+    def search(self, term: Optional[str] = None, category: Optional[str] = None) -> List[ProductSnapshot]:
+        """Produtos cujo nome ou descrição contém o termo (sem diferenciar acentos), opcionalmente de uma categoria."""
+        products = self.products_in_category(category) if category else tuple(self.products.values())
+        term = normalize_name(term)
+        if not term:
+            return list(products)
+        return [
+            product for product in products
+            if term in normalize_name(product.nome) or term in normalize_name(product.descricao)
+        ]
+
+
+def load_catalog_snapshot(db: Session, tenant_id: str) -> CatalogSnapshot:
+    """
+    Monta o snapshot do catálogo com selectinload (uma query por coleção, sem o produto
+    cartesiano do joinedload de duas coleções). A versão é lida antes das linhas: se uma
+    alteração entrar no meio, o snapshot fica com a versão antiga e é refeito na próxima conferência.
+    """
+    from crud import tenant_crud
+
+    version = tenant_crud.get_catalog_version(db, tenant_id)
+    products = db.execute(
+        select(models.Product)
+        .where(models.Product.tenant_id == tenant_id)
+        .options(selectinload(models.Product.opcionais), selectinload(models.Product.promocoes))
+        .order_by(models.Product.id_produto)
+    ).scalars().all()
+    opcionais = db.execute(
+        select(models.Opcional).where(models.Opcional.tenant_id == tenant_id).order_by(models.Opcional.id_opcional)
+    ).scalars().all()
+    promocoes = db.execute(
+        select(models.Promocao).where(models.Promocao.tenant_id == tenant_id).order_by(models.Promocao.id_promocao)
+    ).scalars().all()
+
+    opcional_snapshots = {opcional.id_opcional: OpcionalSnapshot.from_model(opcional) for opcional in opcionais}
+    promocao_snapshots = {promocao.id_promocao: PromocaoSnapshot.from_model(promocao) for promocao in promocoes}
+    product_snapshots = [
+        ProductSnapshot(
+            id=product.id_produto,
+            nome=product.nome_produto,
+            descricao=product.descricao_produto,
+            categoria=product.categoria_produto,
+            preco_base=float(product.preco_base or 0.0),
+            tempo_preparo_min=product.tempo_preparo_min,
+            disponivel_hoje=product.disponivel_hoje,
+            opcionais=tuple(opcional_snapshots.get(opcional.id_opcional) or OpcionalSnapshot.from_model(opcional) for opcional in product.opcionais),
+            promocoes=tuple(promocao_snapshots.get(promocao.id_promocao) or PromocaoSnapshot.from_model(promocao) for promocao in product.promocoes),
+        )
+        for product in products
+    ]
+    logger.debug(f"CatalogCache: snapshot do tenant '{tenant_id}' montado (versão {version}, {len(product_snapshots)} produto(s)).")
+    return CatalogSnapshot.build(tenant_id, version, product_snapshots, list(opcional_snapshots.values()), list(promocao_snapshots.values()))
+
+
+class CatalogCache:
+    """
+    Cache em processo de CatalogSnapshot por tenant. Cada snapshot é conferido contra
+    tenants.catalog_version a cada revalidate_seconds (uma leitura pela chave) e só é
+    remontado quando a versão mudou. A troca é atômica: os leitores ficam com o snapshot
+    antigo até o novo estar pronto.
+    """
+
+    def __init__(self, revalidate_seconds: float = CATALOG_CACHE_REVALIDATE_SECONDS):
+        self.revalidate_seconds = revalidate_seconds
+        self._entries: Dict[str, Tuple[float, CatalogSnapshot]] = {}
+        # Incrementada a cada invalidação: um snapshot montado antes dela não é guardado.
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.rebuilds = 0
+
+    def peek(self, tenant_id: str) -> Tuple[Optional[CatalogSnapshot], bool, int]:
+        """Retorna (snapshot, dentro_do_intervalo, geração) sem ir ao banco."""
+        with self._lock:
+            generation = self._generations.get(tenant_id, 0)
+            entry = self._entries.get(tenant_id)
+            if entry is None:
+                self.misses += 1
+                return None, False, generation
+            if entry[0] <= time.monotonic():
+                return entry[1], False, generation
+            self.hits += 1
+            return entry[1], True, generation
+
+    def put(self, tenant_id: str, snapshot: CatalogSnapshot, generation: int):
+        with self._lock:
+            if self._generations.get(tenant_id, 0) != generation:
+                return
+            self._entries[tenant_id] = (time.monotonic() + self.revalidate_seconds, snapshot)
+
+    def invalidate(self, tenant_id: str, version: Optional[int] = None):
+        """Remove o snapshot do tenant; com version, só se o snapshot em cache for mais antigo."""
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if version is not None and entry is not None and entry[1].version is not None and entry[1].version >= version:
+                return
+            self._entries.pop(tenant_id, None)
+            self._generations[tenant_id] = self._generations.get(tenant_id, 0) + 1
+        logger.debug(f"CatalogCache: catálogo do tenant '{tenant_id}' invalidado.")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            tenants = len(self._entries)
+        return {"tenants": tenants, "hits": self.hits, "misses": self.misses, "revalidations": self.revalidations, "rebuilds": self.rebuilds}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
+catalog_cache = CatalogCache()
+
+
+async def get_catalog_snapshot(tenant_id: str, db: Optional[AsyncSession] = None) -> CatalogSnapshot:
+    """
+    Retorna o snapshot do catálogo do tenant, indo ao banco só para conferir a versão ou
+    remontar o snapshot. Se nenhuma sessão for informada, usa a da unidade de trabalho da
+    requisição (ou uma sessão curta).
+    """
+    snapshot, fresh, generation = catalog_cache.peek(tenant_id)
+    if fresh:
+        return snapshot
+
+    from crud import tenant_crud
+
+    execute = db.run_sync if db is not None else run_sync
+    if snapshot is not None:
+        catalog_cache.revalidations += 1
+        version = await execute(tenant_crud.get_catalog_version, tenant_id)
+        if version == snapshot.version:
+            catalog_cache.put(tenant_id, snapshot, generation)
+            return snapshot
+
+    catalog_cache.rebuilds += 1
+    snapshot = await execute(load_catalog_snapshot, tenant_id)
+    catalog_cache.put(tenant_id, snapshot, generation)
+    return snapshot
+
+
+def invalidate_catalog(tenant_id: str):
+    catalog_cache.invalidate(tenant_id)
+
+
+def _on_catalog_changed(invalidation: InvalidationEvent):
+    catalog_cache.invalidate(invalidation.tenant_id, invalidation.version)
+
+
+register_handler(ENTITY_CATALOG, _on_catalog_changed)
+register_handler(ENTITY_TENANT, _on_catalog_changed)
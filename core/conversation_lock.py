@@ -0,0 +1,156 @@
+import os
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from core.database import DATABASE_URL, DB_POOL_RECYCLE, async_connect_args, get_async_database_url
+from core.conversation_state import CONVERSATION_STATE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+# O lock entre workers só faz sentido quando o estado das conversas é compartilhado.
+CONVERSATION_LOCK_DISTRIBUTED = os.getenv(
+    "CONVERSATION_LOCK_DISTRIBUTED",
+    "true" if CONVERSATION_STATE_BACKEND != "memory" and DATABASE_URL.startswith("postgres") else "false",
+).lower() in ("1", "true", "yes")
+CONVERSATION_LOCK_TIMEOUT_SECONDS = float(os.getenv("CONVERSATION_LOCK_TIMEOUT_SECONDS", "60"))
+# Pool próprio das conexões que seguram os advisory locks, separado do pool das requisições:
+# cada turno já prende uma conexão do async_engine e não pode esperar por uma segunda dele.
+CONVERSATION_LOCK_POOL_SIZE = int(os.getenv("CONVERSATION_LOCK_POOL_SIZE", "5"))
+CONVERSATION_LOCK_MAX_OVERFLOW = int(os.getenv("CONVERSATION_LOCK_MAX_OVERFLOW", "5"))
+
+# SQLSTATE do lock_timeout (lock_not_available)
+_LOCK_NOT_AVAILABLE = "55P03"
+
+
+class ConversationLockError(Exception):
+    """Não foi possível obter o lock distribuído da conversa; o turno não deve seguir."""
+
+    status_code = 503
+
+
+class ConversationBusyError(ConversationLockError):
+    """Outro worker está processando um turno da mesma conversa além do lock_timeout."""
+
+    status_code = 409
+
+
+def create_lock_engine() -> AsyncEngine:
+    return create_async_engine(
+        get_async_database_url(DATABASE_URL),
+        connect_args=async_connect_args,
+        pool_size=CONVERSATION_LOCK_POOL_SIZE,
+        max_overflow=CONVERSATION_LOCK_MAX_OVERFLOW,
+        pool_timeout=CONVERSATION_LOCK_TIMEOUT_SECONDS,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def advisory_lock_key(session_id: str) -> int:
+    """Chave bigint estável (entre processos) para o pg_advisory_xact_lock."""
+    digest = hashlib.blake2b(session_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class _LocalLock:
+    __slots__ = ("lock", "waiters")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiters = 0
+
+
+class ConversationLockManager:
+    """
+    Serializa os turnos de uma mesma conversa (composite_session_id), mantendo conversas
+    diferentes em paralelo.
+
+    Dentro do processo, um asyncio.Lock por conversa (criado sob demanda e descartado quando
+    ninguém mais o usa). Entre workers, com distributed=True, o dono do lock local ainda pega
+    um pg_advisory_xact_lock em uma transação aberta durante o turno. Por ser de transação,
+    o lock funciona atrás do PgBouncer em modo transaction e é liberado mesmo se o processo cair.
+    Só um turno por conversa e por processo chega a esperar no Postgres. As conexões do
+    lock vêm de uma engine dedicada (criada no primeiro uso), nunca do pool das requisições.
+
+    Se o lock não sair dentro do timeout, lock() levanta ConversationBusyError (409); se não
+    houver conexão para o lock, ConversationLockError (503). O turno nunca segue sem o lock.
+    """
+
+    def __init__(
+        self,
+        distributed: bool = CONVERSATION_LOCK_DISTRIBUTED,
+        timeout: float = CONVERSATION_LOCK_TIMEOUT_SECONDS,
+        engine: Optional[AsyncEngine] = None,
+    ):
+        self.distributed = distributed
+        self.timeout = timeout
+        self._engine = engine
+        self._locks: Dict[str, _LocalLock] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._engine = create_lock_engine()
+        return self._engine
+
+    @asynccontextmanager
+    async def lock(self, session_id: str):
+        local = self._locks.get(session_id)
+        if local is None:
+            local = self._locks[session_id] = _LocalLock()
+        local.waiters += 1
+        try:
+            async with local.lock:
+                if self.distributed:
+                    async with self._advisory_lock(session_id):
+                        yield
+                else:
+                    yield
+        finally:
+            local.waiters -= 1
+            if local.waiters == 0:
+                self._locks.pop(session_id, None)
+
+    @asynccontextmanager
+    async def _advisory_lock(self, session_id: str):
+        try:
+            conn = await self.engine.connect()
+        except PoolTimeoutError as e:
+            raise ConversationLockError(f"Sem conexão disponível para o lock da conversa '{session_id}'.") from e
+        try:
+            transaction = await conn.begin()
+            try:
+                # SET LOCAL não aceita parâmetro; o valor é um inteiro calculado aqui.
+                await conn.execute(text(f"SET LOCAL lock_timeout = {int(self.timeout * 1000)}"))
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": advisory_lock_key(session_id)})
+            except DBAPIError as e:
+                sqlstate = getattr(e.orig, "sqlstate", None) or getattr(e.orig, "pgcode", None)
+                if sqlstate == _LOCK_NOT_AVAILABLE:
+                    logger.warning(f"Lock da conversa '{session_id}' não obtido em {self.timeout}s: outro turno em andamento.")
+                    raise ConversationBusyError(f"Outra mensagem da conversa '{session_id}' ainda está sendo processada.") from e
+                raise ConversationLockError(f"Não foi possível obter o lock da conversa '{session_id}': {e}") from e
+            try:
+                yield
+            finally:
+                # Nada é escrito nesta transação; encerrá-la libera o lock.
+                await transaction.rollback()
+        finally:
+            await conn.close()
+
+    async def close(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+
+conversation_locks = ConversationLockManager()
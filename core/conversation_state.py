@@ -0,0 +1,429 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, or_, select
+
+from core.database import AsyncSessionLocal
+from core.unit_of_work import unit_of_work_session
+from core.models import ConversationState
+from core import schemas
+from core.schemas import OrderItem, OrderState
+
+logger = logging.getLogger(__name__)
+
+# memory (padrão, um processo), postgres ou redis (vários workers/nós)
+CONVERSATION_STATE_BACKEND = os.getenv("CONVERSATION_STATE_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+ORDER_STATE_TTL_SECONDS = float(os.getenv("ORDER_STATE_TTL_SECONDS", "86400"))
+# A última interação só é usada para saber se é a primeira mensagem do dia.
+LAST_INTERACTION_TTL_SECONDS = float(os.getenv("LAST_INTERACTION_TTL_SECONDS", "172800"))
+# Limites do armazenamento em memória
+STATE_MEMORY_MAX_ENTRIES = int(os.getenv("STATE_MEMORY_MAX_ENTRIES", "20000"))
+STATE_MEMORY_IDLE_TTL_SECONDS = float(os.getenv("STATE_MEMORY_IDLE_TTL_SECONDS", "86400"))
+# Intervalo do sweeper em memória e da limpeza das linhas expiradas no postgres
+STATE_SWEEP_INTERVAL_SECONDS = float(os.getenv("STATE_SWEEP_INTERVAL_SECONDS", "300"))
+# Carrinho em aberto sem atividade por esse tempo é arquivado em abandoned_carts.
+ABANDONED_CART_HOURS = float(os.getenv("ABANDONED_CART_HOURS", "6"))
+# Custo aproximado do dict/OrderedDict e do objeto de cada entrada, além da chave e do valor.
+MEMORY_ENTRY_OVERHEAD_BYTES = 200
+
+ORDER_STATE_PREFIX = "order:"
+LAST_INTERACTION_PREFIX = "last:"
+
+
+def serialize_order_state(state: OrderState) -> bytes:
+    """
+    Forma compacta do OrderState: chaves curtas, itens como pares [nome, quantidade]
+    e campos com valor padrão omitidos. Um carrinho vazio vira b"{}".
+    """
+    data = {}
+    if state.items:
+        data["i"] = [[item.product_name, item.quantity] for item in state.items]
+    if state.address:
+        data["a"] = state.address
+    if state.status != "open":
+        data["s"] = state.status
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def deserialize_order_state(raw: bytes) -> OrderState:
+    data = json.loads(raw)
+    return OrderState(
+        items=[OrderItem(product_name=name, quantity=quantity) for name, quantity in data.get("i", [])],
+        address=data.get("a"),
+        status=data.get("s", "open"),
+    )
+
+
+class ConversationStateStore(ABC):
+    """
+    Armazenamento chave/valor com TTL por chave para o estado das conversas
+    (carrinho e última interação), indexado pelo composite_session_id.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    def start(self):
+        """Inicia tarefas de manutenção em segundo plano, se houver."""
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+    async def get_order_state(self, session_id: str) -> OrderState:
+        raw = await self.get(ORDER_STATE_PREFIX + session_id)
+        return deserialize_order_state(raw) if raw else OrderState()
+
+    async def save_order_state(self, session_id: str, state: OrderState, ttl: float = ORDER_STATE_TTL_SECONDS):
+        await self.set(ORDER_STATE_PREFIX + session_id, serialize_order_state(state), ttl)
+
+    async def delete_order_state(self, session_id: str):
+        await self.delete(ORDER_STATE_PREFIX + session_id)
+
+    async def get_last_interaction(self, session_id: str) -> Optional[datetime]:
+        raw = await self.get(LAST_INTERACTION_PREFIX + session_id)
+        return datetime.fromisoformat(raw.decode("utf-8")) if raw else None
+
+    async def save_last_interaction(self, session_id: str, when: datetime, ttl: float = LAST_INTERACTION_TTL_SECONDS):
+        await self.set(LAST_INTERACTION_PREFIX + session_id, when.isoformat().encode("utf-8"), ttl)
+
+
+class _MemoryEntry:
+    __slots__ = ("value", "expires_at", "last_access", "last_activity_at", "size")
+
+    def __init__(self, key: str, value: bytes, expires_at: Optional[float]):
+        self.value = value
+        self.expires_at = expires_at
+        self.last_access = time.monotonic()
+        self.last_activity_at = datetime.now(timezone.utc)
+        self.size = sys.getsizeof(key) + sys.getsizeof(value) + MEMORY_ENTRY_OVERHEAD_BYTES
+
+
+async def archive_abandoned_cart(session_id: str, state: OrderState, last_activity_at: datetime):
+    """Grava no banco um carrinho em aberto que saiu da memória sem ter sido finalizado."""
+    from crud import abandoned_cart_crud
+
+    # composite_session_id = f"{user_id}_{tenant_id}"; o telefone não contém "_"
+    user_phone, _, tenant_id = session_id.partition("_")
+    cart = schemas.AbandonedCartCreate(
+        user_phone=user_phone,
+        tenant_id=tenant_id,
+        items=[item.model_dump() for item in state.items],
+        address=state.address,
+        status=state.status,
+        last_activity_at=last_activity_at,
+    )
+    async with AsyncSessionLocal() as db:
+        await abandoned_cart_crud.create_abandoned_cart_async(db, cart)
+
+
+class InMemoryStateStore(ConversationStateStore):
+    """
+    Implementação em processo, limitada: no máximo max_entries chaves (as menos usadas
+    saem primeiro), expiração por TTL da chave e por inatividade (idle_ttl), e um sweeper
+    periódico. Carrinhos em aberto que saem da memória são arquivados no banco em vez de
+    descartados, em segundo plano: get()/set() não esperam pelo INSERT do arquivamento.
+    O estado não é compartilhado entre workers nem sobrevive a reinícios.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = STATE_MEMORY_MAX_ENTRIES,
+        idle_ttl: float = STATE_MEMORY_IDLE_TTL_SECONDS,
+        abandoned_cart_seconds: float = ABANDONED_CART_HOURS * 3600,
+        archiver: Optional[Callable[[str, OrderState, datetime], Awaitable[None]]] = archive_abandoned_cart,
+    ):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.abandoned_cart_seconds = abandoned_cart_seconds
+        self.archiver = archiver
+        self._entries: "OrderedDict[str, _MemoryEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._estimated_bytes = 0
+        self._sweeper: Optional[asyncio.Task] = None
+        self._archive_tasks: "set[asyncio.Task]" = set()
+        self.evictions = 0
+        self.archived = 0
+
+    def _remove(self, key: str) -> _MemoryEntry:
+        entry = self._entries.pop(key)
+        self._estimated_bytes -= entry.size
+        return entry
+
+    def _is_stale(self, entry: _MemoryEntry, now: float) -> bool:
+        expired = entry.expires_at is not None and entry.expires_at <= now
+        return expired or entry.last_access + self.idle_ttl <= now
+
+    def _is_abandoned(self, key: str, entry: _MemoryEntry, now: float) -> bool:
+        return key.startswith(ORDER_STATE_PREFIX) and entry.last_access + self.abandoned_cart_seconds <= now
+
+    async def _archive(self, evicted: List[Tuple[str, _MemoryEntry]]):
+        """Arquiva os carrinhos em aberto e com itens entre as entradas removidas."""
+        if self.archiver is None:
+            return
+        for key, entry in evicted:
+            if not key.startswith(ORDER_STATE_PREFIX):
+                continue
+            state = deserialize_order_state(entry.value)
+            if not state.items or state.status != "open":
+                continue
+            try:
+                await self.archiver(key[len(ORDER_STATE_PREFIX):], state, entry.last_activity_at)
+                self.archived += 1
+            except Exception as e:
+                logger.error(f"Erro ao arquivar o carrinho abandonado '{key}': {e}", exc_info=True)
+
+    def _archive_in_background(self, evicted: List[Tuple[str, _MemoryEntry]]):
+        """Arquiva as entradas removidas no caminho da requisição sem bloqueá-la."""
+        if not evicted or self.archiver is None:
+            return
+        task = asyncio.create_task(self._archive(evicted))
+        self._archive_tasks.add(task)
+        task.add_done_callback(self._archive_tasks.discard)
+
+    async def wait_archived(self):
+        """Aguarda os arquivamentos em segundo plano ainda pendentes."""
+        while self._archive_tasks:
+            await asyncio.gather(*self._archive_tasks, return_exceptions=True)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        evicted = []
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_stale(entry, now):
+                evicted.append((key, self._remove(key)))
+                self.evictions += 1
+                entry = None
+            if entry is not None:
+                entry.last_access = now
+                self._entries.move_to_end(key)
+        self._archive_in_background(evicted)
+        return entry.value if entry is not None else None
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        evicted = []
+        entry = _MemoryEntry(key, value, time.monotonic() + ttl if ttl else None)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._estimated_bytes += entry.size
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                evicted.append((oldest, self._remove(oldest)))
+                self.evictions += 1
+        self._archive_in_background(evicted)
+
+    async def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    async def sweep(self) -> int:
+        """Remove as entradas expiradas, inativas ou abandonadas. Retorna quantas saíram."""
+        now = time.monotonic()
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if self._is_stale(entry, now) or self._is_abandoned(key, entry, now)
+            ]
+            evicted = [(key, self._remove(key)) for key in stale]
+            self.evictions += len(evicted)
+        await self._archive(evicted)
+        if evicted:
+            logger.info(f"InMemoryStateStore: {len(evicted)} entrada(s) removida(s) pelo sweeper. {self.stats()}")
+        return len(evicted)
+
+    async def _sweep_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Erro no sweeper do estado das conversas: {e}", exc_info=True)
+
+    def start(self, sweep_interval: float = STATE_SWEEP_INTERVAL_SECONDS):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever(sweep_interval))
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        await self.wait_archived()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "estimated_bytes": self._estimated_bytes,
+                "evictions": self.evictions,
+                "archived_carts": self.archived,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._estimated_bytes = 0
+
+
+class PostgresStateStore(ConversationStateStore):
+    """
+    Implementação na tabela conversation_states. Linhas expiradas são ignoradas na leitura e
+    apagadas por purge_expired(), que start() executa periodicamente em segundo plano.
+    Por padrão usa a sessão da unidade de trabalho da requisição, sem abrir conexão própria.
+    """
+
+    def __init__(self, session_factory=unit_of_work_session):
+        self.session_factory = session_factory
+        self._purger: Optional[asyncio.Task] = None
+        self.purged = 0
+
+    @staticmethod
+    def _now() -> datetime:
+        return datetime.now(timezone.utc)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(ConversationState.value).where(
+                    ConversationState.key == key,
+                    or_(ConversationState.expires_at.is_(None), ConversationState.expires_at > self._now()),
+                )
+            )
+            return result.scalar_one_or_none()
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        expires_at = self._now() + timedelta(seconds=ttl) if ttl else None
+        async with self.session_factory() as session:
+            if session.bind.dialect.name == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(ConversationState).values(key=key, value=value, expires_at=expires_at)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ConversationState.key],
+                set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at, "updated_at": self._now()},
+            )
+            await session.execute(stmt)
+            await session.commit()
+
+    async def delete(self, key: str):
+        async with self.session_factory() as session:
+            await session.execute(delete(ConversationState).where(ConversationState.key == key))
+            await session.commit()
+
+    async def purge_expired(self) -> int:
+        async with self.session_factory() as session:
+            result = await session.execute(
+                delete(ConversationState).where(ConversationState.expires_at <= self._now())
+            )
+            await session.commit()
+            return result.rowcount or 0
+
+    async def _purge_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                purged = await self.purge_expired()
+            except Exception as e:
+                logger.error(f"Erro ao apagar os estados de conversa expirados: {e}", exc_info=True)
+                continue
+            self.purged += purged
+            if purged:
+                logger.info(f"PostgresStateStore: {purged} estado(s) expirado(s) apagado(s).")
+
+    def start(self, purge_interval: float = STATE_SWEEP_INTERVAL_SECONDS):
+        if self._purger is None:
+            self._purger = asyncio.create_task(self._purge_forever(purge_interval))
+
+    async def close(self):
+        if self._purger is not None:
+            self._purger.cancel()
+            await asyncio.gather(self._purger, return_exceptions=True)
+            self._purger = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"purged": self.purged}
+
+
+class RedisStateStore(ConversationStateStore):
+    """
+    Implementação para qualquer servidor que fale o protocolo do Redis (Redis, Valkey,
+    KeyDB...). O TTL usa o próprio PX do servidor. O cliente pode ser injetado, o que
+    permite testar com um substituto local (ex.: fakeredis).
+    """
+
+    def __init__(self, url: str = REDIS_URL, client=None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        await self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, key: str):
+        await self.client.delete(key)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+_store: Optional[ConversationStateStore] = None
+_lock = threading.Lock()
+
+
+def create_conversation_state_store(backend: str = CONVERSATION_STATE_BACKEND) -> ConversationStateStore:
+    if backend == "postgres":
+        return PostgresStateStore()
+    if backend == "redis":
+        return RedisStateStore()
+    if backend != "memory":
+        logger.warning(f"CONVERSATION_STATE_BACKEND '{backend}' desconhecido. Usando o armazenamento em memória.")
+    return InMemoryStateStore()
+
+
+async def close_conversation_state_store():
+    global _store
+    with _lock:
+        store, _store = _store, None
+    if store is not None:
+        await store.close()
+
+
+def get_conversation_state_store() -> ConversationStateStore:
+    """Retorna o armazenamento de estado das conversas compartilhado pelo processo."""
+    global _store
+    with _lock:
+        if _store is None:
+            _store = create_conversation_state_store()
+            logger.info(f"Estado das conversas armazenado em: {type(_store).__name__}.")
+        return _store
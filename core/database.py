@@ -1,36 +1,99 @@
-
 import logging
 import os
+from uuid import uuid4
 from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 from sqlalchemy.pool import NullPool
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
     raise ValueError("A variável de ambiente DATABASE_URL não está definida no arquivo .env")
 
+# Configuração do pool de conexões. DB_POOL_SIZE=0 desativa o pool (NullPool).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Ao usar o pooler do Supabase (PgBouncer em modo transaction), "prepared statements"
+# não são suportados e precisam ser desativados no driver.
+DB_PGBOUNCER_MODE = os.getenv("DB_PGBOUNCER_MODE", "true").lower() in ("1", "true", "yes")
+
+def _pool_kwargs() -> dict:
+    if DB_POOL_SIZE <= 0:
+        return {"poolclass": NullPool}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+def get_async_database_url(url: str) -> str:
+    """Converte a DATABASE_URL síncrona para o driver assíncrono equivalente."""
+    if url.startswith("sqlite"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    for prefix in ("postgresql+psycopg2://", "postgresql+psycopg://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
 connect_args = {}
+async_connect_args = {}
 # Se estiver usando SQLite, precisa permitir que a conexão seja usada em múltiplos threads.
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
+elif DATABASE_URL.startswith("postgresql") and DB_PGBOUNCER_MODE:
+    connect_args = {"prepare_threshold": None}
+    async_connect_args = {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        # Nomes únicos evitam colisão de statements entre clientes que compartilham o backend do PgBouncer.
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
 
-# Para PostgreSQL, ao usar o pooler do Supabase (PgBouncer),
-# é necessário desativar o pooling do SQLAlchemy (poolclass=NullPool)
-# e desativar "prepared statements" (prepare_threshold: None), que não são suportados.
-if DATABASE_URL.startswith("postgresql"):
-    engine = create_engine(
-        DATABASE_URL,
-        poolclass=NullPool,
-        connect_args={"prepare_threshold": None}
-    )
+if DATABASE_URL.startswith("sqlite"):
+    # O SQLite não se beneficia de pool e não suporta pool_size/max_overflow.
+    engine = create_engine(DATABASE_URL, poolclass=NullPool, connect_args=connect_args)
+    async_engine = create_async_engine(get_async_database_url(DATABASE_URL), poolclass=NullPool, connect_args=connect_args)
 else:
-    engine = create_engine(
-        DATABASE_URL,
-        poolclass=NullPool,
-        connect_args=connect_args
-    )
+    engine = create_engine(DATABASE_URL, connect_args=connect_args, **_pool_kwargs())
+    async_engine = create_async_engine(get_async_database_url(DATABASE_URL), connect_args=async_connect_args, **_pool_kwargs())
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+class PinnedSession(Session):
+    """
+    Sessão que pega a conexão do pool só na primeira consulta e a mantém até close():
+    os commits intermediários não devolvem a conexão nem abrem outra, e uma requisição
+    que não consulta o banco não ocupa conexão nenhuma.
+    """
+
+    _pinned_connection = None
+
+    def get_bind(self, mapper=None, **kwargs):
+        if self._pinned_connection is None:
+            self._pinned_connection = super().get_bind(mapper, **kwargs).connect()
+        return self._pinned_connection
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self._pinned_connection is not None:
+                self._pinned_connection.close()
+                self._pinned_connection = None
+
+
+PinnedAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, sync_session_class=PinnedSession, autoflush=False, expire_on_commit=False
+)
 
 Base = declarative_base()
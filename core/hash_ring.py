@@ -0,0 +1,82 @@
+import bisect
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Pontos por nó no anel. Mais pontos = distribuição mais uniforme entre os nós.
+DEFAULT_VIRTUAL_NODES = 160
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def conversation_routing_key(user_phone: str, tenant_id: str) -> str:
+    """Mesma chave da conversa usada no resto do sistema (composite_session_id)."""
+    return f"{user_phone}_{tenant_id}"
+
+
+class ConsistentHashRing:
+    """
+    Anel de hash consistente com nós virtuais. Ao adicionar ou remover um nó, só as chaves
+    que caem nos trechos desse nó mudam de dono (~1/N das chaves), em vez de quase todas
+    como aconteceria com hash(chave) % N.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), virtual_nodes: int = DEFAULT_VIRTUAL_NODES):
+        self.virtual_nodes = virtual_nodes
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self._nodes: Dict[str, None] = {}
+        self._lock = threading.Lock()
+        self.set_nodes(nodes)
+
+    @property
+    def nodes(self) -> List[str]:
+        return list(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def _rebuild(self):
+        ring: List[Tuple[int, str]] = sorted(
+            (_hash(f"{node}#{i}"), node) for node in self._nodes for i in range(self.virtual_nodes)
+        )
+        self._points = [point for point, _ in ring]
+        self._owners = [node for _, node in ring]
+
+    def set_nodes(self, nodes: Iterable[str]):
+        with self._lock:
+            self._nodes = dict.fromkeys(node for node in nodes if node)
+            self._rebuild()
+
+    def add_node(self, node: str):
+        with self._lock:
+            if node not in self._nodes:
+                self._nodes[node] = None
+                self._rebuild()
+
+    def remove_node(self, node: str):
+        with self._lock:
+            if node in self._nodes:
+                del self._nodes[node]
+                self._rebuild()
+
+    def get_node(self, key: str) -> Optional[str]:
+        nodes = self.get_nodes(key, 1)
+        return nodes[0] if nodes else None
+
+    def get_nodes(self, key: str, count: int) -> List[str]:
+        """Dono da chave seguido dos próximos nós distintos no anel (ordem de preferência para failover)."""
+        with self._lock:
+            if not self._points:
+                return []
+            result: List[str] = []
+            index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+            for offset in range(len(self._points)):
+                node = self._owners[(index + offset) % len(self._points)]
+                if node not in result:
+                    result.append(node)
+                    if len(result) == min(count, len(self._nodes)):
+                        break
+            return result
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, replace
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+from uuid import uuid4
+
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import Session
+
+from core import models
+from core.database import DATABASE_URL, DB_PGBOUNCER_MODE, AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Canal do NOTIFY com os eventos de invalidação (entity, tenant_id, version).
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache_invalidation")
+# listen: LISTEN/NOTIFY, com o outbox (tabela cache_invalidations) para recuperar o que se
+# perdeu em uma reconexão; poll: só o outbox; off: só a invalidação do próprio worker.
+# auto: listen, exceto no SQLite ou atrás do PgBouncer em modo transaction (que não repassa
+# LISTEN) sem uma conexão direta em CACHE_INVALIDATION_LISTEN_URL.
+CACHE_INVALIDATION_MODE = os.getenv("CACHE_INVALIDATION_MODE", "auto").lower()
+CACHE_INVALIDATION_LISTEN_URL = os.getenv("CACHE_INVALIDATION_LISTEN_URL")
+CACHE_INVALIDATION_POLL_SECONDS = float(os.getenv("CACHE_INVALIDATION_POLL_SECONDS", "5"))
+# Eventos mais antigos que isso são apagados do outbox.
+CACHE_INVALIDATION_RETENTION_SECONDS = float(os.getenv("CACHE_INVALIDATION_RETENTION_SECONDS", "3600"))
+# Ids abaixo do último visto que ainda são relidos: um evento com id menor pode ser confirmado depois.
+CACHE_INVALIDATION_POLL_OVERLAP = int(os.getenv("CACHE_INVALIDATION_POLL_OVERLAP", "100"))
+
+ENTITY_TENANT = "tenant"
+ENTITY_CATALOG = "catalog"
+ENTITY_PERSONALITY = "personality"
+
+# Identifica os eventos publicados por este worker, que já invalidou os próprios caches no commit.
+WORKER_ID = uuid4().hex
+
+# Chave em Session.info com os eventos publicados na transação corrente.
+_PENDING_KEY = "cache_invalidations"
+_SEEN_MAX_SIZE = 4096
+_POLL_BATCH_SIZE = 1000
+
+
+def _resolve_mode(mode: str) -> str:
+    if mode in ("listen", "poll", "off"):
+        return mode
+    if DATABASE_URL.startswith("sqlite"):
+        return "poll"
+    if DB_PGBOUNCER_MODE and not CACHE_INVALIDATION_LISTEN_URL:
+        return "poll"
+    return "listen"
+
+
+def _listen_dsn() -> str:
+    """DSN libpq para o asyncpg, sem o sufixo do driver do SQLAlchemy."""
+    url = CACHE_INVALIDATION_LISTEN_URL or DATABASE_URL
+    for prefix in ("postgresql+psycopg2://", "postgresql+psycopg://", "postgresql+asyncpg://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql://" + url[len(prefix):]
+    return url
+
+
+@dataclass(frozen=True)
+class InvalidationEvent:
+    entity: str
+    tenant_id: Optional[str] = None
+    version: Optional[int] = None
+    key: Optional[str] = None
+    origin: str = WORKER_ID
+    id: Optional[int] = None  # id no outbox
+
+    def to_payload(self) -> str:
+        return json.dumps(asdict(self), separators=(",", ":"))
+
+    @classmethod
+    def from_payload(cls, payload: str) -> "InvalidationEvent":
+        return cls(**json.loads(payload))
+
+    @classmethod
+    def from_row(cls, row) -> "InvalidationEvent":
+        return cls(entity=row.entity, tenant_id=row.tenant_id, version=row.version, key=row.key, origin=row.origin, id=row.id)
+
+
+# entidade -> funções que removem dos caches do processo as entradas afetadas pelo evento
+_handlers: Dict[str, List[Callable[[InvalidationEvent], None]]] = {}
+
+
+def register_handler(entity: str, handler: Callable[[InvalidationEvent], None]):
+    """Registra uma função de invalidação. Cada módulo de cache registra as suas ao ser importado."""
+    _handlers.setdefault(entity, []).append(handler)
+
+
+def apply_event(invalidation: InvalidationEvent):
+    for handler in _handlers.get(invalidation.entity, ()):
+        try:
+            handler(invalidation)
+        except Exception as e:
+            logger.error(f"Erro ao aplicar a invalidação {invalidation}: {e}", exc_info=True)
+
+
+def publish(db: Session, entity: str, tenant_id: Optional[str] = None, version: Optional[int] = None, key=None):
+    """
+    Publica uma invalidação na transação corrente, sem commit. O evento vai para o outbox e
+    para o NOTIFY, que o Postgres só entrega aos outros workers se a transação for confirmada;
+    os caches deste worker são invalidados no commit.
+    """
+    invalidation = InvalidationEvent(entity=entity, tenant_id=tenant_id, version=version, key=None if key is None else str(key))
+    if invalidation_bus.mode != "off":
+        event_id = db.execute(
+            insert(models.CacheInvalidation)
+            .values(entity=entity, tenant_id=tenant_id, version=version, key=invalidation.key, origin=invalidation.origin)
+            .returning(models.CacheInvalidation.id)
+        ).scalar_one()
+        invalidation = replace(invalidation, id=event_id)
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(select(func.pg_notify(CACHE_INVALIDATION_CHANNEL, invalidation.to_payload())))
+    db.info.setdefault(_PENDING_KEY, []).append(invalidation)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_invalidations(session: Session):
+    for invalidation in session.info.pop(_PENDING_KEY, ()):
+        invalidation_bus.published += 1
+        apply_event(invalidation)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session: Session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+class InvalidationBus:
+    """
+    Recebe as invalidações publicadas pelos outros workers e as aplica nos caches deste
+    processo: por LISTEN em uma conexão dedicada (fora do pool) ou lendo o outbox a cada
+    poll_interval. Na conexão (e em cada reconexão) do modo listen, o outbox é relido a
+    partir do último evento visto, cobrindo os NOTIFY perdidos enquanto não havia conexão.
+    """
+
+    def __init__(self, mode: str = CACHE_INVALIDATION_MODE, poll_interval: float = CACHE_INVALIDATION_POLL_SECONDS, session_factory=AsyncSessionLocal):
+        self.mode = _resolve_mode(mode)
+        self.poll_interval = poll_interval
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+        self._last_id: Optional[int] = None
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self._next_prune = 0.0
+        self.published = 0
+        self.received = 0
+        self.applied = 0
+        self.reconnects = 0
+        self.failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """Inicia o listener/poller. Deve ser chamado dentro do event loop da aplicação."""
+        if self.running or self.mode == "off":
+            return
+        self._task = asyncio.create_task(self._run_listen() if self.mode == "listen" else self._run_poll())
+        logger.info(f"InvalidationBus iniciado (modo={self.mode}, canal={CACHE_INVALIDATION_CHANNEL}, worker={WORKER_ID}).")
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def handle(self, invalidation: InvalidationEvent):
+        """Aplica um evento recebido, ignorando os deste worker e os já vistos."""
+        if invalidation.id is not None:
+            if invalidation.id in self._seen:
+                return
+            self._seen[invalidation.id] = None
+            while len(self._seen) > _SEEN_MAX_SIZE:
+                self._seen.popitem(last=False)
+            self._last_id = max(self._last_id or 0, invalidation.id)
+        self.received += 1
+        if invalidation.origin == WORKER_ID:
+            return
+        apply_event(invalidation)
+        self.applied += 1
+
+    async def poll_once(self) -> int:
+        """Lê o outbox a partir do último evento visto. Na primeira chamada só marca o ponto de partida."""
+        async with self.session_factory() as session:
+            if self._last_id is None:
+                self._last_id = (await session.execute(select(func.max(models.CacheInvalidation.id)))).scalar() or 0
+                return 0
+            rows = (await session.execute(
+                select(models.CacheInvalidation)
+                .where(models.CacheInvalidation.id > self._last_id - CACHE_INVALIDATION_POLL_OVERLAP)
+                .order_by(models.CacheInvalidation.id)
+                .limit(_POLL_BATCH_SIZE)
+            )).scalars().all()
+        received = self.received
+        for row in rows:
+            self.handle(InvalidationEvent.from_row(row))
+        return self.received - received
+
+    async def prune(self) -> int:
+        """Apaga do outbox os eventos mais antigos que a retenção (qualquer worker pode fazer isso)."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=CACHE_INVALIDATION_RETENTION_SECONDS)
+        async with self.session_factory() as session:
+            result = await session.execute(delete(models.CacheInvalidation).where(models.CacheInvalidation.created_at < cutoff))
+            await session.commit()
+        return result.rowcount or 0
+
+    async def _maybe_prune(self):
+        if time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + CACHE_INVALIDATION_RETENTION_SECONDS / 4
+        pruned = await self.prune()
+        if pruned:
+            logger.info(f"InvalidationBus: {pruned} evento(s) antigo(s) removido(s) do outbox.")
+
+    async def _run_poll(self):
+        while True:
+            try:
+                await self.poll_once()
+                await self._maybe_prune()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"InvalidationBus: erro ao ler o outbox de invalidações: {e}", exc_info=True)
+            await asyncio.sleep(self.poll_interval)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            self.handle(InvalidationEvent.from_payload(payload))
+        except (ValueError, TypeError) as e:
+            logger.warning(f"InvalidationBus: payload inválido no canal {channel}: {payload!r} ({e})")
+
+    async def _run_listen(self):
+        import asyncpg
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(_listen_dsn())
+                await connection.add_listener(CACHE_INVALIDATION_CHANNEL, self._on_notify)
+                logger.info(f"InvalidationBus: ouvindo o canal {CACHE_INVALIDATION_CHANNEL}.")
+                await self.poll_once()
+                while not connection.is_closed():
+                    await asyncio.sleep(self.poll_interval)
+                    await self._maybe_prune()
+                raise ConnectionError("a conexão do LISTEN foi encerrada")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"InvalidationBus: LISTEN indisponível ({e}); reconectando em {self.poll_interval}s.")
+                await asyncio.sleep(self.poll_interval)
+                self.reconnects += 1
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "mode": self.mode,
+            "running": self.running,
+            "last_id": self._last_id,
+            "published": self.published,
+            "received": self.received,
+            "applied": self.applied,
+            "reconnects": self.reconnects,
+            "failures": self.failures,
+        }
+
+
+invalidation_bus = InvalidationBus()
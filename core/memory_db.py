@@ -0,0 +1,120 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+from agno.memory.v2.db.postgres import PostgresMemoryDb
+from agno.memory.v2.db.schema import MemoryRow
+from agno.memory.v2.memory import Memory
+
+from core.database import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+MEMORY_TABLE_NAME = "user_memories"
+MEMORY_DB_POOL_SIZE = int(os.getenv("MEMORY_DB_POOL_SIZE", "5"))
+MEMORY_DB_MAX_OVERFLOW = int(os.getenv("MEMORY_DB_MAX_OVERFLOW", "5"))
+MEMORY_DB_POOL_RECYCLE = int(os.getenv("MEMORY_DB_POOL_RECYCLE", "1800"))
+MEMORY_CACHE_TTL_SECONDS = float(os.getenv("MEMORY_CACHE_TTL_SECONDS", "60"))
+MEMORY_CACHE_MAX_USERS = int(os.getenv("MEMORY_CACHE_MAX_USERS", "1000"))
+
+
+class CachedPostgresMemoryDb(PostgresMemoryDb):
+    """
+    PostgresMemoryDb com um cache em processo das leituras de memórias por usuário.
+
+    O user_id usado pelos agentes é o composite_session_id da conversa. Leituras
+    repetidas dentro do TTL não vão ao banco; qualquer escrita invalida o cache.
+    """
+
+    def __init__(self, *args, cache_ttl: float = MEMORY_CACHE_TTL_SECONDS, cache_max_users: int = MEMORY_CACHE_MAX_USERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_ttl = cache_ttl
+        self.cache_max_users = cache_max_users
+        self._cache: "OrderedDict[Tuple, Tuple[float, List[MemoryRow]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def read_memories(self, user_id: Optional[str] = None, limit: Optional[int] = None, sort: Optional[str] = None) -> List[MemoryRow]:
+        key = (user_id, limit, sort)
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] > now:
+                self._cache.move_to_end(key)
+                return list(cached[1])
+
+        memories = super().read_memories(user_id=user_id, limit=limit, sort=sort)
+
+        with self._cache_lock:
+            self._cache[key] = (now + self.cache_ttl, list(memories))
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_max_users:
+                self._cache.popitem(last=False)
+        return memories
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Remove do cache as leituras de um usuário (ou de todos, se user_id for None)."""
+        with self._cache_lock:
+            if user_id is None:
+                self._cache.clear()
+                return
+            for key in [k for k in self._cache if k[0] == user_id or k[0] is None]:
+                del self._cache[key]
+
+    def upsert_memory(self, memory: MemoryRow, create_and_retry: bool = True):
+        result = super().upsert_memory(memory, create_and_retry=create_and_retry)
+        self.invalidate(memory.user_id)
+        return result
+
+    def delete_memory(self, memory_id: str):
+        super().delete_memory(memory_id)
+        # Só temos o id da memória aqui, então descartamos o cache inteiro.
+        self.invalidate()
+
+    def clear(self) -> bool:
+        self.invalidate()
+        return super().clear()
+
+
+_memory_engine: Optional[Engine] = None
+_memory_db: Optional[CachedPostgresMemoryDb] = None
+_lock = threading.Lock()
+
+
+def get_memory_engine() -> Engine:
+    """Engine única do processo para as memórias dos agentes, com pool limitado."""
+    global _memory_engine
+    with _lock:
+        if _memory_engine is None:
+            _memory_engine = create_engine(
+                DATABASE_URL,
+                pool_size=MEMORY_DB_POOL_SIZE,
+                max_overflow=MEMORY_DB_MAX_OVERFLOW,
+                pool_recycle=MEMORY_DB_POOL_RECYCLE,
+                pool_pre_ping=True,
+            )
+            logger.info(f"Engine de memória criada (pool_size={MEMORY_DB_POOL_SIZE}, max_overflow={MEMORY_DB_MAX_OVERFLOW}).")
+        return _memory_engine
+
+
+def get_memory_db() -> CachedPostgresMemoryDb:
+    """Backend de memórias (com o cache de leituras) compartilhado por todos os agentes do processo."""
+    global _memory_db
+    engine = get_memory_engine()
+    with _lock:
+        if _memory_db is None:
+            _memory_db = CachedPostgresMemoryDb(table_name=MEMORY_TABLE_NAME, db_engine=engine)
+        return _memory_db
+
+
+def new_memory() -> Memory:
+    """
+    Memory de um único turno sobre o backend compartilhado. Os dicionários em processo do
+    agno (runs, memories) não são limpos, então um Memory não pode viver além da conversa.
+    """
+    return Memory(db=get_memory_db())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, JSON, Table, Float
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, JSON, Table, Float, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from core.database import Base
@@ -6,13 +6,15 @@ from core.database import Base
 # Tabela de Associação: Produto <-> Opcional
 produto_opcional_association = Table('produto_opcional', Base.metadata,
     Column('produto_id', Integer, ForeignKey('produtos.id_produto')),
-    Column('opcional_id', Integer, ForeignKey('opcionais.id_opcional'))
+    Column('opcional_id', Integer, ForeignKey('opcionais.id_opcional')),
+    Index('ux_produto_opcional', 'produto_id', 'opcional_id', unique=True)
 )
 
 # Tabela de Associação: Produto <-> Promocao
 produto_promocao_association = Table('produto_promocao', Base.metadata,
     Column('produto_id', Integer, ForeignKey('produtos.id_produto')),
-    Column('promocao_id', Integer, ForeignKey('promocoes.id_promocao'))
+    Column('promocao_id', Integer, ForeignKey('promocoes.id_promocao')),
+    Index('ux_produto_promocao', 'produto_id', 'promocao_id', unique=True)
 )
 
 class Tenant(Base):
@@ -31,6 +33,9 @@ class Tenant(Base):
     longitude = Column(String)
     url = Column(String)
     freight_config = Column(Text, nullable=True)
+    intent_rules = Column(Text, nullable=True) # JSON com regras de intenção do tenant (services/intent_router.py)
+    response_templates = Column(Text, nullable=True) # JSON com templates de resposta do tenant (services/response_templates.py)
+    catalog_version = Column(Integer, nullable=False, default=0, server_default="0") # Incrementada a cada alteração de produtos/opcionais/promoções (ETag das listagens)
     
     personality_id = Column(Integer, ForeignKey("personalities.id"))
     personality = relationship("Personality")
@@ -42,12 +47,17 @@ class MenuImage(Base):
     image_url = Column(String, nullable=False)
     description = Column(String) # Ex: "Cardápio Principal", "Promoções da Semana"
 
+    __table_args__ = (
+        Index("ix_menu_images_tenant_id_id", "tenant_id", "id"),
+    )
+
 class Personality(Base):
     __tablename__ = "personalities"
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True, nullable=False)
     prompt = Column(Text, nullable=False)
+    tone_variables = Column(Text, nullable=True) # JSON com variáveis de tom usadas nos templates de resposta
 
 class Interaction(Base):
     __tablename__ = "interactions"
@@ -62,6 +72,11 @@ class Interaction(Base):
     personality_id = Column(Integer, ForeignKey("personalities.id"))
     tenant_id = Column(String, ForeignKey("tenants.tenant_id"), nullable=False)
 
+    __table_args__ = (
+        Index("ix_interactions_user_phone_created_at", "user_phone", "created_at"),
+        Index("ix_interactions_tenant_phone_created_id", "tenant_id", "user_phone", "created_at", "id"),
+    )
+
 class Product(Base):
     __tablename__ = "produtos" # Nome da tabela alterado
 
@@ -77,6 +92,12 @@ class Product(Base):
     opcionais = relationship("Opcional", secondary=produto_opcional_association, back_populates="produtos")
     promocoes = relationship("Promocao", secondary=produto_promocao_association, back_populates="produtos")
 
+    # O índice trigram (ix_produtos_nome_produto_trgm) depende da extensão pg_trgm e só existe na migração 4c7e2a9f1d38.
+    __table_args__ = (
+        # Chave natural: alvo do ON CONFLICT da importação do catálogo (crud/catalog_crud.py)
+        Index("ux_produtos_tenant_id_nome_lower", "tenant_id", func.lower(nome_produto), unique=True),
+    )
+
 class Opcional(Base):
     __tablename__ = "opcionais"
 
@@ -88,6 +109,10 @@ class Opcional(Base):
 
     produtos = relationship("Product", secondary=produto_opcional_association, back_populates="opcionais")
 
+    __table_args__ = (
+        Index("ux_opcionais_tenant_id_nome_lower", "tenant_id", func.lower(nome_opcional), unique=True),
+    )
+
 class Promocao(Base):
     __tablename__ = "promocoes"
 
@@ -101,6 +126,11 @@ class Promocao(Base):
 
     produtos = relationship("Product", secondary=produto_promocao_association, back_populates="promocoes")
 
+    __table_args__ = (
+        Index("ix_promocoes_tenant_id_is_ativa", "tenant_id", "is_ativa"),
+        Index("ux_promocoes_tenant_id_nome_lower", "tenant_id", func.lower(nome_promocao), unique=True),
+    )
+
 class UserAddress(Base):
     __tablename__ = "user_addresses"
 
@@ -112,6 +142,10 @@ class UserAddress(Base):
     longitude = Column(String, nullable=True)
     last_used_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_user_addresses_phone_tenant_last_used", "user_phone", "tenant_id", "last_used_at"),
+    )
+
 class Order(Base):
     __tablename__ = "orders"
 
@@ -125,4 +159,36 @@ class Order(Base):
     freight_details = Column(JSON, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    
\ No newline at end of file
+class ConversationState(Base):
+    __tablename__ = "conversation_states"
+
+    # Chave no formato "<tipo>:<user_id>_<tenant_id>" (ver core/conversation_state.py)
+    key = Column(String, primary_key=True)
+    value = Column(LargeBinary, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class AbandonedCart(Base):
+    __tablename__ = "abandoned_carts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_phone = Column(String, index=True, nullable=False)
+    tenant_id = Column(String, ForeignKey("tenants.tenant_id"), nullable=False, index=True)
+    items = Column(JSON, nullable=False)
+    address = Column(Text, nullable=True)
+    status = Column(String, nullable=False, default="open")
+    last_activity_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class CacheInvalidation(Base):
+    __tablename__ = "cache_invalidations"
+
+    # Outbox do barramento de invalidação de caches (core/invalidation_bus.py). Sem FK para
+    # tenants: a invalidação da remoção de um tenant também passa por aqui.
+    id = Column(Integer, primary_key=True)
+    entity = Column(String, nullable=False) # "tenant", "catalog" ou "personality"
+    tenant_id = Column(String, nullable=True)
+    version = Column(Integer, nullable=True) # catalog_version resultante, para "catalog"
+    key = Column(String, nullable=True) # id da personalidade, para "personality"
+    origin = Column(String, nullable=False) # worker que publicou
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
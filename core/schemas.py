@@ -69,6 +69,49 @@ class Product(ProductBase):
 
     model_config = ConfigDict(from_attributes = True)
 
+class ProductListItem(ProductBase):
+    id_produto: int
+    tenant_id: str
+
+# =======================================================================
+# Esquemas para a Importação do Catálogo
+# =======================================================================
+class CatalogImportRowError(BaseModel):
+    entidade: str
+    linha: int
+    erro: str
+
+class CatalogImportEntityReport(BaseModel):
+    linhas: int = 0
+    gravadas: int = 0
+    erros: int = 0
+    colunas_ignoradas: List[str] = []
+
+class CatalogImportReport(BaseModel):
+    dry_run: bool
+    entidades: Dict[str, CatalogImportEntityReport]
+    erros: List[CatalogImportRowError]
+
+class ProductOpcionalPair(BaseModel):
+    product_id: int
+    opcional_id: int
+
+class ProductOpcionalRule(BaseModel):
+    opcional_ids: List[int] = Field(max_length=500)
+    categoria_produto: Optional[str] = None # None: todos os produtos do tenant
+
+# Os limites mantêm cada INSERT/DELETE/verificação de ids abaixo dos 65535 parâmetros do
+# Postgres (dois por par); um lote maior recebe 422 e deve ser dividido pelo cliente.
+class ProductOpcionalBatch(BaseModel):
+    link: List[ProductOpcionalPair] = Field(default=[], max_length=5000)
+    unlink: List[ProductOpcionalPair] = Field(default=[], max_length=5000)
+    link_rules: List[ProductOpcionalRule] = Field(default=[], max_length=20)
+    unlink_rules: List[ProductOpcionalRule] = Field(default=[], max_length=20)
+
+class ProductOpcionalBatchResult(BaseModel):
+    linked: int
+    unlinked: int
+
 # =======================================================================
 # Esquemas para Imagens de Cardápio
 # =======================================================================
@@ -107,6 +150,8 @@ class TenantCreate(BaseModel):
     longitude: float
     url: Optional[str] = None
     freight_config: Optional[str] = None
+    intent_rules: Optional[str] = None
+    response_templates: Optional[str] = None
 
 class Tenant(TenantBase):
     id: int
@@ -115,10 +160,21 @@ class Tenant(TenantBase):
     latitude: Optional[str] = None
     longitude: Optional[str] = None
     url: Optional[str] = None
+    intent_rules: Optional[str] = None
+    response_templates: Optional[str] = None
     menu_images: List[MenuImage] = []
 
     model_config = ConfigDict(from_attributes = True)
 
+class TenantListItem(BaseModel):
+    id: int
+    tenant_id: str
+    nome_loja: str
+    is_active: Optional[bool] = True
+    url: Optional[str] = None
+    endereco: Optional[str] = None
+    cep: Optional[str] = None
+
 class TenantUpdateSchema(BaseModel):
     nome_loja: Optional[str] = None
     ia_personality: Optional[str] = None
@@ -130,6 +186,8 @@ class TenantUpdateSchema(BaseModel):
     url: Optional[str] = None
     is_active: Optional[bool] = None
     freight_config: Optional[str] = None
+    intent_rules: Optional[str] = None
+    response_templates: Optional[str] = None
 
 class TenantConfigRequest(BaseModel):
     instancia: str
@@ -157,6 +215,7 @@ class TenantDataResponse(BaseModel):
 class PersonalityBase(BaseModel):
     name: str
     prompt: str
+    tone_variables: Optional[str] = None
     tenant_id: Optional[str] = None
 
 class PersonalityCreate(PersonalityBase):
@@ -193,6 +252,19 @@ class AIWebhookResponsePart(BaseModel):
     human_handoff: bool = False
     send_menu: bool = False
 
+class AIWebhookAccepted(BaseModel):
+    job_id: str
+    status: str
+
+class AIWebhookCallback(BaseModel):
+    job_id: str
+    status: str
+    tenant_id: Optional[str] = None
+    user_phone: Optional[str] = None
+    whatsapp_message_id: Optional[str] = None
+    response_parts: List[AIWebhookResponsePart] = []
+    error: Optional[str] = None
+
 class HumanHandoffOutput(BaseModel):
     should_handoff: bool
 
@@ -245,6 +317,17 @@ class Interaction(InteractionBase):
 
     model_config = ConfigDict(from_attributes = True)
 
+class InteractionHistoryItem(BaseModel):
+    id: Optional[int] = None # None enquanto a interação ainda não foi gravada no banco
+    whatsapp_message_id: str
+    message_from_user: Optional[str] = None
+    ai_response: Optional[str] = None
+    created_at: datetime
+
+class InteractionHistoryPage(BaseModel):
+    items: List[InteractionHistoryItem]
+    next_cursor: Optional[str] = None # Passe em ?cursor= para buscar a página seguinte
+
 # =======================================================================
 # Esquemas para Endereços de Usuários
 # =======================================================================
@@ -279,6 +362,14 @@ class OrderBase(BaseModel):
 class OrderCreate(OrderBase):
     pass
 
+class AbandonedCartCreate(BaseModel):
+    user_phone: str
+    tenant_id: str
+    items: List[Dict[str, Any]]
+    address: Optional[str] = None
+    status: str = "open"
+    last_activity_at: Optional[datetime] = None
+
 class Order(OrderBase):
     id: int
     created_at: datetime
@@ -355,6 +446,49 @@ class Product(ProductBase):
 
     model_config = ConfigDict(from_attributes = True)
 
+class ProductListItem(ProductBase):
+    id_produto: int
+    tenant_id: str
+
+# =======================================================================
+# Esquemas para a Importação do Catálogo
+# =======================================================================
+class CatalogImportRowError(BaseModel):
+    entidade: str
+    linha: int
+    erro: str
+
+class CatalogImportEntityReport(BaseModel):
+    linhas: int = 0
+    gravadas: int = 0
+    erros: int = 0
+    colunas_ignoradas: List[str] = []
+
+class CatalogImportReport(BaseModel):
+    dry_run: bool
+    entidades: Dict[str, CatalogImportEntityReport]
+    erros: List[CatalogImportRowError]
+
+class ProductOpcionalPair(BaseModel):
+    product_id: int
+    opcional_id: int
+
+class ProductOpcionalRule(BaseModel):
+    opcional_ids: List[int] = Field(max_length=500)
+    categoria_produto: Optional[str] = None # None: todos os produtos do tenant
+
+# Os limites mantêm cada INSERT/DELETE/verificação de ids abaixo dos 65535 parâmetros do
+# Postgres (dois por par); um lote maior recebe 422 e deve ser dividido pelo cliente.
+class ProductOpcionalBatch(BaseModel):
+    link: List[ProductOpcionalPair] = Field(default=[], max_length=5000)
+    unlink: List[ProductOpcionalPair] = Field(default=[], max_length=5000)
+    link_rules: List[ProductOpcionalRule] = Field(default=[], max_length=20)
+    unlink_rules: List[ProductOpcionalRule] = Field(default=[], max_length=20)
+
+class ProductOpcionalBatchResult(BaseModel):
+    linked: int
+    unlinked: int
+
 # =======================================================================
 # Esquemas para Imagens de Cardápio
 # =======================================================================
@@ -393,6 +527,8 @@ class TenantCreate(BaseModel):
     longitude: float
     url: Optional[str] = None
     freight_config: Optional[str] = None
+    intent_rules: Optional[str] = None
+    response_templates: Optional[str] = None
 
 class Tenant(TenantBase):
     id: int
@@ -401,10 +537,21 @@ class Tenant(TenantBase):
     latitude: Optional[str] = None
     longitude: Optional[str] = None
     url: Optional[str] = None
+    intent_rules: Optional[str] = None
+    response_templates: Optional[str] = None
     menu_images: List[MenuImage] = []
 
     model_config = ConfigDict(from_attributes = True)
 
+class TenantListItem(BaseModel):
+    id: int
+    tenant_id: str
+    nome_loja: str
+    is_active: Optional[bool] = True
+    url: Optional[str] = None
+    endereco: Optional[str] = None
+    cep: Optional[str] = None
+
 class TenantUpdateSchema(BaseModel):
     nome_loja: Optional[str] = None
     ia_personality: Optional[str] = None
@@ -416,6 +563,8 @@ class TenantUpdateSchema(BaseModel):
     url: Optional[str] = None
     is_active: Optional[bool] = None
     freight_config: Optional[str] = None
+    intent_rules: Optional[str] = None
+    response_templates: Optional[str] = None
 
 class TenantConfigRequest(BaseModel):
     instancia: str
@@ -443,6 +592,7 @@ class TenantDataResponse(BaseModel):
 class PersonalityBase(BaseModel):
     name: str
     prompt: str
+    tone_variables: Optional[str] = None
     tenant_id: Optional[str] = None
 
 class PersonalityCreate(PersonalityBase):
@@ -479,6 +629,19 @@ class AIWebhookResponsePart(BaseModel):
     human_handoff: bool = False
     send_menu: bool = False
 
+class AIWebhookAccepted(BaseModel):
+    job_id: str
+    status: str
+
+class AIWebhookCallback(BaseModel):
+    job_id: str
+    status: str
+    tenant_id: Optional[str] = None
+    user_phone: Optional[str] = None
+    whatsapp_message_id: Optional[str] = None
+    response_parts: List[AIWebhookResponsePart] = []
+    error: Optional[str] = None
+
 class HumanHandoffOutput(BaseModel):
     should_handoff: bool
 
@@ -531,6 +694,17 @@ class Interaction(InteractionBase):
 
     model_config = ConfigDict(from_attributes = True)
 
+class InteractionHistoryItem(BaseModel):
+    id: Optional[int] = None # None enquanto a interação ainda não foi gravada no banco
+    whatsapp_message_id: str
+    message_from_user: Optional[str] = None
+    ai_response: Optional[str] = None
+    created_at: datetime
+
+class InteractionHistoryPage(BaseModel):
+    items: List[InteractionHistoryItem]
+    next_cursor: Optional[str] = None # Passe em ?cursor= para buscar a página seguinte
+
 # =======================================================================
 # Esquemas para Endereços de Usuários
 # =======================================================================
@@ -565,6 +739,14 @@ class OrderBase(BaseModel):
 class OrderCreate(OrderBase):
     pass
 
+class AbandonedCartCreate(BaseModel):
+    user_phone: str
+    tenant_id: str
+    items: List[Dict[str, Any]]
+    address: Optional[str] = None
+    status: str = "open"
+    last_activity_at: Optional[datetime] = None
+
 class Order(OrderBase):
     id: int
     created_at: datetime
@@ -0,0 +1,147 @@
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.invalidation_bus import ENTITY_PERSONALITY, ENTITY_TENANT, register_handler
+from core.unit_of_work import unit_of_work_session
+
+logger = logging.getLogger(__name__)
+
+TENANT_CACHE_TTL_SECONDS = float(os.getenv("TENANT_CACHE_TTL_SECONDS", "300"))
+# Tenants inexistentes ou inativos ficam em cache por menos tempo.
+TENANT_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("TENANT_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+
+DEFAULT_PERSONALITY_PROMPT = "Você é um assistente de IA prestativo."
+
+
+@dataclass(frozen=True)
+class TenantSnapshot:
+    """Cópia imutável dos dados do tenant e da personalidade usados no caminho do /ai."""
+    tenant_id: str
+    nome_loja: str
+    is_active: bool
+    endereco: Optional[str]
+    latitude: Optional[str]
+    longitude: Optional[str]
+    freight_config: Optional[str]
+    intent_rules: Optional[str]
+    response_templates: Optional[str]
+    personality_id: Optional[int]
+    personality_name: Optional[str]
+    personality_prompt: Optional[str]
+    personality_tone_variables: Optional[str]
+
+    @classmethod
+    def from_model(cls, tenant) -> "TenantSnapshot":
+        personality = tenant.personality
+        return cls(
+            tenant_id=tenant.tenant_id,
+            nome_loja=tenant.nome_loja,
+            is_active=bool(tenant.is_active),
+            endereco=tenant.endereco,
+            latitude=tenant.latitude,
+            longitude=tenant.longitude,
+            freight_config=tenant.freight_config,
+            intent_rules=tenant.intent_rules,
+            response_templates=tenant.response_templates,
+            personality_id=personality.id if personality else None,
+            personality_name=personality.name if personality else None,
+            personality_prompt=personality.prompt if personality else None,
+            personality_tone_variables=personality.tone_variables if personality else None,
+        )
+
+    @property
+    def prompt(self) -> str:
+        return self.personality_prompt or DEFAULT_PERSONALITY_PROMPT
+
+
+class TenantCache:
+    """
+    Cache em processo de TenantSnapshot com TTL. Tenants desconhecidos também são
+    guardados (como None) para que IDs inválidos não gerem uma query por mensagem.
+    """
+
+    def __init__(self, ttl: float = TENANT_CACHE_TTL_SECONDS, negative_ttl: float = TENANT_CACHE_NEGATIVE_TTL_SECONDS):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: Dict[str, Tuple[float, Optional[TenantSnapshot]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def peek(self, tenant_id: str) -> Tuple[bool, Optional[TenantSnapshot]]:
+        """Retorna (encontrado, snapshot) sem ir ao banco."""
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, tenant_id: str, snapshot: Optional[TenantSnapshot]):
+        ttl = self.ttl if snapshot is not None and snapshot.is_active else self.negative_ttl
+        with self._lock:
+            self._entries[tenant_id] = (time.monotonic() + ttl, snapshot)
+
+    def invalidate(self, tenant_id: str):
+        with self._lock:
+            self._entries.pop(tenant_id, None)
+        logger.debug(f"TenantCache: tenant '{tenant_id}' invalidado.")
+
+    def invalidate_personality(self, personality_id: int):
+        with self._lock:
+            stale = [
+                tenant_id for tenant_id, (_, snapshot) in self._entries.items()
+                if snapshot is not None and snapshot.personality_id == personality_id
+            ]
+            for tenant_id in stale:
+                del self._entries[tenant_id]
+        logger.debug(f"TenantCache: {len(stale)} tenant(s) invalidado(s) pela personalidade {personality_id}.")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+tenant_cache = TenantCache()
+
+
+async def get_tenant_snapshot(tenant_id: str, db: Optional[AsyncSession] = None) -> Optional[TenantSnapshot]:
+    """
+    Retorna o snapshot do tenant, indo ao banco apenas quando não está em cache.
+    Se nenhuma sessão for informada, usa a da unidade de trabalho da requisição (ou uma sessão curta).
+    """
+    found, snapshot = tenant_cache.peek(tenant_id)
+    if found:
+        return snapshot
+
+    from crud import tenant_crud
+
+    if db is None:
+        async with unit_of_work_session() as session:
+            tenant = await tenant_crud.get_tenant_by_id_async(session, tenant_id)
+            snapshot = TenantSnapshot.from_model(tenant) if tenant else None
+    else:
+        tenant = await tenant_crud.get_tenant_by_id_async(db, tenant_id)
+        snapshot = TenantSnapshot.from_model(tenant) if tenant else None
+
+    tenant_cache.put(tenant_id, snapshot)
+    return snapshot
+
+
+def invalidate_tenant(tenant_id: str):
+    tenant_cache.invalidate(tenant_id)
+
+
+def invalidate_personality(personality_id: int):
+    tenant_cache.invalidate_personality(personality_id)
+
+
+register_handler(ENTITY_TENANT, lambda invalidation: invalidate_tenant(invalidation.tenant_id))
+register_handler(ENTITY_PERSONALITY, lambda invalidation: invalidate_personality(int(invalidation.key)))
@@ -0,0 +1,154 @@
+import os
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.database import engine, async_engine, AsyncSessionLocal, PinnedAsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Acima deste número de conexões em uma única requisição, um aviso é registrado no log.
+UOW_CONNECTIONS_WARN_THRESHOLD = int(os.getenv("UOW_CONNECTIONS_WARN_THRESHOLD", "3"))
+
+_current_unit_of_work: ContextVar[Optional["UnitOfWork"]] = ContextVar("unit_of_work", default=None)
+
+
+class UnitOfWork:
+    """
+    Sessão única de uma requisição do /ai, compartilhada por CRUD, ferramentas e caches
+    através de uma contextvar. A sessão pega a conexão na primeira consulta e fica presa a
+    ela: os commits intermediários (interações, estado, endereço) não devolvem a conexão ao
+    pool nem abrem outra, e uma requisição que não consulta o banco não ocupa conexão.
+
+    - `db`: para o caminho sequencial do turno (chat_service, recepção do workflow).
+    - `session()` / `run_sync()`: para trechos que podem rodar em paralelo (fan-out de
+      tarefas, ferramentas). Uma AsyncSession não aceita uso concorrente, então esses
+      acessos são serializados por um lock; as consultas são curtas perto das chamadas ao LLM.
+
+    `connections_opened` conta os checkouts de conexão (conexões novas com NullPool) feitos
+    enquanto a unidade de trabalho está ativa, incluindo os de código que ainda abre sessão própria.
+    """
+
+    def __init__(self, session_factory=PinnedAsyncSessionLocal, session: Optional[AsyncSession] = None):
+        self.session_factory = session_factory
+        # Contadas pelo listener de checkout, inclusive a da sessão recebida pronta (aberta sob demanda).
+        self.connections_opened = 0
+        self._session: Optional[AsyncSession] = session
+        # Uma sessão recebida pronta (ex.: da dependência get_async_db) é fechada por quem a abriu.
+        self._owns_session = session is None
+        self._lock = asyncio.Lock()
+
+    async def open(self):
+        # Não toca no banco: a conexão só é pega na primeira consulta da sessão.
+        if self._session is None:
+            self._session = self.session_factory()
+
+    @property
+    def db(self) -> AsyncSession:
+        if self._session is None:
+            raise RuntimeError("UnitOfWork não foi aberta.")
+        return self._session
+
+    @asynccontextmanager
+    async def session(self):
+        async with self._lock:
+            yield self.db
+
+    async def run_sync(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Executa código síncrono do SQLAlchemy (fn(session, ...)) na mesma conexão da requisição."""
+        async with self._lock:
+            return await self.db.run_sync(lambda sync_session: fn(sync_session, *args, **kwargs))
+
+    async def close(self):
+        if self._session is not None and self._owns_session:
+            await self._session.close()
+        self._session = None
+
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {"units": 0, "connections": 0, "max_connections": 0}
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    uow = _current_unit_of_work.get()
+    if uow is not None:
+        uow.connections_opened += 1
+
+
+event.listen(engine, "checkout", _on_checkout)
+event.listen(async_engine.sync_engine, "checkout", _on_checkout)
+
+
+def current_unit_of_work() -> Optional[UnitOfWork]:
+    return _current_unit_of_work.get()
+
+
+@asynccontextmanager
+async def unit_of_work(session: Optional[AsyncSession] = None, session_factory=PinnedAsyncSessionLocal):
+    """
+    Abre a unidade de trabalho da requisição, opcionalmente sobre uma sessão já aberta.
+    Se já houver uma ativa, ela é reutilizada.
+    """
+    uow = _current_unit_of_work.get()
+    if uow is not None:
+        yield uow
+        return
+
+    uow = UnitOfWork(session_factory, session=session)
+    token = _current_unit_of_work.set(uow)
+    try:
+        await uow.open()
+        yield uow
+    finally:
+        _current_unit_of_work.reset(token)
+        await uow.close()
+        _record(uow)
+
+
+def _record(uow: UnitOfWork):
+    with _stats_lock:
+        _stats["units"] += 1
+        _stats["connections"] += uow.connections_opened
+        _stats["max_connections"] = max(_stats["max_connections"], uow.connections_opened)
+    if uow.connections_opened > UOW_CONNECTIONS_WARN_THRESHOLD:
+        logger.warning(f"Requisição abriu {uow.connections_opened} conexões com o banco (limite de aviso: {UOW_CONNECTIONS_WARN_THRESHOLD}).")
+    else:
+        logger.debug(f"Requisição abriu {uow.connections_opened} conexão(ões) com o banco.")
+
+
+@asynccontextmanager
+async def unit_of_work_session():
+    """Sessão da unidade de trabalho atual ou, fora de uma requisição, uma sessão curta própria."""
+    uow = _current_unit_of_work.get()
+    if uow is not None:
+        async with uow.session() as db:
+            yield db
+    else:
+        async with AsyncSessionLocal() as db:
+            yield db
+
+
+async def run_sync(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Executa fn(session_síncrona, ...) na conexão da requisição ou em uma sessão curta própria."""
+    uow = _current_unit_of_work.get()
+    if uow is not None:
+        return await uow.run_sync(fn, *args, **kwargs)
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(lambda sync_session: fn(sync_session, *args, **kwargs))
+
+
+def stats() -> Dict[str, float]:
+    with _stats_lock:
+        units = _stats["units"]
+        return {
+            "units": units,
+            "connections": _stats["connections"],
+            "max_connections": _stats["max_connections"],
+            "avg_connections": round(_stats["connections"] / units, 2) if units else 0.0,
+        }
@@ -1,5 +1,7 @@
 import os
-from typing import List, Dict
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
 from dotenv import load_dotenv
 import logging
 
@@ -10,22 +12,39 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 
 from sqlalchemy.orm import Session
+from sqlalchemy.engine import Engine
+
+from core.database import engine as default_engine
+from core.invalidation_bus import ENTITY_TENANT, register_handler
+
+# Quantidade máxima de tenants com VectorDBManager mantido em memória.
+VECTOR_DB_CACHE_SIZE = int(os.getenv("VECTOR_DB_CACHE_SIZE", "128"))
+
+_embedder: Optional[GeminiEmbedder] = None
+_embedder_lock = threading.Lock()
+
+def _get_embedder() -> GeminiEmbedder:
+    """Embedder compartilhado por todas as coleções do processo."""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = GeminiEmbedder(api_key=os.getenv("GEMINI_API_KEY"))
+        return _embedder
 
 class VectorDBManager:
-    def __init__(self, db: Session, collection_name: str):
+    def __init__(self, db: Optional[Session] = None, collection_name: str = None, db_engine: Optional[Engine] = None):
         self.db = db
         self.collection_name = collection_name
         logger.debug(f"VectorDBManager: Inicializando para a coleção '{self.collection_name}'")
-        
-        # A DATABASE_URL será obtida da sessão do DB injetada
-        # Não é mais necessário carregar de os.getenv aqui
 
-        embedder = GeminiEmbedder(api_key=os.getenv("GEMINI_API_KEY"))
-        
+        # Reutiliza a engine (e o pool de conexões) já existente em vez de criar uma por coleção.
+        if db_engine is None:
+            db_engine = self.db.get_bind() if self.db is not None else default_engine
+
         self.knowledge_base = PgVector(
-            db_url=str(self.db.connection().engine.url), # Obtém a URL da conexão da sessão
+            db_engine=db_engine,
             table_name=self.collection_name,
-            embedder=embedder,
+            embedder=_get_embedder(),
             search_type=SearchType.hybrid,
         )
         logger.info(f"PgVector inicializado com sucesso para a tabela: {self.collection_name}")
@@ -56,3 +75,60 @@ class VectorDBManager:
         except Exception as e:
             logger.error(f"Erro ao buscar documentos na coleção '{self.collection_name}': {e}", exc_info=True)
             return []
+
+
+class VectorDBManagerCache:
+    """
+    Cache LRU de VectorDBManager por tenant. Evita reconstruir o cliente do PgVector
+    a cada mensagem; o tenant menos usado recentemente é descartado quando o limite é atingido.
+    """
+
+    def __init__(self, max_size: int = VECTOR_DB_CACHE_SIZE):
+        self.max_size = max_size
+        self._managers: "OrderedDict[str, VectorDBManager]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id: str) -> VectorDBManager:
+        with self._lock:
+            manager = self._managers.get(tenant_id)
+            if manager is not None:
+                self._managers.move_to_end(tenant_id)
+                return manager
+
+        manager = VectorDBManager(collection_name=tenant_id)
+
+        with self._lock:
+            # Outra thread pode ter criado o manager enquanto construíamos o nosso.
+            existing = self._managers.get(tenant_id)
+            if existing is not None:
+                self._managers.move_to_end(tenant_id)
+                return existing
+            self._managers[tenant_id] = manager
+            while len(self._managers) > self.max_size:
+                evicted_tenant_id, _ = self._managers.popitem(last=False)
+                logger.debug(f"VectorDBManagerCache: removendo o tenant '{evicted_tenant_id}' do cache (LRU).")
+        return manager
+
+    def invalidate(self, tenant_id: str):
+        with self._lock:
+            self._managers.pop(tenant_id, None)
+        logger.info(f"VectorDBManagerCache: cache invalidado para o tenant '{tenant_id}'.")
+
+    def clear(self):
+        with self._lock:
+            self._managers.clear()
+
+    def __len__(self) -> int:
+        return len(self._managers)
+
+
+vector_db_managers = VectorDBManagerCache()
+
+def get_vector_db_manager(tenant_id: str) -> VectorDBManager:
+    return vector_db_managers.get(tenant_id)
+
+def invalidate_vector_db_manager(tenant_id: str):
+    vector_db_managers.invalidate(tenant_id)
+
+
+register_handler(ENTITY_TENANT, lambda invalidation: invalidate_vector_db_manager(invalidation.tenant_id))
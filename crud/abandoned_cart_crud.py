@@ -0,0 +1,10 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import models, schemas
+
+async def create_abandoned_cart_async(db: AsyncSession, cart: schemas.AbandonedCartCreate):
+    db_cart = models.AbandonedCart(**cart.model_dump())
+    db.add(db_cart)
+    await db.commit()
+    await db.refresh(db_cart)
+    return db_cart
@@ -0,0 +1,149 @@
+import logging
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import delete, func, literal, select, true, tuple_, union_all
+from sqlalchemy.orm import Session
+from core import models, schemas
+from crud import tenant_crud
+
+logger = logging.getLogger(__name__)
+
+# Operações em lote do catálogo. As da importação (services/catalog_import.py) não fazem
+# commit: a importação inteira roda em uma única transação.
+
+# entidade -> (modelo, coluna do nome)
+NATURAL_KEYS = {
+    "produtos": (models.Product, models.Product.nome_produto),
+    "opcionais": (models.Opcional, models.Opcional.nome_opcional),
+    "promocoes": (models.Promocao, models.Promocao.nome_promocao),
+}
+
+# entidade de ligação -> (tabela, coluna do produto, coluna do item ligado)
+LINK_TABLES = {
+    "produto_opcional": (models.produto_opcional_association, "produto_id", "opcional_id"),
+    "produto_promocao": (models.produto_promocao_association, "produto_id", "promocao_id"),
+}
+
+def _insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+def bulk_upsert(db: Session, entity: str, tenant_id: str, rows: List[dict]) -> int:
+    """
+    Grava as linhas em um único INSERT multi-row com ON CONFLICT (tenant_id, lower(nome)) DO UPDATE.
+    Só as colunas presentes nas linhas são atualizadas; as demais mantêm o valor do banco.
+    As linhas não podem repetir o mesmo nome (o Postgres não atualiza a mesma linha duas vezes).
+    """
+    if not rows:
+        return 0
+    model, name_column = NATURAL_KEYS[entity]
+    values = [{**row, "tenant_id": tenant_id} for row in rows]
+    stmt = _insert(db)(model).values(values)
+    update_columns = [column for column in rows[0] if column != "tenant_id"]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[model.tenant_id, func.lower(name_column)],
+        set_={column: stmt.excluded[column] for column in update_columns},
+    )
+    db.execute(stmt)
+    return len(values)
+
+def get_ids_by_names(db: Session, entity: str, tenant_id: str, names: Iterable[str]) -> Dict[str, int]:
+    """Mapeia lower(nome) -> id para os nomes informados, em uma única consulta."""
+    lowered = {str(name).strip().lower() for name in names if name is not None}
+    if not lowered:
+        return {}
+    model, name_column = NATURAL_KEYS[entity]
+    id_column = model.__mapper__.primary_key[0]
+    rows = db.execute(
+        select(func.lower(name_column), id_column)
+        .where(model.tenant_id == tenant_id, func.lower(name_column).in_(lowered))
+    ).all()
+    return {name: id_ for name, id_ in rows}
+
+def bulk_link(db: Session, entity: str, pairs: List[Tuple[int, int]]) -> int:
+    """Insere as ligações (produto_id, item_id) ignorando as que já existem."""
+    if not pairs:
+        return 0
+    table, left, right = LINK_TABLES[entity]
+    stmt = _insert(db)(table).values([{left: a, right: b} for a, b in set(pairs)])
+    stmt = stmt.on_conflict_do_nothing(index_elements=[left, right])
+    db.execute(stmt)
+    return len(set(pairs))
+
+def get_foreign_ids(db: Session, tenant_id: str, product_ids: Iterable[int], opcional_ids: Iterable[int]) -> Dict[str, List[int]]:
+    """Ids que não existem ou são de outro tenant, por entidade, verificados em uma única consulta."""
+    product_ids, opcional_ids = set(product_ids), set(opcional_ids)
+    queries = []
+    if product_ids:
+        queries.append(
+            select(literal("produtos").label("entidade"), models.Product.id_produto.label("id"))
+            .where(models.Product.tenant_id == tenant_id, models.Product.id_produto.in_(product_ids))
+        )
+    if opcional_ids:
+        queries.append(
+            select(literal("opcionais").label("entidade"), models.Opcional.id_opcional.label("id"))
+            .where(models.Opcional.tenant_id == tenant_id, models.Opcional.id_opcional.in_(opcional_ids))
+        )
+    if not queries:
+        return {}
+    owned = {"produtos": set(), "opcionais": set()}
+    for entity, id_ in db.execute(union_all(*queries) if len(queries) > 1 else queries[0]).all():
+        owned[entity].add(id_)
+    missing = {"produtos": sorted(product_ids - owned["produtos"]), "opcionais": sorted(opcional_ids - owned["opcionais"])}
+    return {entity: ids for entity, ids in missing.items() if ids}
+
+def _rule_products(tenant_id: str, rule: schemas.ProductOpcionalRule):
+    query = select(models.Product.id_produto).where(models.Product.tenant_id == tenant_id)
+    if rule.categoria_produto:
+        query = query.where(func.lower(models.Product.categoria_produto) == rule.categoria_produto.strip().lower())
+    return query
+
+def _rule_opcionais(tenant_id: str, rule: schemas.ProductOpcionalRule):
+    return select(models.Opcional.id_opcional).where(models.Opcional.tenant_id == tenant_id, models.Opcional.id_opcional.in_(rule.opcional_ids))
+
+def apply_product_opcional_batch(db: Session, tenant_id: str, batch: schemas.ProductOpcionalBatch) -> Dict[str, int]:
+    """
+    Aplica os desligamentos e depois as ligações do lote em uma única transação. Cada grupo é
+    um único DELETE ou INSERT (as regras viram INSERT ... SELECT sobre os produtos da categoria),
+    sem carregar produtos e opcionais na sessão. Os ids dos pares e das regras devem ter sido
+    verificados antes com get_foreign_ids.
+    """
+    table = models.produto_opcional_association
+    insert = _insert(db)
+    linked = unlinked = 0
+    try:
+        if batch.unlink:
+            pairs = list({(pair.product_id, pair.opcional_id) for pair in batch.unlink})
+            unlinked += db.execute(delete(table).where(tuple_(table.c.produto_id, table.c.opcional_id).in_(pairs))).rowcount
+        for rule in batch.unlink_rules:
+            unlinked += db.execute(
+                delete(table).where(
+                    table.c.produto_id.in_(_rule_products(tenant_id, rule)),
+                    table.c.opcional_id.in_(_rule_opcionais(tenant_id, rule)),
+                )
+            ).rowcount
+
+        if batch.link:
+            pairs = {(pair.product_id, pair.opcional_id) for pair in batch.link}
+            stmt = insert(table).values([{"produto_id": product_id, "opcional_id": opcional_id} for product_id, opcional_id in pairs])
+            linked += db.execute(stmt.on_conflict_do_nothing(index_elements=["produto_id", "opcional_id"])).rowcount
+        for rule in batch.link_rules:
+            products = _rule_products(tenant_id, rule).subquery()
+            pairs = (
+                select(products.c.id_produto, models.Opcional.id_opcional)
+                .select_from(products)
+                .join(models.Opcional, true())
+                .where(models.Opcional.tenant_id == tenant_id, models.Opcional.id_opcional.in_(rule.opcional_ids))
+            )
+            stmt = insert(table).from_select(["produto_id", "opcional_id"], pairs)
+            linked += db.execute(stmt.on_conflict_do_nothing(index_elements=["produto_id", "opcional_id"])).rowcount
+        if linked or unlinked:
+            tenant_crud.bump_catalog_version(db, tenant_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logger.info(f"CRUD: Lote de opcionais do tenant '{tenant_id}': {linked} ligação(ões) criada(s), {unlinked} removida(s).")
+    return {"linked": linked, "unlinked": unlinked}
@@ -1,3 +1,7 @@
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from core import models, schemas
 
@@ -20,3 +24,36 @@ def get_interactions_by_user_phone(db: Session, user_phone: str, limit: int = 10
 def get_interaction_by_whatsapp_id(db: Session, whatsapp_message_id: str):
     return db.query(models.Interaction).filter(models.Interaction.whatsapp_message_id == whatsapp_message_id).first()
 
+async def create_interaction_async(db: AsyncSession, interaction: schemas.InteractionCreate):
+    db_interaction = models.Interaction(**interaction.model_dump())
+    db.add(db_interaction)
+    await db.commit()
+    await db.refresh(db_interaction)
+    return db_interaction
+
+async def get_interaction_by_whatsapp_id_async(db: AsyncSession, whatsapp_message_id: str):
+    result = await db.execute(
+        select(models.Interaction).filter(models.Interaction.whatsapp_message_id == whatsapp_message_id)
+    )
+    return result.scalars().first()
+
+async def get_interactions_page_async(db: AsyncSession, tenant_id: str, user_phone: str, limit: int = 20, before: Optional[Tuple[datetime, int]] = None):
+    """
+    Interações de uma conversa, da mais nova para a mais antiga, com paginação keyset:
+    `before` é o (created_at, id) da última linha da página anterior. Carrega só as colunas do histórico.
+    """
+    stmt = (
+        select(
+            models.Interaction.id,
+            models.Interaction.whatsapp_message_id,
+            models.Interaction.message_from_user,
+            models.Interaction.ai_response,
+            models.Interaction.created_at,
+        )
+        .filter(models.Interaction.tenant_id == tenant_id, models.Interaction.user_phone == user_phone)
+    )
+    if before is not None:
+        stmt = stmt.filter(tuple_(models.Interaction.created_at, models.Interaction.id) < tuple_(*before))
+    stmt = stmt.order_by(models.Interaction.created_at.desc(), models.Interaction.id.desc()).limit(limit)
+    result = await db.execute(stmt)
+    return result.all()
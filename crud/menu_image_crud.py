@@ -1,3 +1,5 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from core.database import SessionLocal
 from core import models, schemas
 from typing import List, Optional
@@ -27,6 +29,15 @@ def get_latest_menu_image_by_tenant(db_session_factory, tenant_id: str) -> Optio
     finally:
         db.close()
 
+async def get_latest_menu_image_by_tenant_async(db: AsyncSession, tenant_id: str) -> Optional[models.MenuImage]:
+    result = await db.execute(
+        select(models.MenuImage)
+        .filter(models.MenuImage.tenant_id == tenant_id)
+        .order_by(models.MenuImage.id.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
 def get_menu_image_by_id(db_session_factory, image_id: int) -> Optional[models.MenuImage]:
     db = db_session_factory()
     try:
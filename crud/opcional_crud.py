@@ -1,6 +1,10 @@
 import logging
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from core import models, schemas
+from crud import tenant_crud
+from crud.pagination import keyset_page
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
@@ -10,10 +14,18 @@ def get_opcional(db: Session, opcional_id: int):
 def get_opcionais_by_tenant(db: Session, tenant_id: str, skip: int = 0, limit: int = 100):
     return db.query(models.Opcional).filter(models.Opcional.tenant_id == tenant_id).offset(skip).limit(limit).all()
 
+def get_opcionais_page(db: Session, tenant_id: str, limit: int = 100, after: Optional[int] = None):
+    # Projeção das colunas: sem carregar objetos ORM
+    query = select(
+        models.Opcional.id_opcional, models.Opcional.tenant_id, models.Opcional.nome_opcional, models.Opcional.tipo_opcional, models.Opcional.preco_adicional,
+    ).where(models.Opcional.tenant_id == tenant_id)
+    return keyset_page(db, query, models.Opcional.id_opcional, limit, after)
+
 def create_opcional(db: Session, opcional: schemas.OpcionalCreate, tenant_id: str):
     logger.info(f"CRUD: Criando objeto Opcional no modelo para o tenant '{tenant_id}'.")
     db_opcional = models.Opcional(**opcional.model_dump(), tenant_id=tenant_id)
     db.add(db_opcional)
+    tenant_crud.bump_catalog_version(db, tenant_id)
     db.commit()
     db.refresh(db_opcional)
     logger.info(f"CRUD: Opcional '{db_opcional.nome_opcional}' (ID: {db_opcional.id_opcional}) comitado no banco de dados.")
@@ -25,6 +37,7 @@ def update_opcional(db: Session, opcional_id: int, opcional_data: schemas.Opcion
         update_data = opcional_data.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_opcional, key, value)
+        tenant_crud.bump_catalog_version(db, db_opcional.tenant_id)
         db.commit()
         db.refresh(db_opcional)
     return db_opcional
@@ -33,5 +46,6 @@ def delete_opcional(db: Session, opcional_id: int):
     db_opcional = get_opcional(db, opcional_id)
     if db_opcional:
         db.delete(db_opcional)
+        tenant_crud.bump_catalog_version(db, db_opcional.tenant_id)
         db.commit()
     return db_opcional
\ No newline at end of file
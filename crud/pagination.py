@@ -0,0 +1,15 @@
+from typing import Any, List, Optional, Tuple
+from sqlalchemy.orm import Session
+
+# Listagens paginadas por keyset: WHERE id > :after ORDER BY id LIMIT :limit, sem OFFSET.
+PAGE_MAX_SIZE = 500
+
+def keyset_page(db: Session, query, id_column, limit: int = 100, after: Optional[Any] = None) -> Tuple[List[dict], Optional[Any]]:
+    """Executa a consulta projetada e retorna (linhas como dicts, cursor da próxima página ou None)."""
+    limit = max(1, min(limit, PAGE_MAX_SIZE))
+    if after is not None:
+        query = query.where(id_column > after)
+    # Uma linha a mais indica se existe próxima página.
+    rows = db.execute(query.order_by(id_column).limit(limit + 1)).mappings().all()
+    next_cursor = rows[limit - 1][id_column.key] if len(rows) > limit else None
+    return [dict(row) for row in rows[:limit]], next_cursor
@@ -1,11 +1,12 @@
 from sqlalchemy.orm import Session
 from core import models, schemas
+from core.invalidation_bus import ENTITY_PERSONALITY, publish
 
 def get_personality_by_name(db: Session, name: str):
     return db.query(models.Personality).filter(models.Personality.name == name).first()
 
 def create_personality(db: Session, personality: schemas.PersonalityCreate):
-    db_personality = models.Personality(name=personality.name, prompt=personality.prompt)
+    db_personality = models.Personality(name=personality.name, prompt=personality.prompt, tone_variables=personality.tone_variables)
     db.add(db_personality)
     db.commit()
     db.refresh(db_personality)
@@ -17,11 +18,14 @@ def get_all_personalities(db: Session, skip: int = 0, limit: int = 100):
 def update_personality(db: Session, db_personality: models.Personality, personality: schemas.PersonalityCreate):
     db_personality.name = personality.name
     db_personality.prompt = personality.prompt
+    db_personality.tone_variables = personality.tone_variables
+    publish(db, ENTITY_PERSONALITY, key=db_personality.id)
     db.commit()
     db.refresh(db_personality)
     return db_personality
 
 def delete_personality(db: Session, personality: models.Personality):
+    publish(db, ENTITY_PERSONALITY, key=personality.id)
     db.delete(personality)
     db.commit()
     return {"message": "Personalidade deletada com sucesso"}
@@ -1,27 +1,49 @@
 import logging
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, joinedload, selectinload
 from core import models, schemas
-from typing import List
+from crud import tenant_crud
+from crud.pagination import keyset_page
+from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
 def get_product(db: Session, product_id: int):
     return db.query(models.Product).filter(models.Product.id_produto == product_id).first()
 
+def get_product_by_name_and_tenant_id(db: Session, name: str, tenant_id: str):
+    return (
+        db.query(models.Product)
+        # lower(nome_produto) usa o índice ux_produtos_tenant_id_nome_lower
+        .filter(models.Product.tenant_id == tenant_id, func.lower(models.Product.nome_produto) == name.strip().lower())
+        .first()
+    )
+
 def get_products_by_tenant(db: Session, tenant_id: str, skip: int = 0, limit: int = 100):
     return db.query(models.Product).filter(models.Product.tenant_id == tenant_id).offset(skip).limit(limit).all()
 
+# Colunas da listagem de produtos (sem opcionais e promoções aninhados)
+PRODUCT_LIST_COLUMNS = (
+    models.Product.id_produto, models.Product.tenant_id, models.Product.nome_produto, models.Product.descricao_produto,
+    models.Product.categoria_produto, models.Product.preco_base, models.Product.tempo_preparo_min, models.Product.disponivel_hoje,
+)
+
+def get_products_page(db: Session, tenant_id: str, limit: int = 100, after: Optional[int] = None):
+    query = select(*PRODUCT_LIST_COLUMNS).where(models.Product.tenant_id == tenant_id)
+    return keyset_page(db, query, models.Product.id_produto, limit, after)
+
 def get_all_products_with_details(db: Session, tenant_id: str):
     """
     Busca todos os produtos de um tenant, carregando seus opcionais e promoções
-    de forma otimizada para evitar múltiplas queries (problema N+1).
+    de forma otimizada para evitar múltiplas queries (problema N+1). selectinload faz uma
+    query por coleção; joinedload das duas coleções multiplicaria as linhas (opcionais x promoções).
     """
     return (
         db.query(models.Product)
         .filter(models.Product.tenant_id == tenant_id)
         .options(
-            joinedload(models.Product.opcionais),
-            joinedload(models.Product.promocoes)
+            selectinload(models.Product.opcionais),
+            selectinload(models.Product.promocoes)
         )
         .all()
     )
@@ -30,6 +52,7 @@ def create_product(db: Session, product: schemas.ProductCreate, tenant_id: str):
     logger.info(f"CRUD: Criando objeto Product no modelo para o tenant '{tenant_id}'.")
     db_product = models.Product(**product.model_dump(), tenant_id=tenant_id)
     db.add(db_product)
+    tenant_crud.bump_catalog_version(db, tenant_id)
     db.commit()
     db.refresh(db_product)
     logger.info(f"CRUD: Produto '{db_product.nome_produto}' (ID: {db_product.id_produto}) comitado no banco de dados.")
@@ -41,6 +64,7 @@ def update_product(db: Session, product_id: int, product_data: schemas.ProductUp
         update_data = product_data.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_product, key, value)
+        tenant_crud.bump_catalog_version(db, db_product.tenant_id)
         db.commit()
         db.refresh(db_product)
     return db_product
@@ -49,6 +73,7 @@ def delete_product(db: Session, product_id: int):
     db_product = get_product(db, product_id)
     if db_product:
         db.delete(db_product)
+        tenant_crud.bump_catalog_version(db, db_product.tenant_id)
         db.commit()
     return db_product
 
@@ -56,8 +81,11 @@ def link_opcional_to_product(db: Session, product_id: int, opcional_id: int):
     product = db.query(models.Product).filter(models.Product.id_produto == product_id).first()
     opcional = db.query(models.Opcional).filter(models.Opcional.id_opcional == opcional_id).first()
     if product and opcional:
-        product.opcionais.append(opcional)
-        db.commit()
+        # produto_opcional tem chave única (produto_id, opcional_id)
+        if opcional not in product.opcionais:
+            product.opcionais.append(opcional)
+            tenant_crud.bump_catalog_version(db, product.tenant_id)
+            db.commit()
         return product
     return None
 
@@ -67,6 +95,7 @@ def unlink_opcional_from_product(db: Session, product_id: int, opcional_id: int)
     if product and opcional:
         try:
             product.opcionais.remove(opcional)
+            tenant_crud.bump_catalog_version(db, product.tenant_id)
             db.commit()
             return product
         except ValueError:
@@ -1,6 +1,10 @@
 import logging
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from core import models, schemas
+from crud import tenant_crud
+from crud.pagination import keyset_page
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
@@ -10,10 +14,18 @@ def get_promocao(db: Session, promocao_id: int):
 def get_promocoes_by_tenant(db: Session, tenant_id: str, skip: int = 0, limit: int = 100):
     return db.query(models.Promocao).filter(models.Promocao.tenant_id == tenant_id).offset(skip).limit(limit).all()
 
+def get_promocoes_page(db: Session, tenant_id: str, limit: int = 100, after: Optional[int] = None):
+    # Projeção das colunas: sem carregar objetos ORM
+    query = select(
+        models.Promocao.id_promocao, models.Promocao.tenant_id, models.Promocao.nome_promocao, models.Promocao.descricao_para_ia, models.Promocao.condicao_json, models.Promocao.acao_json, models.Promocao.is_ativa,
+    ).where(models.Promocao.tenant_id == tenant_id)
+    return keyset_page(db, query, models.Promocao.id_promocao, limit, after)
+
 def create_promocao(db: Session, promocao: schemas.PromocaoCreate, tenant_id: str):
     logger.info(f"CRUD: Criando objeto Promocao no modelo para o tenant '{tenant_id}'.")
     db_promocao = models.Promocao(**promocao.model_dump(), tenant_id=tenant_id)
     db.add(db_promocao)
+    tenant_crud.bump_catalog_version(db, tenant_id)
     db.commit()
     db.refresh(db_promocao)
     logger.info(f"CRUD: Promoção '{db_promocao.nome_promocao}' (ID: {db_promocao.id_promocao}) comitada no banco de dados.")
@@ -25,6 +37,7 @@ def update_promocao(db: Session, promocao_id: int, promocao_data: schemas.Promoc
         update_data = promocao_data.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_promocao, key, value)
+        tenant_crud.bump_catalog_version(db, db_promocao.tenant_id)
         db.commit()
         db.refresh(db_promocao)
     return db_promocao
@@ -33,5 +46,6 @@ def delete_promocao(db: Session, promocao_id: int):
     db_promocao = get_promocao(db, promocao_id)
     if db_promocao:
         db.delete(db_promocao)
+        tenant_crud.bump_catalog_version(db, db_promocao.tenant_id)
         db.commit()
     return db_promocao
\ No newline at end of file
@@ -1,10 +1,23 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from core import models, schemas
+from core.invalidation_bus import ENTITY_CATALOG, ENTITY_PERSONALITY, ENTITY_TENANT, publish
+from crud.pagination import keyset_page
 from typing import Optional
 
 def get_tenant_by_id(db: Session, tenant_id: str):
     return db.query(models.Tenant).filter(models.Tenant.tenant_id == tenant_id).first()
 
+async def get_tenant_by_id_async(db: AsyncSession, tenant_id: str):
+    # A personalidade é carregada junto, pois lazy loading não é permitido em sessões assíncronas.
+    result = await db.execute(
+        select(models.Tenant)
+        .options(selectinload(models.Tenant.personality))
+        .filter(models.Tenant.tenant_id == tenant_id)
+    )
+    return result.scalars().first()
+
 def create_tenant(db: Session, tenant: schemas.TenantCreate, conteudo_loja: str):
     from .personality_crud import create_personality, get_personality_by_name
 
@@ -30,9 +43,15 @@ def create_tenant(db: Session, tenant: schemas.TenantCreate, conteudo_loja: str)
         latitude=str(tenant.latitude),
         longitude=str(tenant.longitude),
         url=tenant.url,
-        freight_config=tenant.freight_config
+        freight_config=tenant.freight_config,
+        intent_rules=tenant.intent_rules,
+        response_templates=tenant.response_templates
     )
     db.add(db_tenant)
+    # Remove um possível cache negativo de quando o tenant ainda não existia
+    publish(db, ENTITY_TENANT, tenant_id=db_tenant.tenant_id)
+    # O prompt de uma personalidade existente pode ter sido alterado acima
+    publish(db, ENTITY_PERSONALITY, key=db_personality.id)
     db.commit()
     db.refresh(db_tenant)
     return db_tenant
@@ -59,6 +78,8 @@ def create_tenant_instancia(db: Session, tenant_data: schemas.TenantInstancia):
         url=tenant_data.url
     )
     db.add(db_tenant)
+    # Remove um possível cache negativo de quando o tenant ainda não existia
+    publish(db, ENTITY_TENANT, tenant_id=db_tenant.tenant_id)
     db.commit()
     db.refresh(db_tenant)
     return db_tenant
@@ -66,6 +87,32 @@ def create_tenant_instancia(db: Session, tenant_data: schemas.TenantInstancia):
 def get_all_tenants(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Tenant).offset(skip).limit(limit).all()
 
+# Colunas da listagem de tenants (sem config_ai e sem relacionamentos)
+TENANT_LIST_COLUMNS = (
+    models.Tenant.id, models.Tenant.tenant_id, models.Tenant.nome_loja, models.Tenant.is_active,
+    models.Tenant.url, models.Tenant.endereco, models.Tenant.cep,
+)
+
+def get_tenants_page(db: Session, limit: int = 100, after: Optional[int] = None):
+    return keyset_page(db, select(*TENANT_LIST_COLUMNS), models.Tenant.id, limit, after)
+
+def get_catalog_version(db: Session, tenant_id: str) -> Optional[int]:
+    return db.execute(select(models.Tenant.catalog_version).where(models.Tenant.tenant_id == tenant_id)).scalar()
+
+def bump_catalog_version(db: Session, tenant_id: str):
+    """
+    Incrementa a versão do catálogo do tenant e publica a invalidação com a nova versão.
+    Sem commit: vai na mesma transação da alteração, e os snapshots do catálogo em memória
+    (core/catalog_cache.py) são invalidados quando ela for confirmada.
+    """
+    version = db.execute(
+        update(models.Tenant)
+        .where(models.Tenant.tenant_id == tenant_id)
+        .values(catalog_version=models.Tenant.catalog_version + 1)
+        .returning(models.Tenant.catalog_version)
+    ).scalar()
+    publish(db, ENTITY_CATALOG, tenant_id=tenant_id, version=version)
+
 def update_tenant(db: Session, tenant_id: str, tenant_data: schemas.TenantUpdateSchema, conteudo_loja: Optional[str] = None):
     from .personality_crud import create_personality, get_personality_by_name, update_personality
 
@@ -101,6 +148,7 @@ def update_tenant(db: Session, tenant_id: str, tenant_data: schemas.TenantUpdate
         
         db_tenant.personality = db_personality
 
+    publish(db, ENTITY_TENANT, tenant_id=tenant_id)
     db.commit()
     db.refresh(db_tenant)
     return db_tenant
@@ -111,6 +159,7 @@ def toggle_tenant_status(db: Session, tenant_id: str, is_active: bool):
         return None
     
     db_tenant.is_active = is_active
+    publish(db, ENTITY_TENANT, tenant_id=tenant_id)
     db.commit()
     db.refresh(db_tenant)
     return db_tenant
@@ -121,6 +170,7 @@ def delete_tenant(db: Session, tenant_id: str):
         return None
     
     db.delete(db_tenant)
+    publish(db, ENTITY_TENANT, tenant_id=tenant_id)
     db.commit()
     return {"message": "Cliente removido com sucesso"}
 
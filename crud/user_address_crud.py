@@ -1,5 +1,7 @@
 from core.database import SessionLocal
 from core import models, schemas
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import func
 
 def get_user_address(db_session_factory, user_phone: str, tenant_id: str):
@@ -34,3 +36,29 @@ def create_or_update_user_address(db_session_factory, address: schemas.UserAddre
         return db_address
     finally:
         db.close()
+
+async def get_user_address_async(db: AsyncSession, user_phone: str, tenant_id: str):
+    result = await db.execute(
+        select(models.UserAddress)
+        .filter(
+            models.UserAddress.user_phone == user_phone,
+            models.UserAddress.tenant_id == tenant_id
+        )
+        .order_by(models.UserAddress.last_used_at.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+async def create_or_update_user_address_async(db: AsyncSession, address: schemas.UserAddressCreate):
+    db_address = await get_user_address_async(db, user_phone=address.user_phone, tenant_id=address.tenant_id)
+    if db_address:
+        db_address.address_text = address.address_text
+        db_address.latitude = address.latitude
+        db_address.longitude = address.longitude
+        db_address.last_used_at = func.now()
+    else:
+        db_address = models.UserAddress(**address.model_dump())
+        db.add(db_address)
+    await db.commit()
+    await db.refresh(db_address)
+    return db_address
@@ -0,0 +1,197 @@
+"""
+Benchmark dos índices das consultas do /ai (migração 4c7e2a9f1d38).
+
+    DATABASE_URL=postgresql://... python scripts/benchmark_indexes.py --interactions 500000
+    python scripts/benchmark_indexes.py --cleanup
+
+Popula o banco com volumes realistas em tenants "bench_*", roda EXPLAIN (ANALYZE, BUFFERS)
+de cada consulta com e sem os índices e mostra os tempos. O "antes" é medido dentro de uma
+transação que remove os índices e é revertida no final (DDL é transacional no Postgres), então
+a migração precisa estar aplicada. Use um banco de teste: o DROP INDEX bloqueia as tabelas
+durante a medição.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import importlib.util
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+
+from core.database import engine
+
+BENCH_PREFIX = "bench_"
+MIGRATION_PATH = os.path.join(os.path.dirname(__file__), '..', 'alembic', 'versions', '4c7e2a9f1d38_add_hot_path_indexes.py')
+
+# Consultas equivalentes às do CRUD e da ferramenta SQL no caminho do /ai.
+QUERIES = {
+    "interactions por telefone": (
+        "SELECT * FROM interactions WHERE user_phone = :phone ORDER BY created_at DESC LIMIT 10"
+    ),
+    "endereço mais recente": (
+        "SELECT * FROM user_addresses WHERE user_phone = :phone AND tenant_id = :tenant_id "
+        "ORDER BY last_used_at DESC LIMIT 1"
+    ),
+    "última imagem do cardápio": (
+        "SELECT * FROM menu_images WHERE tenant_id = :tenant_id ORDER BY id DESC LIMIT 1"
+    ),
+    "promoções ativas": (
+        "SELECT * FROM promocoes WHERE tenant_id = :tenant_id AND is_ativa = true"
+    ),
+    "produto por nome": (
+        "SELECT * FROM produtos WHERE tenant_id = :tenant_id AND lower(nome_produto) = lower(:nome) LIMIT 1"
+    ),
+    "produtos LIKE '%termo%'": (
+        "SELECT * FROM produtos WHERE nome_produto ILIKE '%' || :termo || '%' LIMIT 20"
+    ),
+}
+
+SEED_SQL = [
+    """
+    INSERT INTO tenants (tenant_id, nome_loja, config_ai, is_active)
+    SELECT 'bench_' || t, 'Loja Benchmark ' || t, '{}', true
+    FROM generate_series(1, :tenants) AS t
+    """,
+    """
+    INSERT INTO produtos (tenant_id, nome_produto, descricao_produto, categoria_produto, preco_base, disponivel_hoje)
+    SELECT 'bench_' || (1 + i % :tenants),
+           (ARRAY['Pizza','Hambúrguer','Pastel','Açaí','Esfiha','Lasanha','Salada','Suco'])[1 + i % 8] || ' ' || md5(i::text),
+           'Descrição do produto ' || i,
+           (ARRAY['Lanches','Pizzas','Bebidas','Sobremesas'])[1 + i % 4],
+           10 + (i % 50), 'Sim'
+    FROM generate_series(1, :tenants * :products) AS i
+    """,
+    """
+    INSERT INTO promocoes (tenant_id, nome_promocao, descricao_para_ia, is_ativa)
+    SELECT 'bench_' || (1 + i % :tenants), 'Promoção ' || i, 'Promoção de teste ' || i, i % 3 <> 0
+    FROM generate_series(1, :tenants * 20) AS i
+    """,
+    """
+    INSERT INTO menu_images (tenant_id, image_url, description)
+    SELECT 'bench_' || (1 + i % :tenants), 'https://example.com/cardapio/' || i || '.jpg', 'Cardápio ' || i
+    FROM generate_series(1, :tenants * 5) AS i
+    """,
+    """
+    INSERT INTO user_addresses (user_phone, tenant_id, address_text, last_used_at)
+    SELECT '5511' || lpad((i % :users)::text, 9, '0'), 'bench_' || (1 + i % :tenants),
+           'Rua de Teste, ' || i, now() - (i || ' minutes')::interval
+    FROM generate_series(1, :users * 2) AS i
+    """,
+    """
+    INSERT INTO interactions (user_phone, whatsapp_message_id, message_from_user, ai_response, created_at, tenant_id)
+    SELECT '5511' || lpad((i % :users)::text, 9, '0'), 'bench_' || i, 'Mensagem ' || i, 'Resposta ' || i,
+           now() - (i || ' seconds')::interval, 'bench_' || (1 + i % :tenants)
+    FROM generate_series(1, :interactions) AS i
+    """,
+]
+
+CLEANUP_SQL = [
+    "DELETE FROM interactions WHERE tenant_id LIKE 'bench\\_%'",
+    "DELETE FROM user_addresses WHERE tenant_id LIKE 'bench\\_%'",
+    "DELETE FROM menu_images WHERE tenant_id LIKE 'bench\\_%'",
+    "DELETE FROM promocoes WHERE tenant_id LIKE 'bench\\_%'",
+    "DELETE FROM produtos WHERE tenant_id LIKE 'bench\\_%'",
+    "DELETE FROM tenants WHERE tenant_id LIKE 'bench\\_%'",
+]
+
+
+def _migration_indexes():
+    spec = importlib.util.spec_from_file_location("hot_path_indexes", MIGRATION_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # ix_produtos_tenant_id_nome_lower foi substituído pelo índice único da migração b5d8e3a1c427.
+    return [name for name, _, _ in module.COMPOSITE_INDEXES] + [module.TRGM_INDEX[0], "ux_produtos_tenant_id_nome_lower"]
+
+
+def seed(conn, tenants: int, products: int, users: int, interactions: int):
+    exists = conn.execute(text("SELECT 1 FROM tenants WHERE tenant_id LIKE 'bench\\_%' LIMIT 1")).first()
+    if exists:
+        print("Dados de benchmark já existem; use --cleanup para recriar.")
+        return
+    params = {"tenants": tenants, "products": products, "users": users, "interactions": interactions}
+    for statement in SEED_SQL:
+        conn.execute(text(statement), params)
+    for table in ("tenants", "produtos", "promocoes", "menu_images", "user_addresses", "interactions"):
+        conn.execute(text(f"ANALYZE {table}"))
+    print(f"Seed: {tenants} tenants, {tenants * products} produtos, {users} usuários, {interactions} interações.")
+
+
+def explain(conn, sql: str, params: dict, runs: int) -> dict:
+    timings, plan = [], None
+    for _ in range(runs):
+        result = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params).scalar()
+        plan = result if isinstance(result, list) else json.loads(result)
+        timings.append(plan[0]["Execution Time"])
+    root = plan[0]["Plan"]
+    return {"ms": round(statistics.median(timings), 3), "node": root.get("Node Type"), "index": _find_index(root)}
+
+
+def _find_index(node: dict):
+    if node.get("Index Name"):
+        return node["Index Name"]
+    for child in node.get("Plans", []):
+        found = _find_index(child)
+        if found:
+            return found
+    return None
+
+
+def run_queries(conn, params: dict, runs: int) -> dict:
+    return {name: explain(conn, sql, params, runs) for name, sql in QUERIES.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN ANALYZE das consultas do /ai antes e depois dos índices.")
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--products", type=int, default=400, help="Produtos por tenant.")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--interactions", type=int, default=500000)
+    parser.add_argument("--runs", type=int, default=5, help="Execuções por consulta (mediana).")
+    parser.add_argument("--output", help="Grava os resultados em JSON neste arquivo.")
+    parser.add_argument("--cleanup", action="store_true", help="Remove os dados de benchmark e sai.")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        parser.error("O benchmark precisa de um DATABASE_URL do Postgres.")
+
+    with engine.begin() as conn:
+        if args.cleanup:
+            for statement in CLEANUP_SQL:
+                conn.execute(text(statement))
+            print("Dados de benchmark removidos.")
+            return
+        seed(conn, args.tenants, args.products, args.users, args.interactions)
+
+    params = {"phone": "5511000000042", "tenant_id": f"{BENCH_PREFIX}7", "termo": "zza 1"}
+    with engine.connect() as conn:
+        # Um produto real do tenant para a busca por nome
+        params["nome"] = conn.execute(text("SELECT nome_produto FROM produtos WHERE tenant_id = :t LIMIT 1"), {"t": params["tenant_id"]}).scalar() or ""
+
+        after = run_queries(conn, params, args.runs)
+        conn.rollback()
+
+        transaction = conn.begin()
+        try:
+            for index_name in _migration_indexes():
+                conn.execute(text(f'DROP INDEX IF EXISTS "{index_name}"'))
+            before = run_queries(conn, params, args.runs)
+        finally:
+            transaction.rollback()
+
+    print(f"{'Consulta':<30} {'Antes (ms)':>12} {'Depois (ms)':>12}  Plano depois")
+    print("-" * 90)
+    for name in QUERIES:
+        plan = f"{after[name]['node']} ({after[name]['index'] or '-'})"
+        print(f"{name:<30} {before[name]['ms']:>12} {after[name]['ms']:>12}  {plan}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "before": before, "after": after}, f, ensure_ascii=False, indent=2)
+        print(f"Resultados gravados em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
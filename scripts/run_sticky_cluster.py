@@ -0,0 +1,56 @@
+"""
+Sobe um cluster local para testar o roteamento por conversa:
+
+    python scripts/run_sticky_cluster.py --nodes 3 --base-port 8001 --front-port 8000
+
+Cada nó é um processo uvicorn com a API (api.main:app) e o StickyRoutingMiddleware ativo,
+então uma mensagem enviada a qualquer nó é processada pelo dono da conversa. O processo
+de entrada (api.sticky_routing) escuta em --front-port e faz o mesmo roteamento com failover.
+Ctrl+C encerra todos os processos.
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster local com roteamento por conversa.")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=8001)
+    parser.add_argument("--front-port", type=int, default=8000, help="0 para não subir o processo de entrada.")
+    args = parser.parse_args()
+
+    node_urls = [f"http://{args.host}:{args.base_port + i}" for i in range(args.nodes)]
+    processes = []
+    for i, url in enumerate(node_urls):
+        env = dict(os.environ, STICKY_ROUTING_NODES=",".join(node_urls), STICKY_ROUTING_SELF=url)
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api.main:app", "--host", args.host, "--port", str(args.base_port + i)],
+            env=env,
+        ))
+        print(f"Nó {i + 1}: {url}")
+
+    if args.front_port:
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "api.sticky_routing", "--nodes", ",".join(node_urls),
+             "--host", args.host, "--port", str(args.front_port)],
+        ))
+        print(f"Entrada: http://{args.host}:{args.front_port}")
+
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
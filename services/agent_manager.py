@@ -4,7 +4,7 @@ from starlette.concurrency import run_in_threadpool
 
 from core.database import SessionLocal
 from crud import tenant_crud
-from core.vector_db import VectorDBManager
+from core.vector_db import get_vector_db_manager, invalidate_vector_db_manager
 
 from sqlalchemy.orm import Session
 
@@ -14,7 +14,9 @@ async def load_data_to_vector_db(db: Session, tenant_id: str):
     logger.info(f"Iniciando carregamento de dados para o VectorDB do tenant: {tenant_id}")
     db = SessionLocal()
     try:
-        vector_db_manager = VectorDBManager(db, collection_name=tenant_id)
+        # O config_ai do tenant pode ter mudado: descarta o manager em cache antes de recarregar.
+        invalidate_vector_db_manager(tenant_id)
+        vector_db_manager = get_vector_db_manager(tenant_id)
 
         tenant = await run_in_threadpool(tenant_crud.get_tenant_by_id, db, tenant_id)
 
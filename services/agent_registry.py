@@ -0,0 +1,199 @@
+import os
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from agno.agent import Agent
+from agno.memory.v2.memory import Memory
+from agno.workflow.v2 import Workflow, Router, Step
+from agno.workflow.v2.step import StepInput, StepOutput
+
+from core.memory_db import new_memory
+from services.agents.human_handoff_agent import get_human_handoff_agent
+from services.agents.menu_agent import get_menu_agent
+from services.agents.freight_agent import get_freight_agent
+from services.agents.file_understanding_agent import get_file_understanding_agent
+from services.agents.order_taking_agent import get_order_taking_agent
+from services.agents.receptionist_agent import get_receptionist_agent
+from services.agents.response_formulation_agent import get_response_formulation_agent
+
+logger = logging.getLogger(__name__)
+
+# IDs dos modelos de IA usados pelo workflow
+ORCHESTRATOR_MODEL_ID = "models/gemini-2.0-flash-lite"
+GENERAL_AGENT_MODEL_ID = "models/gemini-2.0-flash"
+ORDER_TAKING_AGENT_MODEL_ID = "models/gemini-2.0-flash"
+HUMAN_HANDOFF_MODEL_ID = "models/gemini-2.0-flash-lite"
+MENU_AGENT_MODEL_ID = "models/gemini-2.0-flash-lite"
+FREIGHT_AGENT_MODEL_ID = "models/gemini-2.0-flash"
+FILE_UNDERSTANDING_MODEL_ID = "models/gemini-2.0-flash"
+RECEPTIONIST_MODEL_ID = "models/gemini-2.0-flash-lite"
+RESPONSE_FORMULATION_MODEL_ID = "models/gemini-2.0-flash"
+
+# Quantidade máxima de runtimes ociosos mantidos por par de chaves de API.
+AGENT_POOL_MAX_IDLE = int(os.getenv("AGENT_POOL_MAX_IDLE", "16"))
+
+
+def _delegate(handler_name: str):
+    """
+    Cria um executor de Step que repassa a execução para o OrchestratorAgent
+    da conversa atual, recebido via additional_data["orchestrator"].
+    """
+    async def executor(step_input: StepInput) -> StepOutput:
+        orchestrator = step_input.additional_data["orchestrator"]
+        return await getattr(orchestrator, handler_name)(step_input)
+
+    executor.__name__ = handler_name
+    return executor
+
+
+class AgentRuntime:
+    """
+    Agentes, steps e workflow do chatbot, construídos uma única vez e reaproveitados
+    entre conversas. Nenhum dado da conversa (session_id, user_id, tenant_id) é guardado
+    aqui: tudo chega em tempo de execução via additional_data, e o session_id/user_id de
+    cada agente é passado em cada arun() e limpo por reset() ao devolver o runtime.
+    """
+
+    def __init__(self, gemini_api_key: str, gemini_api_key_2: str, memory: Memory):
+        self.gemini_api_key = gemini_api_key
+        self.gemini_api_key_2 = gemini_api_key_2
+        self.memory = memory
+
+        self.human_handoff_agent = get_human_handoff_agent(model_id=HUMAN_HANDOFF_MODEL_ID, api_key=gemini_api_key)
+        self.menu_agent = get_menu_agent(model_id=MENU_AGENT_MODEL_ID, api_key=gemini_api_key)
+        self.freight_agent = get_freight_agent(model_id=FREIGHT_AGENT_MODEL_ID, api_key=gemini_api_key_2)
+        self.file_understanding_agent = get_file_understanding_agent(model_id=FILE_UNDERSTANDING_MODEL_ID, api_key=gemini_api_key_2)
+        self.order_taking_agent = get_order_taking_agent(model_id=ORDER_TAKING_AGENT_MODEL_ID, api_key=gemini_api_key_2, memory=memory)
+        self.receptionist_agent = get_receptionist_agent(model_id=RECEPTIONIST_MODEL_ID, api_key=gemini_api_key)
+        self.response_formulation_agent = get_response_formulation_agent(model_id=RESPONSE_FORMULATION_MODEL_ID, api_key=gemini_api_key_2, memory=memory)
+
+        self.receptionist_step = Step(
+            name="receptionist",
+            executor=_delegate("_handle_reception_wrapper"),
+            description="Analisa a mensagem do usuário e identifica as intenções."
+        )
+        self.task_fan_out_step = Step(
+            name="task_fan_out",
+            executor=_delegate("_handle_task_fan_out_wrapper"),
+            description="Executa em paralelo os handlers de todas as tarefas identificadas."
+        )
+        self.finalize_step = Step(
+            name="finalize",
+            executor=_delegate("_handle_finalize_wrapper"),
+            description="Entrega a resposta já pronta, sem chamar o LLM."
+        )
+        self.response_formulation_step = Step(
+            name="response_formulation",
+            executor=_delegate("_handle_response_formulation_wrapper"),
+            description="Formula a resposta final para o usuário."
+        )
+
+        self.workflow = Workflow(
+            name="Chatbot Workflow",
+            steps=[
+                self.receptionist_step,
+                self.task_fan_out_step,
+                Router(
+                    name="Main Router",
+                    selector=self._route_after_tasks,
+                    choices=[
+                        self.finalize_step,
+                        self.response_formulation_step,
+                    ]
+                )
+            ]
+        )
+
+    @property
+    def agents(self) -> List[Agent]:
+        return [
+            self.human_handoff_agent, self.menu_agent, self.freight_agent, self.file_understanding_agent,
+            self.order_taking_agent, self.receptionist_agent, self.response_formulation_agent,
+        ]
+
+    def bind_memory(self, memory: Optional[Memory]):
+        """Troca a Memory dos agentes que usam memória (uma nova a cada checkout)."""
+        self.memory = memory
+        self.order_taking_agent.memory = memory
+        self.response_formulation_agent.memory = memory
+
+    def reset(self):
+        """Descarta a sessão e a memória da última conversa atendida, antes de o runtime voltar ao pool."""
+        self.bind_memory(None)
+        for agent in self.agents:
+            agent.session_id = None
+            agent.user_id = None
+        self.workflow.session_id = None
+        self.workflow.user_id = None
+
+    async def _route_after_tasks(self, step_input: StepInput) -> Step:
+        # O task_fan_out_step indica se a resposta ainda precisa ser formulada pelo LLM
+        if step_input.additional_data.get("requires_formulation", True):
+            return self.response_formulation_step
+        return self.finalize_step
+
+
+class AgentRegistry:
+    """
+    Registro de AgentRuntime por processo, indexado pelas chaves de API do Gemini.
+
+    Os objetos do agno guardam estado da execução (run_id, run_response, etc.) na própria
+    instância, então um mesmo runtime não pode atender duas mensagens ao mesmo tempo.
+    Por isso o registro mantém um pool: cada mensagem pega um runtime ocioso (ou cria um
+    novo se todos estiverem em uso) e o devolve ao final. Em regime, o número de runtimes
+    acompanha o pico de concorrência e nada é construído no caminho de cada mensagem.
+    """
+
+    def __init__(self, max_idle: int = AGENT_POOL_MAX_IDLE):
+        self.max_idle = max_idle
+        self._idle: Dict[Tuple[str, str], List[AgentRuntime]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_api_keys() -> Tuple[str, str]:
+        gemini_api_key = os.getenv("GEMINI_API_KEY")
+        if not gemini_api_key:
+            raise ValueError("A variável de ambiente GEMINI_API_KEY não foi definida.")
+
+        gemini_api_key_2 = os.getenv("GEMINI_API_KEY_2")
+        if not gemini_api_key_2:
+            raise ValueError("A variável de ambiente GEMINI_API_KEY_2 não foi definida.")
+
+        return gemini_api_key, gemini_api_key_2
+
+    def checkout(self) -> AgentRuntime:
+        """Retira um runtime ocioso do pool, construindo um novo se necessário."""
+        key = self._get_api_keys()
+        with self._lock:
+            idle = self._idle.get(key)
+            runtime = idle.pop() if idle else None
+
+        if runtime is None:
+            logger.info("AgentRegistry: nenhum runtime ocioso disponível, construindo um novo.")
+            return AgentRuntime(gemini_api_key=key[0], gemini_api_key_2=key[1], memory=new_memory())
+        runtime.bind_memory(new_memory())
+        return runtime
+
+    def checkin(self, runtime: AgentRuntime):
+        """Devolve um runtime ao pool após o fim da execução."""
+        runtime.reset()
+        key = (runtime.gemini_api_key, runtime.gemini_api_key_2)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(runtime)
+
+    def warm_up(self, size: int = 1):
+        """Constrói runtimes antecipadamente, fora do caminho da primeira mensagem."""
+        runtimes = [self.checkout() for _ in range(size)]
+        for runtime in runtimes:
+            self.checkin(runtime)
+        logger.info(f"AgentRegistry: {size} runtime(s) pré-construído(s).")
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+
+
+agent_registry = AgentRegistry()
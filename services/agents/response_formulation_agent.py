@@ -17,6 +17,7 @@ def get_response_formulation_agent(model_id: str, api_key: str, memory: Memory):
         - Se houver itens de pedido, confirme-os de forma clara.
         - Se houver promoções, apresente-as de forma convidativa, usando a 'descricao_para_ia'.
         - Se houver sugestões de upsell/cross-sell, integre-as de forma natural.
+        - Se 'failed_tasks' não estiver vazio, diga ao cliente que essas solicitações não puderam ser atendidas agora, sem inventar resultados.
         - Mantenha um tom de voz consistente com a personalidade da loja.
         - Evite repetições e seja conciso.
         - Sempre termine com uma pergunta que guie o cliente para o próximo passo.
@@ -0,0 +1,329 @@
+import os
+import csv
+import codecs
+import json
+import time
+import logging
+import zipfile
+import unicodedata
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from crud import catalog_crud, tenant_crud
+
+logger = logging.getLogger(__name__)
+
+# Linhas validadas e gravadas por vez (um INSERT multi-row por lote).
+CATALOG_IMPORT_CHUNK_SIZE = int(os.getenv("CATALOG_IMPORT_CHUNK_SIZE", "500"))
+CATALOG_IMPORT_MAX_ROWS = int(os.getenv("CATALOG_IMPORT_MAX_ROWS", "50000"))
+
+# Ordem de gravação: os itens antes das ligações que dependem deles.
+ENTITIES = ("opcionais", "promocoes", "produtos", "produto_opcional", "produto_promocao")
+
+COLUMNS = {
+    "produtos": ("nome_produto", "descricao_produto", "categoria_produto", "preco_base", "tempo_preparo_min", "disponivel_hoje"),
+    "opcionais": ("nome_opcional", "tipo_opcional", "preco_adicional"),
+    "promocoes": ("nome_promocao", "descricao_para_ia", "condicao_json", "acao_json", "is_ativa"),
+    "produto_opcional": ("produto", "opcional"),
+    "produto_promocao": ("produto", "promocao"),
+}
+REQUIRED = {
+    "produtos": ("nome_produto", "preco_base"),
+    "opcionais": ("nome_opcional", "tipo_opcional"),
+    "promocoes": ("nome_promocao",),
+    "produto_opcional": ("produto", "opcional"),
+    "produto_promocao": ("produto", "promocao"),
+}
+# Nomes de coluna aceitos além dos oficiais (inclui o formato antigo do README: name/price).
+COLUMN_ALIASES = {
+    "produtos": {"name": "nome_produto", "nome": "nome_produto", "price": "preco_base", "preco": "preco_base",
+                 "descricao": "descricao_produto", "categoria": "categoria_produto", "tempo_preparo": "tempo_preparo_min"},
+    "opcionais": {"nome": "nome_opcional", "tipo": "tipo_opcional", "preco": "preco_adicional"},
+    "promocoes": {"nome": "nome_promocao", "descricao": "descricao_para_ia", "condicao": "condicao_json",
+                  "acao": "acao_json", "ativa": "is_ativa"},
+    "produto_opcional": {"nome_produto": "produto", "nome_opcional": "opcional"},
+    "produto_promocao": {"nome_produto": "produto", "nome_promocao": "promocao"},
+}
+# Valor gravado quando a coluna existe no arquivo mas a célula está vazia.
+DEFAULTS = {
+    "produtos": {"disponivel_hoje": "Sim"},
+    "opcionais": {"preco_adicional": 0.0},
+    "promocoes": {"is_ativa": True},
+}
+# entidade de ligação -> (coluna do item, entidade do item)
+LINKS = {
+    "produto_opcional": ("opcional", "opcionais"),
+    "produto_promocao": ("promocao", "promocoes"),
+}
+
+TRUE_VALUES = {"sim", "s", "true", "1", "yes", "y", "verdadeiro"}
+FALSE_VALUES = {"nao", "n", "false", "0", "no", "falso"}
+TIPOS_OPCIONAL = {"adicional": "Adicional", "remocao": "Remoção"}
+
+
+def _normalize(value) -> str:
+    text = unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode("ascii")
+    return text.strip().lower().replace(" ", "_")
+
+
+def _map_header(entity: str, header) -> Tuple[List[Optional[str]], List[str]]:
+    """Colunas do arquivo -> colunas da entidade (None nas ignoradas) e os nomes das ignoradas."""
+    mapped, ignored = [], []
+    for cell in header:
+        name = _normalize(cell) if cell is not None else ""
+        name = COLUMN_ALIASES[entity].get(name, name)
+        if name in COLUMNS[entity] and name not in mapped:
+            mapped.append(name)
+        else:
+            mapped.append(None)
+            if name:
+                ignored.append(str(cell))
+    missing = [column for column in REQUIRED[entity] if column not in mapped]
+    if missing:
+        raise ValueError(f"'{entity}': colunas obrigatórias ausentes: {', '.join(missing)}.")
+    return mapped, ignored
+
+
+def _clean(value):
+    if isinstance(value, str):
+        return value.strip() or None
+    return value
+
+
+def _iter_rows(mapped: List[Optional[str]], rows) -> Iterator[Tuple[int, dict]]:
+    """(número da linha no arquivo, valores) das linhas não vazias. O cabeçalho é a linha 1."""
+    columns = [column for column in mapped if column]
+    for line, values in enumerate(rows, start=2):
+        row = dict.fromkeys(columns)
+        row.update((column, _clean(value)) for column, value in zip(mapped, values) if column)
+        if any(value is not None for value in row.values()):
+            yield line, row
+
+
+def _xlsx_sources(fileobj, entity: Optional[str]):
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    # read_only lê as linhas sob demanda, sem carregar a planilha inteira em memória.
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException) as e:
+        raise ValueError(f"Arquivo .xlsx inválido: {e}") from e
+    try:
+        sheets = {_normalize(name): workbook[name] for name in workbook.sheetnames}
+        if entity:
+            # Com a entidade informada, a primeira aba é usada se não houver uma com o nome dela.
+            sheets.setdefault(entity, workbook[workbook.sheetnames[0]])
+        for name in ENTITIES:
+            if name not in sheets or (entity and name != entity):
+                continue
+            rows = sheets[name].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            mapped, ignored = _map_header(name, header)
+            yield name, [column for column in mapped if column], ignored, _iter_rows(mapped, rows)
+    finally:
+        workbook.close()
+
+
+def _csv_sources(fileobj, entity: Optional[str]):
+    if not entity:
+        raise ValueError("Informe a entidade do CSV (produtos, opcionais, promocoes, produto_opcional ou produto_promocao).")
+    # Planilhas exportadas no Brasil costumam usar ";" como separador.
+    sample = fileobj.read(8192).decode("utf-8-sig", errors="ignore")
+    fileobj.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(codecs.iterdecode(fileobj, "utf-8-sig"), dialect)
+    header = next(reader, None)
+    if header is not None:
+        mapped, ignored = _map_header(entity, header)
+        yield entity, [column for column in mapped if column], ignored, _iter_rows(mapped, reader)
+
+
+def _chunks(rows: Iterator[Tuple[int, dict]], size: int) -> Iterator[List[Tuple[int, dict]]]:
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _Validator:
+    """Validação vetorizada (pandas) de um lote de linhas. Guarda só o primeiro erro de cada linha."""
+
+    def __init__(self, chunk: List[Tuple[int, dict]], columns: List[str]):
+        self.df = pd.DataFrame([row for _, row in chunk], index=[line for line, _ in chunk], columns=columns, dtype=object)
+        self.errors = pd.Series("", index=self.df.index, dtype=object)
+
+    def fail(self, mask: pd.Series, message: str):
+        self.errors = self.errors.mask(mask & (self.errors == ""), message)
+
+    def required(self, column: str):
+        self.fail(self.df[column].isna(), f"{column} é obrigatório")
+
+    def number(self, column: str, integer: bool = False):
+        if column not in self.df:
+            return
+        series = self.df[column]
+        parsed = pd.to_numeric(series.astype(str).str.replace(",", ".", regex=False), errors="coerce")
+        invalid = series.notna() & (parsed.isna() | (parsed < 0))
+        if integer:
+            invalid |= parsed.notna() & (parsed % 1 != 0)
+        kind = "um número inteiro" if integer else "um número"
+        self.fail(invalid, f"{column} deve ser {kind} maior ou igual a zero")
+        parsed = parsed.astype(object).where(parsed.notna(), None)
+        self.df[column] = parsed.map(lambda v: int(v) if v is not None else None) if integer else parsed
+
+    def choice(self, column: str, values: Dict[str, object], message: str):
+        if column not in self.df:
+            return
+        series = self.df[column]
+        normalized = series.map(lambda v: values.get(_normalize(v)) if v is not None else None)
+        self.fail(series.notna() & normalized.isna(), message)
+        self.df[column] = normalized
+
+    def json_object(self, column: str):
+        if column not in self.df:
+            return
+
+        def parse(value):
+            if value is None or isinstance(value, dict):
+                return value
+            try:
+                parsed = json.loads(value)
+            except (TypeError, ValueError):
+                return ValueError
+            return parsed if isinstance(parsed, dict) else ValueError
+
+        parsed = self.df[column].map(parse)
+        self.fail(parsed.map(lambda v: v is ValueError), f"{column} deve ser um objeto JSON")
+        self.df[column] = parsed.map(lambda v: None if v is ValueError else v)
+
+    def unique(self, column: str, seen: Dict[str, int]):
+        """Nomes repetidos no arquivo: vale a primeira ocorrência."""
+        for line, value in self.df[column].items():
+            if value is None or self.errors[line]:
+                continue
+            key = str(value).lower()
+            if key in seen:
+                self.errors[line] = f"{column} repetido no arquivo (linha {seen[key]})"
+            else:
+                seen[key] = line
+
+    def valid_rows(self, defaults: Dict[str, object]) -> Tuple[List[int], List[dict]]:
+        valid = self.df[self.errors == ""].astype(object)
+        valid = valid.where(valid.notna(), None)
+        for column, default in defaults.items():
+            if column in valid:
+                valid[column] = valid[column].map(lambda v: default if v is None else v)
+        return list(valid.index), valid.to_dict("records")
+
+    def error_rows(self) -> List[Tuple[int, str]]:
+        return [(line, message) for line, message in self.errors.items() if message]
+
+
+def _validate(entity: str, chunk: List[Tuple[int, dict]], columns: List[str], seen: Dict[str, int]) -> _Validator:
+    validator = _Validator(chunk, columns)
+    for column in REQUIRED[entity]:
+        validator.required(column)
+    if entity == "produtos":
+        validator.number("preco_base")
+        validator.number("tempo_preparo_min", integer=True)
+        validator.choice("disponivel_hoje", {**{v: "Sim" for v in TRUE_VALUES}, **{v: "Não" for v in FALSE_VALUES}}, "disponivel_hoje deve ser Sim ou Não")
+    elif entity == "opcionais":
+        validator.choice("tipo_opcional", TIPOS_OPCIONAL, "tipo_opcional deve ser Adicional ou Remoção")
+        validator.number("preco_adicional")
+    elif entity == "promocoes":
+        validator.json_object("condicao_json")
+        validator.json_object("acao_json")
+        validator.choice("is_ativa", {**{v: True for v in TRUE_VALUES}, **{v: False for v in FALSE_VALUES}}, "is_ativa deve ser Sim ou Não")
+    if entity in catalog_crud.NATURAL_KEYS:
+        validator.unique(COLUMNS[entity][0], seen)
+    return validator
+
+
+def _write_links(db: Session, entity: str, tenant_id: str, lines: List[int], records: List[dict]) -> Tuple[int, List[Tuple[int, str]]]:
+    item_column, item_entity = LINKS[entity]
+    # Uma consulta por entidade para resolver os nomes do lote inteiro.
+    product_ids = catalog_crud.get_ids_by_names(db, "produtos", tenant_id, (r["produto"] for r in records))
+    item_ids = catalog_crud.get_ids_by_names(db, item_entity, tenant_id, (r[item_column] for r in records))
+    pairs, errors = [], []
+    for line, record in zip(lines, records):
+        product_id = product_ids.get(str(record["produto"]).lower())
+        item_id = item_ids.get(str(record[item_column]).lower())
+        if product_id is None:
+            errors.append((line, f"produto '{record['produto']}' não encontrado"))
+        elif item_id is None:
+            errors.append((line, f"{item_column} '{record[item_column]}' não encontrado"))
+        else:
+            pairs.append((product_id, item_id))
+    catalog_crud.bulk_link(db, entity, pairs)
+    return len(pairs), errors
+
+
+def import_catalog(db: Session, tenant_id: str, fileobj, filename: str, entity: Optional[str] = None, dry_run: bool = False) -> dict:
+    """
+    Importa produtos, opcionais, promoções e suas ligações de um .xlsx (uma aba por entidade,
+    com o nome da entidade) ou de um .csv (uma entidade, informada em `entity`).
+
+    O arquivo é lido em streaming e processado em lotes de CATALOG_IMPORT_CHUNK_SIZE linhas:
+    validação vetorizada e um INSERT ... ON CONFLICT (tenant_id, lower(nome)) por lote. Itens
+    existentes são atualizados. Linhas inválidas entram no relatório e não são gravadas; as
+    válidas são gravadas em uma única transação (revertida em dry_run).
+
+    Levanta ValueError para problemas no arquivo como um todo (formato, colunas obrigatórias).
+    """
+    if entity is not None and entity not in ENTITIES:
+        raise ValueError(f"Entidade inválida: {entity}. Use uma de: {', '.join(ENTITIES)}.")
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == ".xlsx":
+        sources = _xlsx_sources(fileobj, entity)
+    elif extension == ".csv":
+        sources = _csv_sources(fileobj, entity)
+    else:
+        raise ValueError("Formato não suportado: envie um arquivo .xlsx ou .csv.")
+
+    started = time.perf_counter()
+    report = {"dry_run": dry_run, "entidades": {}, "erros": []}
+    total_rows = 0
+    try:
+        for name, columns, ignored, rows in sources:
+            summary = report["entidades"][name] = {"linhas": 0, "gravadas": 0, "erros": 0, "colunas_ignoradas": ignored}
+            seen: Dict[str, int] = {}
+            for chunk in _chunks(rows, CATALOG_IMPORT_CHUNK_SIZE):
+                total_rows += len(chunk)
+                if total_rows > CATALOG_IMPORT_MAX_ROWS:
+                    raise ValueError(f"O arquivo passa do limite de {CATALOG_IMPORT_MAX_ROWS} linhas.")
+                validator = _validate(name, chunk, columns, seen)
+                errors = validator.error_rows()
+                lines, records = validator.valid_rows(DEFAULTS.get(name, {}))
+                if name in LINKS:
+                    written, link_errors = _write_links(db, name, tenant_id, lines, records)
+                    errors += link_errors
+                else:
+                    written = catalog_crud.bulk_upsert(db, name, tenant_id, records)
+                summary["linhas"] += len(chunk)
+                summary["gravadas"] += written
+                summary["erros"] += len(errors)
+                report["erros"].extend({"entidade": name, "linha": line, "erro": message} for line, message in sorted(errors))
+        if dry_run:
+            db.rollback()
+        else:
+            tenant_crud.bump_catalog_version(db, tenant_id)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(
+        f"Importação do catálogo do tenant '{tenant_id}' ({filename}, dry_run={dry_run}): {total_rows} linha(s), "
+        f"{len(report['erros'])} erro(s) em {time.perf_counter() - started:.2f}s."
+    )
+    return report
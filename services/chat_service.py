@@ -3,23 +3,56 @@ import logging
 import asyncio
 import json
 import re
+import time
+import contextvars
+from typing import Dict, List, Optional, Tuple
 from fastapi import HTTPException
-from starlette.concurrency import run_in_threadpool
 
 from agno.exceptions import ModelProviderError
 from agno.media import Audio, Image, Video
 from agno.agent import Agent
 from agno.models.google import Gemini
 
-from core.database import DATABASE_URL, SessionLocal
-from crud import interaction_crud, tenant_crud
+from crud import interaction_crud
 from core.schemas import InteractionCreate
+from core.tenant_cache import get_tenant_snapshot
+from core.conversation_lock import ConversationLockError, conversation_locks
+from core.unit_of_work import unit_of_work
 from services.orchestrator_agent import OrchestratorAgent
-from agno.memory.v2.db.postgres import PostgresMemoryDb
+from services.message_dedup import message_deduplicator
+from services.interaction_writer import interaction_writer
+from services.conversation_history import conversation_history
+from services.response_templates import build_template_response, TEMPLATE_DUPLICATE_MESSAGE, TEMPLATE_MERGED_MESSAGE
 
 logger = logging.getLogger(__name__)
 
-memory_db = PostgresMemoryDb(table_name="user_memories", db_url=DATABASE_URL)
+# Janela de agrupamento de mensagens em rajada por conversa. 0 desativa.
+CHAT_COALESCE_WINDOW_SECONDS = float(os.getenv("CHAT_COALESCE_WINDOW_MS", "0")) / 1000
+# Tempo máximo que a primeira mensagem de uma rajada pode esperar, mesmo com mensagens chegando.
+CHAT_COALESCE_MAX_WAIT_SECONDS = float(os.getenv("CHAT_COALESCE_MAX_WAIT_MS", "4000")) / 1000
+
+
+class _Burst:
+    """Mensagens de uma conversa aguardando o fim da janela de agrupamento."""
+
+    def __init__(self):
+        self.messages: List[Tuple[str, str, asyncio.Future]] = []
+        self.first_arrival = time.monotonic()
+        self.last_arrival = self.first_arrival
+        self.client_latitude: Optional[float] = None
+        self.client_longitude: Optional[float] = None
+
+    def add(self, session_id: str, message: str, client_latitude: Optional[float], client_longitude: Optional[float]) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.messages.append((session_id, message, future))
+        self.last_arrival = time.monotonic()
+        if client_latitude is not None and client_longitude is not None:
+            self.client_latitude, self.client_longitude = client_latitude, client_longitude
+        return future
+
+
+_bursts: Dict[str, _Burst] = {}
+
 
 async def handle_message(
     user_id: str, 
@@ -33,58 +66,172 @@ async def handle_message(
     client_longitude: float = None
 ):
     logger.info(f"Iniciando handle_message para session_id: {session_id}")
-    db = SessionLocal()
-    try:
-        # 1. Verificar mensagem duplicada
-        is_duplicate = await run_in_threadpool(interaction_crud.get_interaction_by_whatsapp_id, db, whatsapp_message_id=session_id)
-        if is_duplicate:
-            logger.warning(f"Mensagem duplicada recebida (ID: {session_id}). Ignorando.")
-            return {"text": "Mensagem já processada.", "human_handoff": False, "send_menu": False}
-
-        # 2. Obter o tenant
-        tenant = await run_in_threadpool(tenant_crud.get_tenant_by_id, db, tenant_id=tenant_id)
-        if not tenant:
-            raise ValueError("Tenant não encontrado para a personalidade fornecida.")
-
-        # 3. Inicializar e chamar o Orquestrador com os dados brutos
-        logger.info(f"Delegando para o OrchestratorAgent. User: {user_id}, Session: {session_id}")
-        orchestrator = OrchestratorAgent(
-            db=db,
-            session_id=session_id,
-            tenant_id=tenant.tenant_id,
-            user_id=user_id
-        )
-        
-        ai_response_obj = await orchestrator.process_message(
-            message=message,
+    # Ids gravados recentemente são respondidos sem consultar o banco.
+    if message_deduplicator.is_recent(session_id):
+        logger.warning(f"Mensagem duplicada recebida (ID: {session_id}). Ignorando.")
+        return build_template_response(await get_tenant_snapshot(tenant_id), TEMPLATE_DUPLICATE_MESSAGE)
+
+    async def run():
+        if CHAT_COALESCE_WINDOW_SECONDS > 0 and not file_content:
+            return await _coalesce_message(user_id, session_id, message, tenant_id, personality_prompt, client_latitude, client_longitude)
+
+        return await _process_turn(
+            user_id=user_id,
+            messages=[(session_id, message)],
+            tenant_id=tenant_id,
             personality_prompt=personality_prompt,
             file_content=file_content,
             mimetype=mimetype,
             client_latitude=client_latitude,
             client_longitude=client_longitude
         )
-        
-        ai_response_text = ai_response_obj['response_text']
-        personality_id = tenant.personality.id if tenant.personality else None
-
-        # 4. Salvar a interação no banco de dados
-        new_interaction = InteractionCreate(
-            user_phone=user_id,
-            whatsapp_message_id=session_id,
-            message_from_user=message, # Salva a mensagem original do usuário
-            ai_response=ai_response_text,
-            personality_id=personality_id,
-            tenant_id=tenant.tenant_id # Adicionando o tenant_id que faltava
+
+    # Um retry que chega durante o processamento recebe a mesma resposta da mensagem original.
+    return await message_deduplicator.run_once(session_id, run)
+
+
+async def _coalesce_message(user_id: str, session_id: str, message: str, tenant_id: str, personality_prompt: str, client_latitude: float = None, client_longitude: float = None):
+    """
+    Junta a mensagem à rajada da conversa. A primeira mensagem agenda o processamento,
+    que acontece quando a conversa fica CHAT_COALESCE_WINDOW_SECONDS sem mensagens novas.
+    """
+    key = f"{user_id}_{tenant_id}"
+    burst = _bursts.get(key)
+    if burst is None:
+        burst = _bursts[key] = _Burst()
+        # O turno agrupado não pertence a uma só requisição: roda em um contexto vazio,
+        # com unidade de trabalho própria, e não na da primeira mensagem.
+        contextvars.Context().run(asyncio.create_task, _flush_burst(key, burst, user_id, tenant_id, personality_prompt))
+    return await burst.add(session_id, message, client_latitude, client_longitude)
+
+
+async def _flush_burst(key: str, burst: _Burst, user_id: str, tenant_id: str, personality_prompt: str):
+    while True:
+        deadline = min(burst.last_arrival + CHAT_COALESCE_WINDOW_SECONDS, burst.first_arrival + CHAT_COALESCE_MAX_WAIT_SECONDS)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(remaining)
+    if _bursts.get(key) is burst:
+        del _bursts[key]
+
+    messages = [(session_id, message) for session_id, message, _ in burst.messages]
+    if len(messages) > 1:
+        logger.info(f"Agrupando {len(messages)} mensagens da conversa {key} em um único turno.")
+    try:
+        result = await _process_turn(
+            user_id=user_id,
+            messages=messages,
+            tenant_id=tenant_id,
+            personality_prompt=personality_prompt,
+            client_latitude=burst.client_latitude,
+            client_longitude=burst.client_longitude
         )
-        await run_in_threadpool(interaction_crud.create_interaction, db, interaction=new_interaction)
+    except Exception as e:
+        for _, _, future in burst.messages:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    # A resposta vai para a requisição da última mensagem; as anteriores não geram resposta própria.
+    last_session_id = messages[-1][0]
+    merged_response = build_template_response(await get_tenant_snapshot(tenant_id), TEMPLATE_MERGED_MESSAGE)
+    for session_id, _, future in burst.messages:
+        if not future.done():
+            future.set_result(result if session_id == last_session_id else merged_response)
+
+
+async def _process_turn(
+    user_id: str,
+    messages: List[Tuple[str, str]],
+    tenant_id: str,
+    personality_prompt: str,
+    file_content: bytes = None,
+    mimetype: str = None,
+    client_latitude: float = None,
+    client_longitude: float = None
+):
+    """
+    Executa um turno do workflow para uma ou mais mensagens (session_id, texto) da mesma
+    conversa. Mensagens agrupadas viram uma única entrada, e cada whatsapp_message_id
+    é registrado como interação.
+    """
+    orchestrator = None
+    try:
+        # Turnos da mesma conversa rodam em ordem para não perder itens do carrinho;
+        # conversas diferentes continuam em paralelo. A sessão é a da requisição (unidade de trabalho).
+        async with unit_of_work() as uow, conversation_locks.lock(f"{user_id}_{tenant_id}"):
+            db = uow.db
+            # 1. Verificar mensagens duplicadas
+            pending: Dict[str, str] = {}
+            for session_id, message in messages:
+                if session_id in pending:
+                    continue
+                if message_deduplicator.is_recent(session_id) or await interaction_crud.get_interaction_by_whatsapp_id_async(db, whatsapp_message_id=session_id):
+                    logger.warning(f"Mensagem duplicada recebida (ID: {session_id}). Ignorando.")
+                    message_deduplicator.mark_processed(session_id)
+                    continue
+                pending[session_id] = message
+            if not pending:
+                return build_template_response(await get_tenant_snapshot(tenant_id, db), TEMPLATE_DUPLICATE_MESSAGE)
+
+            session_ids = list(pending)
+            session_id = session_ids[-1]
+            message = "\n".join(text for text in pending.values() if text)
+
+            # 2. Obter o tenant
+            tenant = await get_tenant_snapshot(tenant_id, db)
+            if not tenant:
+                raise ValueError("Tenant não encontrado para a personalidade fornecida.")
+
+            # 3. Inicializar e chamar o Orquestrador com os dados brutos
+            logger.info(f"Delegando para o OrchestratorAgent. User: {user_id}, Session: {session_id}")
+            orchestrator = OrchestratorAgent(
+                db=db,
+                session_id=session_id,
+                tenant_id=tenant.tenant_id,
+                user_id=user_id
+            )
+        
+            ai_response_obj = await orchestrator.process_message(
+                message=message,
+                personality_prompt=personality_prompt,
+                file_content=file_content,
+                mimetype=mimetype,
+                client_latitude=client_latitude,
+                client_longitude=client_longitude
+            )
+        
+            ai_response_text = ai_response_obj['response_text']
+            personality_id = tenant.personality_id
+
+            # 4. Salvar uma interação por mensagem; a resposta fica na última.
+            # O id entra na deduplicação em memória antes da resposta; a linha é gravada em lote depois.
+            for merged_session_id in session_ids:
+                message_deduplicator.mark_processed(merged_session_id)
+                new_interaction = InteractionCreate(
+                    user_phone=user_id,
+                    whatsapp_message_id=merged_session_id,
+                    message_from_user=pending[merged_session_id], # Salva a mensagem original do usuário
+                    ai_response=ai_response_text if merged_session_id == session_id else None,
+                    personality_id=personality_id,
+                    tenant_id=tenant.tenant_id # Adicionando o tenant_id que faltava
+                )
+                await interaction_writer.write(db, new_interaction)
+                conversation_history.record_turn(
+                    tenant.tenant_id, user_id, merged_session_id, new_interaction.message_from_user, new_interaction.ai_response
+                )
         
-        return ai_response_obj.model_dump()
+            return ai_response_obj
 
+    except ConversationLockError as e:
+        # O turno não roda sem o lock; o remetente reenvia a mensagem depois.
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         logger.error(f"Erro em handle_message: {e}", exc_info=True)
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail="Ocorreu um erro interno ao processar a mensagem.")
     finally:
-        db.close()
-    
+        if orchestrator is not None:
+            orchestrator.close()
@@ -0,0 +1,154 @@
+import os
+import base64
+import logging
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from crud import interaction_crud
+
+logger = logging.getLogger(__name__)
+
+# Turnos mais recentes mantidos em memória por conversa ativa.
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "20"))
+HISTORY_CACHE_MAX_CONVERSATIONS = int(os.getenv("HISTORY_CACHE_MAX_CONVERSATIONS", "5000"))
+HISTORY_PAGE_MAX_SIZE = int(os.getenv("HISTORY_PAGE_MAX_SIZE", "100"))
+# Turnos anteriores enviados como contexto para a formulação da resposta. 0 desativa.
+HISTORY_CONTEXT_TURNS = int(os.getenv("HISTORY_CONTEXT_TURNS", "6"))
+
+
+@dataclass
+class HistoryTurn:
+    whatsapp_message_id: str
+    message_from_user: Optional[str]
+    ai_response: Optional[str]
+    created_at: datetime
+    id: Optional[int] = None  # None enquanto a linha ainda está no buffer do InteractionWriter
+
+    @classmethod
+    def from_row(cls, row) -> "HistoryTurn":
+        return cls(
+            whatsapp_message_id=row.whatsapp_message_id,
+            message_from_user=row.message_from_user,
+            ai_response=row.ai_response,
+            created_at=row.created_at,
+            id=row.id,
+        )
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def encode_cursor(created_at: datetime, interaction_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{interaction_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Levanta ValueError se o cursor for inválido."""
+    try:
+        created_at, _, interaction_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").partition("|")
+        return datetime.fromisoformat(created_at), int(interaction_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+
+
+class _Conversation:
+    __slots__ = ("turns", "loaded")
+
+    def __init__(self, size: int):
+        self.turns: Deque[HistoryTurn] = deque(maxlen=size)
+        # False enquanto só há turnos gravados neste processo, sem a carga do banco.
+        self.loaded = False
+
+
+class ConversationHistory:
+    """
+    Histórico das conversas por (tenant_id, user_phone).
+
+    - recent(): últimos N turnos de uma conversa, de um ring buffer em memória (LRU limitado
+      de conversas). Na primeira leitura a janela é carregada do banco e mesclada com os
+      turnos ainda no buffer do InteractionWriter.
+    - page(): navegação completa com paginação keyset sobre (created_at, id), sem OFFSET,
+      usando o índice (tenant_id, user_phone, created_at, id).
+    """
+
+    def __init__(self, recent_turns: int = HISTORY_RECENT_TURNS, max_conversations: int = HISTORY_CACHE_MAX_CONVERSATIONS):
+        self.recent_turns = recent_turns
+        self.max_conversations = max_conversations
+        self._conversations: "OrderedDict[Tuple[str, str], _Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_or_create(self, key: Tuple[str, str]) -> _Conversation:
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            conversation = self._conversations[key] = _Conversation(self.recent_turns)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        self._conversations.move_to_end(key)
+        return conversation
+
+    def record_turn(self, tenant_id: str, user_phone: str, whatsapp_message_id: str, message_from_user: Optional[str], ai_response: Optional[str]):
+        turn = HistoryTurn(
+            whatsapp_message_id=whatsapp_message_id,
+            message_from_user=message_from_user,
+            ai_response=ai_response,
+            created_at=datetime.now(timezone.utc),
+        )
+        with self._lock:
+            self._get_or_create((tenant_id, user_phone)).turns.append(turn)
+
+    async def recent(self, db: AsyncSession, tenant_id: str, user_phone: str, limit: Optional[int] = None) -> List[HistoryTurn]:
+        """Últimos turnos da conversa, do mais antigo para o mais novo."""
+        key = (tenant_id, user_phone)
+        limit = max(1, min(self.recent_turns if limit is None else limit, self.recent_turns))
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is not None and conversation.loaded:
+                self._conversations.move_to_end(key)
+                self.hits += 1
+                return list(conversation.turns)[-limit:]
+        self.misses += 1
+
+        rows = await interaction_crud.get_interactions_page_async(db, tenant_id=tenant_id, user_phone=user_phone, limit=self.recent_turns)
+        from_db = [HistoryTurn.from_row(row) for row in reversed(rows)]
+        with self._lock:
+            conversation = self._get_or_create(key)
+            known = {turn.whatsapp_message_id for turn in from_db}
+            pending = [turn for turn in conversation.turns if turn.whatsapp_message_id not in known]
+            conversation.turns.clear()
+            conversation.turns.extend(from_db + pending)
+            conversation.loaded = True
+            return list(conversation.turns)[-limit:]
+
+    async def page(self, db: AsyncSession, tenant_id: str, user_phone: str, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[HistoryTurn], Optional[str]]:
+        """Uma página do histórico, do mais novo para o mais antigo, e o cursor da próxima página (ou None)."""
+        limit = max(1, min(limit, HISTORY_PAGE_MAX_SIZE))
+        before = decode_cursor(cursor) if cursor else None
+        # Uma linha a mais indica se existe próxima página.
+        rows = await interaction_crud.get_interactions_page_async(db, tenant_id=tenant_id, user_phone=user_phone, limit=limit + 1, before=before)
+        turns = [HistoryTurn.from_row(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(turns[-1].created_at, turns[-1].id) if len(rows) > limit else None
+        return turns, next_cursor
+
+    def invalidate(self, tenant_id: str, user_phone: str):
+        with self._lock:
+            self._conversations.pop((tenant_id, user_phone), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            conversations = len(self._conversations)
+        return {"conversations": conversations, "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._conversations.clear()
+
+
+conversation_history = ConversationHistory()
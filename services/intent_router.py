@@ -0,0 +1,245 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from core.schemas import AnaliseDeIntencao, TarefaIdentificada
+from core.invalidation_bus import ENTITY_TENANT, register_handler
+
+logger = logging.getLogger(__name__)
+
+INTENT_FAST_PATH_ENABLED = os.getenv("INTENT_FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+INTENT_CACHE_MAX_SIZE = int(os.getenv("INTENT_CACHE_MAX_SIZE", "5000"))
+INTENT_CACHE_TTL_SECONDS = float(os.getenv("INTENT_CACHE_TTL_SECONDS", "3600"))
+# Só mensagens curtas se repetem o suficiente para valer a pena guardar.
+INTENT_CACHE_MAX_WORDS = int(os.getenv("INTENT_CACHE_MAX_WORDS", "6"))
+
+# Regras padrão, aplicadas a todos os tenants. Palavras-chave já normalizadas (sem acento, minúsculas).
+DEFAULT_INTENT_RULES: Dict[str, Dict[str, List[str]]] = {
+    "menu": {
+        "keywords": ["cardapio", "menu", "catalogo"],
+        "patterns": [],
+    },
+    "falar_com_humano": {
+        "keywords": ["atendente", "falar com humano", "falar com um humano", "falar com uma pessoa", "pessoa de verdade", "atendimento humano"],
+        "patterns": [],
+    },
+    "frete": {
+        "keywords": ["frete", "taxa de entrega", "valor da entrega", "quanto fica a entrega", "quanto e a entrega"],
+        "patterns": [],
+    },
+}
+
+# Palavras que não mudam a intenção. Se, depois de remover a palavra-chave encontrada,
+# a mensagem só tiver palavras desta lista, a classificação é considerada confiável.
+FILLER_WORDS = {
+    "a", "o", "as", "os", "um", "uma", "de", "do", "da", "dos", "das", "e", "me", "pra", "para", "por", "favor",
+    "pf", "pfv", "qual", "quais", "quanto", "como", "ver", "quero", "queria", "gostaria", "pode", "poderia",
+    "manda", "mande", "mandar", "envia", "envie", "enviar", "mostra", "mostrar", "passa", "passar", "com", "falar",
+    "oi", "ola", "bom", "boa", "dia", "tarde", "noite", "tudo", "bem", "ai", "vcs", "voces", "vc", "voce",
+    "fica", "seu", "sua", "la", "ja", "agora", "preciso", "consegue", "tem", "hoje", "ta", "esta",
+}
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sem acentos, sem pontuação e com espaços colapsados."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+@dataclass
+class IntentRule:
+    tipo_tarefa: str
+    keywords: List[str] = field(default_factory=list)
+    patterns: List[Pattern] = field(default_factory=list)
+
+    def match(self, normalized_message: str) -> Optional[str]:
+        """Retorna o trecho da mensagem que casou com a regra, ou None."""
+        for keyword in self.keywords:
+            if re.search(rf"\b{re.escape(keyword)}\b", normalized_message):
+                return keyword
+        for pattern in self.patterns:
+            found = pattern.search(normalized_message)
+            if found:
+                return found.group(0)
+        return None
+
+
+class IntentRouter:
+    """
+    Classificador determinístico que roda antes do receptionist_agent. Só responde
+    quando exatamente uma regra casa e o restante da mensagem é irrelevante; caso
+    contrário retorna None e a mensagem segue para o LLM.
+    """
+
+    def __init__(self, rules: List[IntentRule], enabled: bool = True):
+        self.rules = rules
+        self.enabled = enabled
+
+    @classmethod
+    def from_config(cls, config: Optional[dict] = None) -> "IntentRouter":
+        """
+        Monta o roteador a partir das regras padrão e da configuração do tenant, no formato:
+        {"enabled": true, "replace_defaults": false,
+         "rules": {"menu": {"keywords": ["ver lanches"], "patterns": ["^lanches?$"]}}}
+        """
+        config = config or {}
+        merged: Dict[str, Dict[str, List[str]]] = {}
+        if not config.get("replace_defaults"):
+            for tipo, rule in DEFAULT_INTENT_RULES.items():
+                merged[tipo] = {"keywords": list(rule["keywords"]), "patterns": list(rule["patterns"])}
+
+        for tipo, rule in (config.get("rules") or {}).items():
+            target = merged.setdefault(tipo, {"keywords": [], "patterns": []})
+            target["keywords"].extend(rule.get("keywords", []))
+            target["patterns"].extend(rule.get("patterns", []))
+
+        rules = [
+            IntentRule(
+                tipo_tarefa=tipo,
+                keywords=[normalize_text(k) for k in rule["keywords"] if normalize_text(k)],
+                patterns=[re.compile(p) for p in rule["patterns"]],
+            )
+            for tipo, rule in merged.items()
+        ]
+        return cls(rules, enabled=config.get("enabled", True) is not False)
+
+    def classify(self, message: str) -> Optional[AnaliseDeIntencao]:
+        if not self.enabled:
+            return None
+        normalized = normalize_text(message or "")
+        if not normalized:
+            return None
+
+        matches = {}
+        for rule in self.rules:
+            matched = rule.match(normalized)
+            if matched:
+                matches[rule.tipo_tarefa] = matched
+
+        if len(matches) != 1:
+            return None
+
+        tipo_tarefa, matched = next(iter(matches.items()))
+        remainder = normalized.replace(matched, " ").split()
+        if any(word not in FILLER_WORDS for word in remainder):
+            return None
+
+        logger.debug(f"IntentRouter: mensagem '{message}' classificada como '{tipo_tarefa}' sem LLM.")
+        return AnaliseDeIntencao(
+            tarefas=[TarefaIdentificada(tipo_tarefa=tipo_tarefa, detalhes=message)],
+            contem_urgencia=False,
+        )
+
+
+def parse_intent_rules(intent_rules: Optional[str]) -> Optional[dict]:
+    """Valida o JSON de regras de intenção de um tenant. Levanta ValueError se for inválido."""
+    if not intent_rules:
+        return None
+    try:
+        config = json.loads(intent_rules)
+        IntentRouter.from_config(config)
+    except (json.JSONDecodeError, re.error, AttributeError, TypeError) as e:
+        raise ValueError(f"Configuração de regras de intenção inválida: {e}")
+    return config
+
+
+@lru_cache(maxsize=512)
+def get_intent_router(intent_rules: Optional[str] = None) -> IntentRouter:
+    """Retorna o roteador compilado para o JSON de regras do tenant (compilado uma vez por configuração)."""
+    try:
+        config = parse_intent_rules(intent_rules)
+    except ValueError as e:
+        logger.error(f"{e}. Usando apenas as regras padrão.")
+        config = None
+    return IntentRouter.from_config(config)
+
+
+def classify_intent(message: str, intent_rules: Optional[str] = None) -> Optional[AnaliseDeIntencao]:
+    """Classifica a mensagem pelas regras do tenant. Retorna None quando o LLM deve decidir."""
+    if not INTENT_FAST_PATH_ENABLED:
+        return None
+    return get_intent_router(intent_rules).classify(message)
+
+
+class IntentCache:
+    """
+    Cache LRU com TTL de resultados do receptionist_agent, indexado por tenant e mensagem
+    normalizada. Mensagens como "oi", "sim" ou "obrigado" deixam de gerar uma chamada ao LLM
+    a cada repetição.
+
+    Com um pedido em andamento a mesma mensagem pode ter outro significado ("sim" confirma
+    o pedido), então nesses casos o cache é ignorado (bypass).
+    """
+
+    def __init__(self, max_size: int = INTENT_CACHE_MAX_SIZE, ttl: float = INTENT_CACHE_TTL_SECONDS, max_words: int = INTENT_CACHE_MAX_WORDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_words = max_words
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, AnaliseDeIntencao]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+    @staticmethod
+    def _order_in_progress(order_state) -> bool:
+        return order_state is not None and (bool(order_state.items) or order_state.status != "open")
+
+    def _key(self, tenant_id: str, message: str, order_state=None) -> Optional[Tuple[str, str]]:
+        normalized = normalize_text(message or "")
+        if not normalized or len(normalized.split()) > self.max_words or self._order_in_progress(order_state):
+            return None
+        return (tenant_id, normalized)
+
+    def get(self, tenant_id: str, message: str, order_state=None) -> Optional[AnaliseDeIntencao]:
+        key = self._key(tenant_id, message, order_state)
+        with self._lock:
+            if key is None:
+                self.bypasses += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1].model_copy(deep=True)
+
+    def put(self, tenant_id: str, message: str, analise: AnaliseDeIntencao, order_state=None):
+        key = self._key(tenant_id, message, order_state)
+        if key is None or analise is None:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, analise.model_copy(deep=True))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_tenant(self, tenant_id: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == tenant_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "bypasses": self.bypasses}
+
+
+intent_cache = IntentCache()
+# As regras de intenção ficam no tenant: classificações em cache podem ter mudado.
+register_handler(ENTITY_TENANT, lambda invalidation: intent_cache.invalidate_tenant(invalidation.tenant_id))
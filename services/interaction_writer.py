@@ -0,0 +1,193 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from core import models
+from core.database import AsyncSessionLocal
+from core.schemas import InteractionCreate
+
+logger = logging.getLogger(__name__)
+
+# Gravação das interações fora do caminho da resposta, em lotes (multi-row INSERT).
+INTERACTION_WRITE_BEHIND_ENABLED = os.getenv("INTERACTION_WRITE_BEHIND_ENABLED", "true").lower() in ("1", "true", "yes")
+INTERACTION_BATCH_SIZE = int(os.getenv("INTERACTION_BATCH_SIZE", "100"))
+INTERACTION_FLUSH_INTERVAL_SECONDS = float(os.getenv("INTERACTION_FLUSH_INTERVAL_MS", "500")) / 1000
+# Limite do buffer quando o banco está fora: acima disso as interações mais antigas são descartadas.
+INTERACTION_BUFFER_MAX_SIZE = int(os.getenv("INTERACTION_BUFFER_MAX_SIZE", "10000"))
+
+
+class InteractionWriter:
+    """
+    Buffer write-behind da tabela interactions. write() só enfileira a linha (a deduplicação
+    em memória já foi registrada pelo chat_service); um flusher em segundo plano grava o lote
+    quando chega a batch_size linhas ou a cada flush_interval, em um único INSERT com
+    ON CONFLICT DO NOTHING no whatsapp_message_id. stop() grava o que ainda estiver no buffer.
+    Um lote recusado pelo banco por causa dos dados (ex.: tenant inexistente) é regravado linha
+    a linha e as linhas inválidas são descartadas; nas demais falhas o lote volta ao buffer.
+
+    Sem start() (ex.: testes, scripts), write() grava na hora com a sessão recebida.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = INTERACTION_BATCH_SIZE,
+        flush_interval: float = INTERACTION_FLUSH_INTERVAL_SECONDS,
+        max_size: int = INTERACTION_BUFFER_MAX_SIZE,
+        session_factory=AsyncSessionLocal,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.session_factory = session_factory
+        self._buffer: List[dict] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """Inicia o flusher. Deve ser chamado dentro do event loop da aplicação."""
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"InteractionWriter iniciado (batch_size={self.batch_size}, flush_interval={self.flush_interval}s).")
+
+    async def stop(self):
+        """Encerra o flusher e grava as interações pendentes."""
+        if not self.running:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+        if self._buffer:
+            logger.error(f"InteractionWriter: {len(self._buffer)} interação(ões) não gravada(s) no encerramento.")
+
+    async def write(self, db, interaction: InteractionCreate):
+        if not self.running:
+            from crud import interaction_crud
+            await interaction_crud.create_interaction_async(db, interaction=interaction)
+            return
+
+        row = interaction.model_dump()
+        # created_at do momento da mensagem, não do flush
+        row["created_at"] = datetime.now(timezone.utc)
+        self._buffer.append(row)
+        if len(self._buffer) > self.max_size:
+            excess = len(self._buffer) - self.max_size
+            del self._buffer[:excess]
+            self.dropped += excess
+            logger.error(f"InteractionWriter: buffer cheio, {excess} interação(ões) antiga(s) descartada(s).")
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self, full_batches_only: bool = False) -> int:
+        """
+        Grava o buffer atual em lotes de até batch_size linhas. Com full_batches_only, só os
+        lotes cheios (o resto espera o próximo intervalo). Retorna o número de linhas gravadas.
+        """
+        async with self._flush_lock or asyncio.Lock():
+            written = 0
+            while self._buffer and (not full_batches_only or len(self._buffer) >= self.batch_size):
+                batch = self._buffer[:self.batch_size]
+                del self._buffer[:len(batch)]
+                try:
+                    await self._insert(batch)
+                except asyncio.CancelledError:
+                    # stop() cancelou o flusher no meio do lote: o lote volta e é gravado no flush final.
+                    self._buffer[:0] = batch
+                    raise
+                except (IntegrityError, DataError) as e:
+                    self.failures += 1
+                    logger.warning(f"InteractionWriter: lote de {len(batch)} interação(ões) recusado ({e}); gravando linha a linha.")
+                    rows_written, completed = await self._insert_rows(batch)
+                    written += rows_written
+                    if completed:
+                        continue
+                    break
+                except Exception as e:
+                    self.failures += 1
+                    logger.error(f"InteractionWriter: falha ao gravar {len(batch)} interação(ões): {e}", exc_info=True)
+                    # Volta para o início do buffer e tenta no próximo ciclo.
+                    self._buffer[:0] = batch
+                    break
+                self.flushes += 1
+                self.rows_written += len(batch)
+                written += len(batch)
+            return written
+
+    async def _insert_rows(self, rows: List[dict]) -> Tuple[int, bool]:
+        """
+        Grava um lote recusado linha a linha, descartando as linhas que o banco não aceita.
+        Retorna (linhas gravadas, se o lote foi até o fim); o que sobrar volta ao buffer.
+        """
+        written = 0
+        for index, row in enumerate(rows):
+            try:
+                await self._insert([row])
+            except (IntegrityError, DataError) as e:
+                self.rejected += 1
+                logger.error(f"InteractionWriter: interação {row.get('whatsapp_message_id')} descartada, recusada pelo banco: {e}")
+                continue
+            except asyncio.CancelledError:
+                self._buffer[:0] = rows[index:]
+                raise
+            except Exception as e:
+                # Falha que não é dos dados: o restante volta ao buffer para o próximo ciclo.
+                self.failures += 1
+                logger.error(f"InteractionWriter: falha ao gravar interações linha a linha: {e}", exc_info=True)
+                self._buffer[:0] = rows[index:]
+                return written, False
+            self.rows_written += 1
+            written += 1
+        self.flushes += 1
+        return written, True
+
+    async def _insert(self, rows: List[dict]):
+        async with self.session_factory() as session:
+            if session.bind.dialect.name == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            # Retries do n8n já gravados por outro worker são ignorados.
+            stmt = insert(models.Interaction).on_conflict_do_nothing(index_elements=[models.Interaction.whatsapp_message_id])
+            await session.execute(stmt, rows)
+            await session.commit()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                full_batches_only = True
+            except asyncio.TimeoutError:
+                full_batches_only = False
+            self._wakeup.clear()
+            # Acordado pelo tamanho, grava só os lotes cheios; o lote parcial espera o intervalo.
+            await self.flush(full_batches_only=full_batches_only)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._buffer),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+
+interaction_writer = InteractionWriter()
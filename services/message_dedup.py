@@ -0,0 +1,91 @@
+import os
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Quantos whatsapp_message_id já processados são lembrados em memória.
+DEDUP_RECENT_SIZE = int(os.getenv("DEDUP_RECENT_SIZE", "10000"))
+
+
+class MessageDeduplicator:
+    """
+    Camada de deduplicação à frente da tabela interactions.
+
+    - Em andamento: um retry do n8n que chega enquanto a mensagem original ainda está
+      no workflow aguarda o mesmo future e recebe a mesma resposta, sem gastar LLM.
+    - Recentes: um conjunto limitado (LRU) de ids já gravados, que responde a maioria
+      das verificações de duplicidade sem ir ao Postgres. O banco continua sendo a
+      fonte da verdade para ids que já saíram do conjunto ou vieram de outro worker.
+    """
+
+    def __init__(self, recent_size: int = DEDUP_RECENT_SIZE):
+        self.recent_size = recent_size
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.in_flight_hits = 0
+        self.recent_hits = 0
+
+    def is_recent(self, message_id: str) -> bool:
+        with self._lock:
+            if message_id in self._recent:
+                self._recent.move_to_end(message_id)
+                self.recent_hits += 1
+                return True
+            return False
+
+    def mark_processed(self, message_id: str):
+        with self._lock:
+            self._recent[message_id] = None
+            self._recent.move_to_end(message_id)
+            while len(self._recent) > self.recent_size:
+                self._recent.popitem(last=False)
+
+    async def run_once(self, message_id: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa factory() uma única vez por message_id em andamento; chamadas repetidas aguardam o mesmo resultado."""
+        future = self._in_flight.get(message_id)
+        if future is not None:
+            self.in_flight_hits += 1
+            logger.info(f"Mensagem {message_id} já está em processamento. Aguardando o mesmo resultado.")
+            # shield: se o retry for cancelado, o processamento original continua.
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[message_id] = future
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita o aviso de exceção não recuperada quando não há retries aguardando.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._in_flight.pop(message_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            recent = len(self._recent)
+        return {
+            "in_flight": len(self._in_flight),
+            "recent": recent,
+            "in_flight_hits": self.in_flight_hits,
+            "recent_hits": self.recent_hits,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._recent.clear()
+        self._in_flight.clear()
+
+
+message_deduplicator = MessageDeduplicator()
@@ -1,70 +1,69 @@
 import base64
-import os
 import logging
 import asyncio
 import json
 from typing import Optional, List, Dict
 from datetime import datetime, date
 
-from sqlalchemy.orm import Session 
-from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from agno.agent import Agent, RunResponse
-from agno.models.google import Gemini
-from agno.storage.postgres import PostgresStorage
 from agno.memory.v2.memory import Memory
 from agno.media import Audio, Image, Video
-from agno.workflow.v2 import Workflow, Router, Step
+from agno.workflow.v2 import Workflow
 from agno.workflow.v2.step import StepInput, StepOutput
 
 from core import schemas
-from core.database import DATABASE_URL, SessionLocal
 from core.schemas import (
     AIResponse, HumanHandoffOutput, MenuOutput, FreightCalculationOutput,
     FileUnderstandingOutput, GeneralResponseOutput, OrchestratorDecision,
     OrderState, OrderTakingOutput, OrderItem, AnaliseDeIntencao, TarefaIdentificada, FinalResponseData
 )
-from crud import tenant_crud, product_crud, user_address_crud
-from agno.memory.v2.db.postgres import PostgresMemoryDb
-from core.vector_db import VectorDBManager
-from services.agents.human_handoff_agent import get_human_handoff_agent
-from services.agents.menu_agent import get_menu_agent
-from services.agents.freight_agent import get_freight_agent
-from services.agents.file_understanding_agent import get_file_understanding_agent
-from services.agents.general_response_agent import get_general_response_agent
-from services.agents.order_taking_agent import get_order_taking_agent
-from services.agents.receptionist_agent import get_receptionist_agent # NEW
-from services.agents.response_formulation_agent import get_response_formulation_agent # NEW
+from crud import user_address_crud
+from core.tenant_cache import TenantSnapshot, get_tenant_snapshot
+from core.catalog_cache import get_catalog_snapshot
+from core.vector_db import get_vector_db_manager
+from core.conversation_state import ConversationStateStore, get_conversation_state_store
+from core.unit_of_work import unit_of_work_session
+from core.memory_db import new_memory
+from services.agent_registry import AgentRuntime, agent_registry
 from services.order_service import save_order_to_database
-from services.tools import get_sql_query_tool, get_contextual_suggestions_tool, get_applicable_promotions_tool # Updated
-from services.rules_engine import RulesEngine # NEW
+from services.tools import get_contextual_suggestions_tool, get_applicable_promotions_tool, freight_calculator # Updated
+from services.intent_router import classify_intent, intent_cache
+from services.conversation_history import conversation_history, HISTORY_CONTEXT_TURNS
+from services.response_templates import (
+    render_template, TEMPLATE_MENU, TEMPLATE_HUMAN_HANDOFF, TEMPLATE_UNSUPPORTED_FILE
+)
 
 logger = logging.getLogger(__name__)
 
-ORDER_STATES: Dict[str, OrderState] = {}
-USER_LAST_INTERACTION: Dict[str, datetime] = {}
+# Handler executado para cada tipo de tarefa identificado pelo receptionist.
+# Tarefas sem handler (ex.: fazer_pergunta_geral) são respondidas direto na formulação.
+TASK_HANDLERS: Dict[str, str] = {
+    "falar_com_humano": "_handle_human_handoff_wrapper",
+    "menu": "_handle_menu_request_wrapper",
+    "frete": "_handle_freight_calculation_wrapper",
+    "adicionar_item": "_handle_order_taking_wrapper",
+    "remover_item": "_handle_order_taking_wrapper",
+    "confirmar_pedido": "_handle_order_taking_wrapper",
+    "verificar_promocao": "_handle_promotions_wrapper",
+}
 
-class OrchestratorAgent:
-    async def _route_by_intent(self, step_input: StepInput) -> Step:
-        # A intenção já foi identificada pelo 'receptionist_step'
-        receptionist_output: AnaliseDeIntencao = step_input.previous_step_content
-        
-        # Lógica de roteamento baseada na primeira tarefa identificada
-        if receptionist_output and receptionist_output.tarefas:
-            primeira_tarefa = receptionist_output.tarefas[0].tipo_tarefa
-            if primeira_tarefa == 'falar_com_humano':
-                return self.human_handoff_step
-            elif primeira_tarefa == 'menu':
-                return self.menu_step
-            elif primeira_tarefa == 'frete':
-                return self.freight_step
-            elif primeira_tarefa in ['adicionar_item', 'remover_item', 'confirmar_pedido']:
-                return self.order_taking_step
-        
-        # Se nenhuma tarefa específica for identificada, ou for uma pergunta geral
-        return self.response_formulation_step
+# Tarefas cuja resposta é um texto fixo: sozinhas, dispensam o response_formulation_agent.
+DETERMINISTIC_TASKS = {"falar_com_humano", "menu"}
+
+# Handlers sem os quais a resposta seria enganosa (ex.: confirmar um pedido que não foi
+# registrado): uma falha neles interrompe a mensagem. As falhas dos demais vão para a formulação.
+REQUIRED_HANDLERS = {"_handle_order_taking_wrapper"}
 
-    def __init__(self, db: Session, session_id: str, tenant_id: str, user_id: str):
+
+async def _call_tool(agno_tool, *args, **kwargs):
+    """Chama a função original de uma ferramenta decorada com @tool, fora de um agente."""
+    entrypoint = getattr(agno_tool, "entrypoint", None) or agno_tool
+    return await entrypoint(*args, **kwargs)
+
+class OrchestratorAgent:
+    def __init__(self, db: AsyncSession, session_id: str, tenant_id: str, user_id: str, runtime: Optional[AgentRuntime] = None, state_store: Optional[ConversationStateStore] = None):
         logger.debug(f"OrchestratorAgent initialized with session_id={session_id}, tenant_id={tenant_id}, user_id={user_id}")
         self.db = db
         self.session_id = session_id
@@ -72,109 +71,76 @@ class OrchestratorAgent:
         self.user_id = user_id
         self.composite_session_id = f"{user_id}_{tenant_id}"
 
-        # Definir IDs dos modelos de IA
-        self.ORCHESTRATOR_MODEL_ID = "models/gemini-2.0-flash-lite"
-        self.GENERAL_AGENT_MODEL_ID = "models/gemini-2.0-flash"
-        self.ORDER_TAKING_AGENT_MODEL_ID = "models/gemini-2.0-flash"
-        self.HUMAN_HANDOFF_MODEL_ID = "models/gemini-2.0-flash-lite"
-        self.MENU_AGENT_MODEL_ID = "models/gemini-2.0-flash-lite"
-        self.FREIGHT_AGENT_MODEL_ID = "models/gemini-2.0-flash"
-        self.FILE_UNDERSTANDING_MODEL_ID = "models/gemini-2.0-flash"
-        self.RECEPTIONIST_MODEL_ID = "models/gemini-2.0-flash-lite" # NEW
-        self.RESPONSE_FORMULATION_MODEL_ID = "models/gemini-2.0-flash" # NEW
-
-        self.gemini_api_key = os.getenv("GEMINI_API_KEY")
-        if not self.gemini_api_key:
-            raise ValueError("A variável de ambiente GEMINI_API_KEY não foi definida.")
-        
-        self.gemini_api_key_2 = os.getenv("GEMINI_API_KEY_2")
-        if not self.gemini_api_key_2:
-            raise ValueError("A variável de ambiente GEMINI_API_KEY_2 não foi definida.")
-        
-        self.memory_db = PostgresMemoryDb(table_name="user_memories", db_url=DATABASE_URL)
-        self.memory = Memory(db=self.memory_db)
-        self.vector_db_manager = VectorDBManager(db=self.db, collection_name=self.tenant_id)
-
-        # Initialize RulesEngine
-        self.rules_engine = RulesEngine(self.db) # NEW
-
-        # Initialize Agents
-        self.human_handoff_agent = get_human_handoff_agent(model_id=self.HUMAN_HANDOFF_MODEL_ID, api_key=self.gemini_api_key)
-        self.menu_agent = get_menu_agent(model_id=self.MENU_AGENT_MODEL_ID, api_key=self.gemini_api_key)
-        self.freight_agent = get_freight_agent(model_id=self.FREIGHT_AGENT_MODEL_ID, api_key=self.gemini_api_key_2)
-        self.file_understanding_agent = get_file_understanding_agent(model_id=self.FILE_UNDERSTANDING_MODEL_ID, api_key=self.gemini_api_key_2)
-        self.order_taking_agent = get_order_taking_agent(model_id=self.ORDER_TAKING_AGENT_MODEL_ID, api_key=self.gemini_api_key_2, memory=self.memory)
-        self.receptionist_agent = get_receptionist_agent(model_id=self.RECEPTIONIST_MODEL_ID, api_key=self.gemini_api_key) # NEW
-        self.response_formulation_agent = get_response_formulation_agent(model_id=self.RESPONSE_FORMULATION_MODEL_ID, api_key=self.gemini_api_key_2, memory=self.memory)
-
-        # Etapa 1: Criar os Steps
-        self.receptionist_step = Step( # NEW
-            name="receptionist",
-            agent=self.receptionist_agent,
-            description="Analisa a mensagem do usuário e identifica as intenções."
-        )
-        self.human_handoff_step = Step(
-            name="human_handoff",
-            executor=self._handle_human_handoff_wrapper,
-            description="Encaminha a conversa para um atendente humano."
-        )
-        self.menu_step = Step(
-            name="menu",
-            executor=self._handle_menu_request_wrapper,
-            description="Envia o cardápio para o usuário."
-        )
-        self.freight_step = Step(
-            name="freight",
-            executor=self._handle_freight_calculation_wrapper, # Changed to executor
-            description="Calcula o frete para o endereço do usuário."
-        )
-        self.order_taking_step = Step(
-            name="order_taking",
-            executor=self._handle_order_taking_wrapper,
-            description="Anota e gerencia os pedidos do usuário."
-        )
-        self.response_formulation_step = Step( # NEW
-            name="response_formulation",
-            executor=self._handle_response_formulation_wrapper,
-            description="Formula a resposta final para o usuário."
-        )
+        # Agentes, steps e workflow vêm do registro do processo; aqui ficam apenas os dados da conversa.
+        self.runtime = runtime or agent_registry.checkout()
+        if self.runtime.memory is None:
+            # Runtime devolvido ao pool e reaproveitado diretamente: a Memory é sempre da conversa atual.
+            self.runtime.bind_memory(new_memory())
+        # Carrinho e última interação ficam fora do processo quando o backend é postgres/redis.
+        self.state_store = state_store or get_conversation_state_store()
 
-        # Etapa 2: Construir o Workflow com o Router
-        self.workflow = Workflow(
-            name="Chatbot Workflow",
-            steps=[
-                self.receptionist_step, # NEW: Receptionist is the first step
-                Router(
-                    name="Main Router",
-                    selector=self._route_by_intent,
-                    choices=[
-                        self.human_handoff_step,
-                        self.menu_step,
-                        self.freight_step,
-                        self.order_taking_step,
-                        self.response_formulation_step, # NEW: Fallback to response formulation
-                    ]
-                )
-            ]
-        )
+        self.vector_db_manager = get_vector_db_manager(self.tenant_id)
+
+    @property
+    def run_kwargs(self) -> Dict[str, str]:
+        """Sessão e usuário da conversa, passados em todo arun() dos agentes compartilhados do pool."""
+        return {"session_id": self.composite_session_id, "user_id": self.composite_session_id}
+
+    def close(self):
+        """Devolve o runtime ao registro. O orquestrador não deve ser usado depois disso."""
+        if self.runtime is not None:
+            agent_registry.checkin(self.runtime)
+            self.runtime = None
+
+    @property
+    def memory(self) -> Memory:
+        return self.runtime.memory
+
+    @property
+    def workflow(self) -> Workflow:
+        return self.runtime.workflow
+
+    @property
+    def human_handoff_agent(self) -> Agent:
+        return self.runtime.human_handoff_agent
+
+    @property
+    def menu_agent(self) -> Agent:
+        return self.runtime.menu_agent
+
+    @property
+    def freight_agent(self) -> Agent:
+        return self.runtime.freight_agent
+
+    @property
+    def file_understanding_agent(self) -> Agent:
+        return self.runtime.file_understanding_agent
+
+    @property
+    def order_taking_agent(self) -> Agent:
+        return self.runtime.order_taking_agent
+
+    @property
+    def receptionist_agent(self) -> Agent:
+        return self.runtime.receptionist_agent
+
+    @property
+    def response_formulation_agent(self) -> Agent:
+        return self.runtime.response_formulation_agent
 
     async def _get_order_state(self) -> OrderState:
         logger.debug(f"Recuperando estado do pedido para session_id: {self.composite_session_id}")
-        return ORDER_STATES.get(self.composite_session_id, OrderState())
+        return await self.state_store.get_order_state(self.composite_session_id)
 
     async def _save_order_state(self, state: OrderState):
         logger.debug(f"Salvando estado do pedido para session_id: {self.composite_session_id}: {state.model_dump()}")
-        ORDER_STATES[self.composite_session_id] = state
+        await self.state_store.save_order_state(self.composite_session_id, state)
 
     async def _get_product_price(self, product_name: str) -> float:
-        db = SessionLocal()
-        try:
-            product = await run_in_threadpool(product_crud.get_product_by_name_and_tenant_id, db, name=product_name, tenant_id=self.tenant_id)
-            if product and product.price:
-                return float(product.price)
-            return 0.0
-        finally:
-            db.close()
+        product = (await get_catalog_snapshot(self.tenant_id)).product_by_name(product_name)
+        if product and product.preco_base:
+            return product.preco_base
+        return 0.0
 
     async def process_message(
         self, message: str, personality_prompt: str, file_content: Optional[bytes] = None, mimetype: Optional[str] = None, client_latitude: Optional[float] = None, client_longitude: Optional[float] = None
@@ -189,22 +155,31 @@ class OrchestratorAgent:
 
             # Se a mensagem estiver vazia após o processamento do arquivo, não há o que fazer.
             if not message.strip():
-                return final_response_data.model_dump()
+                return self._build_ai_response(final_response_data)
+
+            # Turnos anteriores da conversa (janela em memória) como contexto da formulação
+            recent_turns = []
+            if HISTORY_CONTEXT_TURNS > 0:
+                turns = await conversation_history.recent(self.db, self.tenant_id, self.user_id, limit=HISTORY_CONTEXT_TURNS)
+                recent_turns = [{"cliente": turn.message_from_user, "atendente": turn.ai_response} for turn in turns]
 
             # Executa o workflow
             workflow_response = await self.workflow.arun(
                 message=message,
                 additional_data={
+                    "orchestrator": self, # Os steps compartilhados delegam para esta conversa
                     "final_response_data": final_response_data, # Passa o objeto mutável
                     "order_state": order_state,
                     "client_latitude": client_latitude,
                     "client_longitude": client_longitude,
                     "personality_prompt": personality_prompt,
+                    "recent_turns": recent_turns,
                     "tenant_id": self.tenant_id # Passa o tenant_id para as ferramentas
-                }
+                },
+                **self.run_kwargs
             )
 
-            # O workflow agora retorna o FinalResponseData diretamente do response_formulation_step
+            # O workflow retorna o FinalResponseData do response_formulation_step (ou do finalize_step)
             run_content = workflow_response.content
 
             if isinstance(run_content, FinalResponseData):
@@ -215,7 +190,7 @@ class OrchestratorAgent:
 
             # Lógica de Saudação: Adiciona apenas na primeira interação do dia e se a resposta não contiver saudação.
             now = datetime.now()
-            last_interaction = USER_LAST_INTERACTION.get(self.composite_session_id)
+            last_interaction = await self.state_store.get_last_interaction(self.composite_session_id)
             
             # Verifica se é a primeira interação do dia
             is_first_interaction_today = last_interaction is None or last_interaction.date() < now.date()
@@ -225,26 +200,91 @@ class OrchestratorAgent:
             contains_greeting = any(greeting_word in response_text_lower for greeting_word in ["olá", "bem-vindo", "bom dia", "boa tarde", "boa noite"])
 
             if is_first_interaction_today and not contains_greeting:
-                tenant = await run_in_threadpool(tenant_crud.get_tenant_by_id, self.db, self.tenant_id)
+                tenant = await get_tenant_snapshot(self.tenant_id, self.db)
                 nome_loja = tenant.nome_loja if tenant else self.tenant_id
                 greeting = f"Olá! Bem-vindo(a) ao Atendente Virtual da {nome_loja}. "
                 final_response_data.text_response = greeting + final_response_data.text_response
             
-            USER_LAST_INTERACTION[self.composite_session_id] = now
+            await self.state_store.save_last_interaction(self.composite_session_id, now)
 
             await self._save_order_state(order_state)
             logger.debug(f"Final response before returning from process_message: {final_response_data.text_response}")
-            return schemas.AIResponse(
-                response_text=final_response_data.text_response,
-                human_handoff=final_response_data.human_handoff_needed,
-                send_menu=final_response_data.send_menu_requested,
-                freight_details=final_response_data.freight_details,
-                file_summary=final_response_data.file_summary
-            ).model_dump()
+            return self._build_ai_response(final_response_data)
         except Exception as e:
             logger.error(f"Erro no process_message: {e}", exc_info=True)
             raise
 
+    @staticmethod
+    def _build_ai_response(final_response_data: FinalResponseData) -> dict:
+        return schemas.AIResponse(
+            response_text=final_response_data.text_response,
+            human_handoff=final_response_data.human_handoff_needed,
+            send_menu=final_response_data.send_menu_requested,
+            freight_details=final_response_data.freight_details,
+            file_summary=final_response_data.file_summary
+        ).model_dump()
+
+    async def _handle_reception_wrapper(self, step_input: StepInput) -> StepOutput:
+        # Regras determinísticas primeiro; o receptionist_agent só é chamado quando elas não são conclusivas.
+        tenant = await get_tenant_snapshot(self.tenant_id, self.db)
+        analise = classify_intent(step_input.message, tenant.intent_rules if tenant else None)
+        if analise is not None:
+            return StepOutput(content=analise)
+
+        # Depois o cache de classificações anteriores para a mesma mensagem normalizada.
+        order_state = step_input.additional_data.get("order_state")
+        analise = intent_cache.get(self.tenant_id, step_input.message, order_state)
+        if analise is None:
+            analise = (await self.receptionist_agent.arun(step_input.message, **self.run_kwargs)).content
+            if isinstance(analise, AnaliseDeIntencao):
+                intent_cache.put(self.tenant_id, step_input.message, analise, order_state)
+        return StepOutput(content=analise)
+
+    async def _handle_task_fan_out_wrapper(self, step_input: StepInput) -> StepOutput:
+        """
+        Executa ao mesmo tempo os handlers de todas as tarefas identificadas. Cada handler
+        escreve em chaves próprias do additional_data compartilhado (freight_info,
+        promotions_info, order_state...), que depois alimentam uma única formulação.
+        """
+        analise = step_input.previous_step_content
+        tarefas = analise.tarefas if isinstance(analise, AnaliseDeIntencao) else []
+        tipos = [tarefa.tipo_tarefa for tarefa in tarefas]
+
+        handler_names: List[str] = []
+        for tipo in tipos:
+            handler_name = TASK_HANDLERS.get(tipo)
+            if handler_name and handler_name not in handler_names:
+                handler_names.append(handler_name)
+        # A tomada de pedido já busca as promoções com o pedido atualizado.
+        if "_handle_order_taking_wrapper" in handler_names and "_handle_promotions_wrapper" in handler_names:
+            handler_names.remove("_handle_promotions_wrapper")
+
+        # Os handlers acessam o banco pela unidade de trabalho (unit_of_work_session/run_sync),
+        # que serializa o uso da sessão da requisição entre eles.
+        results = await asyncio.gather(
+            *(getattr(self, handler_name)(step_input) for handler_name in handler_names),
+            return_exceptions=True
+        )
+        failed_tasks: List[str] = []
+        for handler_name, result in zip(handler_names, results):
+            if isinstance(result, Exception):
+                logger.error(f"Erro no handler {handler_name} para session_id {self.composite_session_id}: {result}", exc_info=result)
+                if handler_name in REQUIRED_HANDLERS:
+                    raise result
+                failed_tasks.extend(tipo for tipo in dict.fromkeys(tipos) if TASK_HANDLERS.get(tipo) == handler_name)
+        # A formulação avisa o cliente do que não pôde ser feito em vez de responder como se tivesse sido.
+        step_input.additional_data["failed_tasks"] = failed_tasks
+
+        distinct_tipos = set(tipos)
+        step_input.additional_data["requires_formulation"] = bool(failed_tasks) or not (
+            len(distinct_tipos) == 1 and distinct_tipos <= DETERMINISTIC_TASKS
+        )
+        logger.debug(f"Tarefas {tipos} executadas com os handlers {handler_names}.")
+        return StepOutput(content=step_input.additional_data.get("final_response_data"))
+
+    async def _handle_finalize_wrapper(self, step_input: StepInput) -> StepOutput:
+        return StepOutput(content=step_input.additional_data.get("final_response_data"))
+
     async def _handle_freight_calculation_wrapper(self, step_input: StepInput) -> StepOutput:
         client_latitude = step_input.additional_data.get("client_latitude")
         client_longitude = step_input.additional_data.get("client_longitude")
@@ -254,12 +294,12 @@ class OrchestratorAgent:
             # Se não houver coordenadas, o ResponseFormulationAgent pedirá ao usuário.
             return StepOutput(content="Coordenadas do cliente não fornecidas.")
 
-        freight_result = await freight_calculator(client_latitude, client_longitude, tenant_id)
+        freight_result = await _call_tool(freight_calculator, client_latitude, client_longitude, tenant_id)
         step_input.additional_data["freight_info"] = freight_result
         
         return StepOutput(content="Frete calculado e armazenado.")
 
-    async def _handle_file_understanding(self, file_content: bytes, mimetype: str, final_response: AIResponse) -> Optional[str]:
+    async def _handle_file_understanding(self, file_content: bytes, mimetype: str, final_response: FinalResponseData) -> Optional[str]:
         '''
         Processa um arquivo (áudio, imagem, etc.), retorna o texto transcrito se houver,
         ou preenche a resposta final com uma mensagem de erro/status e retorna None.
@@ -276,18 +316,19 @@ class OrchestratorAgent:
                 from agno.media import Audio
                 audio_format = "opus" if mimetype == "audioMessage" else mimetype.split('/')[-1]
                 media_input = Audio(content=file_content, format=audio_format)
-                response = await self.file_understanding_agent.arun(prompt, audio=[media_input])
+                response = await self.file_understanding_agent.arun(prompt, audio=[media_input], **self.run_kwargs)
             elif mimetype.startswith("image/") or mimetype == "imageMessage":
                 from agno.media import Image
                 media_input = Image(content=file_content)
-                response = await self.file_understanding_agent.arun(prompt, images=[media_input])
+                response = await self.file_understanding_agent.arun(prompt, images=[media_input], **self.run_kwargs)
             elif mimetype.startswith("video/") or mimetype == "videoMessage":
                 from agno.media import Video
                 media_input = Video(content=file_content)
-                response = await self.file_understanding_agent.arun(prompt, videos=[media_input])
+                response = await self.file_understanding_agent.arun(prompt, videos=[media_input], **self.run_kwargs)
             else:
                 logger.warning(f"Tipo de arquivo não suportado: {mimetype}")
-                final_response.response_text = "Desculpe, não consigo processar este tipo de arquivo."
+                tenant = await get_tenant_snapshot(self.tenant_id, self.db)
+                final_response.text_response = render_template(tenant, TEMPLATE_UNSUPPORTED_FILE)
                 return None
 
             if response and response.content and hasattr(response.content, 'summary'):
@@ -298,27 +339,28 @@ class OrchestratorAgent:
                 return summary_text
             else:
                 logger.warning("Análise de arquivo não retornou conteúdo ou sumário.")
-                final_response.response_text = "Não consegui entender o conteúdo do arquivo. Pode tentar de novo?"
+                final_response.text_response = "Não consegui entender o conteúdo do arquivo. Pode tentar de novo?"
                 return None
 
         except Exception as e:
             logger.error(f"Erro na análise do arquivo: {e}", exc_info=True)
-            final_response.response_text = "Ocorreu um erro ao analisar o arquivo. Por favor, tente novamente."
+            final_response.text_response = "Ocorreu um erro ao analisar o arquivo. Por favor, tente novamente."
             return None
 
-    def _handle_human_handoff(self, final_response_data: FinalResponseData):
+    def _handle_human_handoff(self, final_response_data: FinalResponseData, tenant: Optional[TenantSnapshot] = None):
         final_response_data.human_handoff_needed = True
-        final_response_data.text_response = "Entendi. Um de nossos atendentes irá continuar a conversa com você em instantes."
+        final_response_data.text_response = render_template(tenant, TEMPLATE_HUMAN_HANDOFF)
 
-    def _handle_menu_request(self, final_response_data: FinalResponseData):
+    def _handle_menu_request(self, final_response_data: FinalResponseData, tenant: Optional[TenantSnapshot] = None):
         final_response_data.send_menu_requested = True
-        final_response_data.text_response = "Claro! Aqui está o nosso cardápio."
+        final_response_data.text_response = render_template(tenant, TEMPLATE_MENU)
 
     async def _handle_response_formulation_wrapper(self, step_input: StepInput) -> StepOutput:
         final_response_data = step_input.additional_data.get("final_response_data")
         
         context_for_formulation = {
             "current_message": step_input.message,
+            "recent_turns": step_input.additional_data.get("recent_turns", []),
             "order_state": step_input.additional_data.get("order_state").model_dump(),
             "promotions_info": step_input.additional_data.get("promotions_info", []),
             "suggestions_info": step_input.additional_data.get("suggestions_info", []),
@@ -326,25 +368,35 @@ class OrchestratorAgent:
             "file_summary": step_input.additional_data.get("file_summary"),
             "human_handoff_requested": final_response_data.human_handoff_needed,
             "send_menu_requested": final_response_data.send_menu_requested,
+            "failed_tasks": step_input.additional_data.get("failed_tasks", []),
         }
 
         response_obj = await self.response_formulation_agent.arun(
             json.dumps(context_for_formulation),
-            user_id=self.composite_session_id
+            **self.run_kwargs
         )
         
         # A resposta do agente está em response_obj.content, que é um objeto FinalResponseData.
-        # Retornamos isso diretamente para que o workflow possa processá-lo.
-        return StepOutput(content=response_obj.content)
+        # Os sinais já definidos pelos handlers não podem se perder na formulação.
+        formulated = response_obj.content
+        if isinstance(formulated, FinalResponseData):
+            formulated.human_handoff_needed = formulated.human_handoff_needed or final_response_data.human_handoff_needed
+            formulated.send_menu_requested = formulated.send_menu_requested or final_response_data.send_menu_requested
+            formulated.freight_details = formulated.freight_details or final_response_data.freight_details
+            formulated.file_summary = formulated.file_summary or final_response_data.file_summary
+        return StepOutput(content=formulated)
 
     async def _handle_human_handoff_wrapper(self, step_input: StepInput) -> StepOutput:
         final_response_data = step_input.additional_data.get("final_response_data")
-        self._handle_human_handoff(final_response_data)
+        # O snapshot já está em cache desde a recepção; sem self.db para não disputar a sessão no fan-out.
+        tenant = await get_tenant_snapshot(self.tenant_id)
+        self._handle_human_handoff(final_response_data, tenant)
         return StepOutput(content=final_response_data)
 
     async def _handle_menu_request_wrapper(self, step_input: StepInput) -> StepOutput:
         final_response_data = step_input.additional_data.get("final_response_data")
-        self._handle_menu_request(final_response_data)
+        tenant = await get_tenant_snapshot(self.tenant_id)
+        self._handle_menu_request(final_response_data, tenant)
         return StepOutput(content=final_response_data)
 
     async def _handle_order_taking_wrapper(self, step_input: StepInput) -> StepOutput:
@@ -352,7 +404,7 @@ class OrchestratorAgent:
         message = step_input.message
         tenant_id = step_input.additional_data.get("tenant_id")
 
-        order_output: OrderTakingOutput = (await self.order_taking_agent.arun(message)).content
+        order_output: OrderTakingOutput = (await self.order_taking_agent.arun(message, **self.run_kwargs)).content
         
         items_added = False
         if order_output.items:
@@ -366,7 +418,9 @@ class OrchestratorAgent:
                 tenant_id=self.tenant_id,
                 address_text=order_output.address
             )
-            await run_in_threadpool(user_address_crud.create_or_update_user_address, SessionLocal, address=address_schema)
+            # Roda dentro do fan-out: a sessão da requisição é usada com o lock da unidade de trabalho.
+            async with unit_of_work_session() as db:
+                await user_address_crud.create_or_update_user_address_async(db, address=address_schema)
 
         if order_output.is_final_order and order_state.items:
             order_state.status = "pending_delivery_method"
@@ -375,12 +429,20 @@ class OrchestratorAgent:
         if items_added:
             last_product_added_name = order_output.items[-1].product_name
             # Precisamos do ID do produto para buscar sugestões
-            product = await run_in_threadpool(product_crud.get_product_by_name_and_tenant_id, SessionLocal, name=last_product_added_name, tenant_id=tenant_id)
+            product = (await get_catalog_snapshot(tenant_id)).product_by_name(last_product_added_name)
             if product:
-                suggestions_result = await get_contextual_suggestions_tool(product.id_produto)
+                suggestions_result = await _call_tool(get_contextual_suggestions_tool, tenant_id, product.id)
                 step_input.additional_data["suggestions_info"] = json.loads(suggestions_result)
 
-        promotions_result = await get_applicable_promotions_tool(tenant_id, json.dumps(order_state.model_dump()))
+        await self._handle_promotions_wrapper(step_input)
+
+        return StepOutput(content="Pedido processado e sugestões/promoções buscadas.")
+
+    async def _handle_promotions_wrapper(self, step_input: StepInput) -> StepOutput:
+        order_state = step_input.additional_data.get("order_state")
+        tenant_id = step_input.additional_data.get("tenant_id")
+
+        promotions_result = await _call_tool(get_applicable_promotions_tool, tenant_id, json.dumps(order_state.model_dump()))
         step_input.additional_data["promotions_info"] = json.loads(promotions_result)
 
-        return StepOutput(content="Pedido processado e sugestões/promoções buscadas.")
\ No newline at end of file
+        return StepOutput(content="Promoções buscadas.")
\ No newline at end of file
@@ -0,0 +1,125 @@
+import json
+import logging
+import string
+from functools import lru_cache
+from typing import Dict, Optional
+
+from core.schemas import AIResponse
+from core.tenant_cache import TenantSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Tipos de resposta determinística, finalizados sem nenhuma chamada ao LLM.
+TEMPLATE_MENU = "menu"
+TEMPLATE_HUMAN_HANDOFF = "falar_com_humano"
+TEMPLATE_DUPLICATE_MESSAGE = "mensagem_duplicada"
+TEMPLATE_UNSUPPORTED_FILE = "arquivo_nao_suportado"
+TEMPLATE_MERGED_MESSAGE = "mensagem_agrupada"
+
+# Textos padrão. Uma mensagem duplicada ou agrupada a outra não gera resposta própria
+# ao cliente (texto vazio).
+DEFAULT_TEMPLATES: Dict[str, str] = {
+    TEMPLATE_MENU: "Claro! Aqui está o nosso cardápio.",
+    TEMPLATE_HUMAN_HANDOFF: "Entendi. Um de nossos atendentes irá continuar a conversa com você em instantes.",
+    TEMPLATE_DUPLICATE_MESSAGE: "",
+    TEMPLATE_MERGED_MESSAGE: "",
+    TEMPLATE_UNSUPPORTED_FILE: "Desculpe, não consigo processar este tipo de arquivo.",
+}
+
+# Flags do AIResponse ligadas por cada template.
+TEMPLATE_FLAGS: Dict[str, Dict[str, bool]] = {
+    TEMPLATE_MENU: {"send_menu": True},
+    TEMPLATE_HUMAN_HANDOFF: {"human_handoff": True},
+}
+
+
+class _ToneVariables(dict):
+    """Variáveis desconhecidas ficam vazias em vez de quebrar a renderização."""
+
+    def __missing__(self, key):
+        return ""
+
+
+def _load_json_object(raw: Optional[str], label: str) -> dict:
+    if not raw:
+        return {}
+    try:
+        value = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{label} inválido: {e}")
+    if not isinstance(value, dict) or not all(isinstance(v, str) for v in value.values()):
+        raise ValueError(f"{label} deve ser um objeto JSON com valores de texto.")
+    return value
+
+
+def _check_placeholders(template: str, label: str):
+    try:
+        list(string.Formatter().parse(template))
+    except ValueError as e:
+        raise ValueError(f"{label}: template '{template}' inválido: {e}")
+
+
+def parse_response_templates(response_templates: Optional[str]) -> Dict[str, str]:
+    """
+    Valida o JSON de templates do tenant, no formato
+    {"menu": "Segue o cardápio da {nome_loja} {emoji}", "falar_com_humano": "..."}.
+    Levanta ValueError se for inválido.
+    """
+    templates = _load_json_object(response_templates, "Templates de resposta")
+    for key, template in templates.items():
+        _check_placeholders(template, f"Template '{key}'")
+    return templates
+
+
+def parse_tone_variables(tone_variables: Optional[str]) -> Dict[str, str]:
+    """Valida o JSON de variáveis de tom da personalidade, ex.: {"emoji": "🍕", "tratamento": "você"}."""
+    return _load_json_object(tone_variables, "Variáveis de tom")
+
+
+@lru_cache(maxsize=512)
+def _get_templates(response_templates: Optional[str]) -> Dict[str, str]:
+    try:
+        custom = parse_response_templates(response_templates)
+    except ValueError as e:
+        logger.error(f"{e}. Usando apenas os templates padrão.")
+        custom = {}
+    return {**DEFAULT_TEMPLATES, **custom}
+
+
+@lru_cache(maxsize=512)
+def _get_tone_variables(tone_variables: Optional[str]) -> Dict[str, str]:
+    try:
+        return parse_tone_variables(tone_variables)
+    except ValueError as e:
+        logger.error(f"{e}. Ignorando as variáveis de tom.")
+        return {}
+
+
+def render_template(tenant: Optional[TenantSnapshot], kind: str, **extra) -> str:
+    """Renderiza o template do tenant com as variáveis de tom da personalidade."""
+    templates = _get_templates(tenant.response_templates if tenant else None)
+    template = templates.get(kind, "")
+    if not template:
+        return ""
+
+    variables = _ToneVariables()
+    if tenant is not None:
+        variables.update(_get_tone_variables(tenant.personality_tone_variables))
+        variables["nome_loja"] = tenant.nome_loja
+        variables["personalidade"] = tenant.personality_name or ""
+    variables.update(extra)
+    try:
+        return template.format_map(variables).strip()
+    except (IndexError, ValueError, AttributeError) as e:
+        logger.error(f"Erro ao renderizar o template '{kind}': {e}")
+        return template
+
+
+def build_template_response(tenant: Optional[TenantSnapshot], kind: str, **extra) -> dict:
+    """Monta a resposta completa (no formato do AIResponse) de um turno determinístico."""
+    flags = TEMPLATE_FLAGS.get(kind, {})
+    return AIResponse(
+        response_text=render_template(tenant, kind, **extra),
+        human_handoff=flags.get("human_handoff", False),
+        send_menu=flags.get("send_menu", False),
+    ).model_dump()
@@ -1,15 +1,15 @@
 import logging
-from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 from datetime import datetime
 
-from core import models, schemas
+from core.catalog_cache import CatalogSnapshot
 
 logger = logging.getLogger(__name__)
 
 class RulesEngine:
-    def __init__(self, db: Session):
-        self.db = db
+    def __init__(self, catalog: CatalogSnapshot):
+        # Snapshot imutável do catálogo do tenant (core/catalog_cache.py): nenhuma regra vai ao banco.
+        self.catalog = catalog
 
     def get_contextual_suggestions(self, product_id: int) -> List[Dict[str, Any]]:
         """
@@ -17,15 +17,15 @@ class RulesEngine:
         """
         suggestions = []
         
-        # Busca os opcionais ligados a este produto
-        product = self.db.query(models.Product).filter(models.Product.id_produto == product_id).first()
+        # Opcionais ligados a este produto
+        product = self.catalog.product(product_id)
         if product:
             for opcional in product.opcionais:
                 suggestions.append({
                     "tipo": "opcional",
-                    "id": opcional.id_opcional,
-                    "nome": opcional.nome_opcional,
-                    "preco": opcional.preco_adicional
+                    "id": opcional.id,
+                    "nome": opcional.nome,
+                    "preco": opcional.preco
                 })
         
         logger.debug(f"Sugestões contextuais para produto {product_id}: {suggestions}")
@@ -37,12 +37,7 @@ class RulesEngine:
         """
         applicable_promotions = []
         
-        promocoes = self.db.query(models.Promocao).filter(
-            models.Promocao.tenant_id == tenant_id,
-            models.Promocao.is_ativa == True
-        ).all()
-        
-        for promocao in promocoes:
+        for promocao in self.catalog.active_promotions():
             # Aqui a lógica para avaliar condicao_json e acao_json seria implementada.
             # Por enquanto, vamos apenas retornar a descrição para a IA se a promoção estiver ativa.
             # A lógica de avaliação real seria mais complexa e dependeria da estrutura do JSON.
@@ -50,8 +45,8 @@ class RulesEngine:
             # Exemplo simplificado: se a promoção tem uma descrição para a IA, consideramos aplicável
             if promocao.descricao_para_ia:
                 applicable_promotions.append({
-                    "id": promocao.id_promocao,
-                    "nome": promocao.nome_promocao,
+                    "id": promocao.id,
+                    "nome": promocao.nome,
                     "descricao_para_ia": promocao.descricao_para_ia,
                     "condicao_json": promocao.condicao_json,
                     "acao_json": promocao.acao_json
@@ -2,73 +2,55 @@ import os
 import logging
 import httpx
 import json
-import re
 from agno.tools import tool
-from agno.tools.sql import SQLTools # Importação corrigida
 from duckduckgo_search import DDGS
-from starlette.concurrency import run_in_threadpool
-from typing import Optional, List
-import asyncio
+from dataclasses import asdict
+from typing import Optional
 from agno.agent import Agent
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import text
 
-from core.database import SessionLocal, DATABASE_URL
-from crud import tenant_crud
-from core import models
+from core.catalog_cache import get_catalog_snapshot
+from core.tenant_cache import get_tenant_snapshot
+from services.rules_engine import RulesEngine
 
 logger = logging.getLogger(__name__)
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 
-class TenantSafeSQLTools(SQLTools):
-    def __init__(self, db_url: str, tenant_id: str):
-        super().__init__(db_url=db_url)
-        self.tenant_id = tenant_id
-        logger.info(f"TenantSafeSQLTools inicializada para o tenant: {self.tenant_id}")
-
-    def _add_tenant_filter(self, sql_query: str) -> str:
-        # Adiciona um filtro de tenant_id a todas as consultas SELECT
-        # Esta é uma medida de segurança para garantir o isolamento dos dados.
-        if 'select' in sql_query.lower():
-            if 'where' in sql_query.lower():
-                # Adiciona a condição a uma cláusula WHERE existente
-                sql_query = re.sub(r'(where\s+)', f"WHERE tenant_id = '{self.tenant_id}' AND ", sql_query, flags=re.IGNORECASE)
-            else:
-                # Adiciona uma nova cláusula WHERE
-                sql_query = re.sub(r'(from\s+[\w\".]+)', f"\1 WHERE tenant_id = '{self.tenant_id}'", sql_query, flags=re.IGNORECASE)
-        logger.info(f"Consulta SQL com filtro de tenant: {sql_query}")
-        return sql_query
-
-    def run_sql_query(self, query: str) -> str:
-        safe_query = self._add_tenant_filter(query)
-        return super().run_sql_query(safe_query)
-
 @tool
-def get_sql_query_tool(agent: Agent) -> List[TenantSafeSQLTools]:
-    """Retorna uma lista de ferramentas SQL seguras para o tenant."""
+async def search_catalog_tool(agent: Agent, termo: Optional[str] = None, categoria: Optional[str] = None) -> str:
+    """
+    Use esta ferramenta para consultar o cardápio da loja: produtos (com preço, categoria,
+    disponibilidade, opcionais e promoções ligadas) e as promoções ativas.
+    Informe 'termo' para buscar pelo nome ou descrição do produto e/ou 'categoria' para filtrar;
+    sem nenhum dos dois, retorna o cardápio completo.
+    """
     tenant_id = agent.session_state.get("tenant_id")
     if not tenant_id:
         raise ValueError("O tenant_id não foi encontrado no estado da sessão do agente.")
-    
-    return [TenantSafeSQLTools(db_url=DATABASE_URL, tenant_id=tenant_id)]
+    try:
+        catalog = await get_catalog_snapshot(tenant_id)
+        result = {
+            "produtos": [product.to_dict() for product in catalog.search(termo, categoria)],
+            "promocoes_ativas": [asdict(promocao) for promocao in catalog.active_promotions()],
+        }
+        return json.dumps(result, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"Erro na ferramenta search_catalog_tool: {e}", exc_info=True)
+        return f"Erro ao consultar o cardápio: {str(e)}"
 
 @tool
-async def get_contextual_suggestions_tool(product_id: int) -> str:
+async def get_contextual_suggestions_tool(tenant_id: str, product_id: int) -> str:
     """
     Use esta ferramenta para obter sugestões de opcionais e produtos adicionais
     relevantes para um produto específico que o cliente acabou de pedir.
     Retorna uma lista de dicionários com 'nome' e 'preco' das sugestões.
     """
-    db = SessionLocal()
     try:
-        rules_engine = RulesEngine(db)
-        suggestions = await run_in_threadpool(rules_engine.get_contextual_suggestions, product_id)
+        catalog = await get_catalog_snapshot(tenant_id)
+        suggestions = RulesEngine(catalog).get_contextual_suggestions(product_id)
         return json.dumps(suggestions)
     except Exception as e:
         logger.error(f"Erro na ferramenta get_contextual_suggestions_tool: {e}", exc_info=True)
         return f"Erro ao buscar sugestões: {str(e)}"
-    finally:
-        db.close()
 
 @tool
 async def get_applicable_promotions_tool(tenant_id: str, order_state_json: str) -> str:
@@ -77,26 +59,22 @@ async def get_applicable_promotions_tool(tenant_id: str, order_state_json: str)
     com base no ID do tenant e no estado atual do pedido (JSON string).
     Retorna uma lista de dicionários com detalhes das promoções.
     """
-    db = SessionLocal()
     try:
-        rules_engine = RulesEngine(db)
         order_state = json.loads(order_state_json) # Converte a string JSON de volta para dict
-        promotions = await run_in_threadpool(rules_engine.get_applicable_promotions, tenant_id, order_state)
+        catalog = await get_catalog_snapshot(tenant_id)
+        promotions = RulesEngine(catalog).get_applicable_promotions(tenant_id, order_state)
         return json.dumps(promotions)
     except Exception as e:
         logger.error(f"Erro na ferramenta get_applicable_promotions_tool: {e}", exc_info=True)
         return f"Erro ao buscar promoções aplicáveis: {str(e)}"
-    finally:
-        db.close()
 
 @tool
 async def freight_calculator(latitude_cliente: float, longitude_cliente: float, tenant_id: str) -> str:
     """
     Calcula o frete da loja até a localização do cliente.
     """
-    db = SessionLocal()
     try:
-        tenant = await run_in_threadpool(tenant_crud.get_tenant_by_id, db, tenant_id)
+        tenant = await get_tenant_snapshot(tenant_id)
         if not tenant:
             return "Erro: Loja não encontrada."
 
@@ -157,8 +135,6 @@ async def freight_calculator(latitude_cliente: float, longitude_cliente: float,
     except Exception as e:
         logger.error(f"Erro na ferramenta de cálculo de frete: {e}", exc_info=True)
         return "Ocorreu um erro interno ao tentar calcular o frete."
-    finally:
-        db.close()
 
 @tool
 def search_tool(query: str) -> str:
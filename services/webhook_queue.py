@@ -0,0 +1,193 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Modo assíncrono do /ai: a requisição é validada, enfileirada e respondida com 202.
+AI_ASYNC_ACK_ENABLED = os.getenv("AI_ASYNC_ACK_ENABLED", "false").lower() in ("1", "true", "yes")
+AI_QUEUE_MAX_SIZE = int(os.getenv("AI_QUEUE_MAX_SIZE", "100"))
+AI_QUEUE_WORKERS = int(os.getenv("AI_QUEUE_WORKERS", "4"))
+# URL que recebe as partes da resposta. Vazia = stub local em memória (útil para testes).
+AI_CALLBACK_URL = os.getenv("AI_CALLBACK_URL", "")
+AI_CALLBACK_TIMEOUT_SECONDS = float(os.getenv("AI_CALLBACK_TIMEOUT_SECONDS", "10"))
+AI_CALLBACK_MAX_RETRIES = int(os.getenv("AI_CALLBACK_MAX_RETRIES", "3"))
+AI_JOB_HISTORY_SIZE = int(os.getenv("AI_JOB_HISTORY_SIZE", "1000"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """A fila de mensagens está cheia; o chamador deve tentar novamente mais tarde."""
+
+
+@dataclass
+class WebhookJob:
+    payload: dict
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = JOB_QUEUED
+    response_parts: Optional[List[dict]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_callback(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "tenant_id": self.payload.get("tenant_id"),
+            "user_phone": self.payload.get("user_phone"),
+            "whatsapp_message_id": self.payload.get("whatsapp_message_id"),
+            "response_parts": self.response_parts or [],
+            "error": self.error,
+        }
+
+
+class LocalCallbackStub:
+    """Destino de callback em memória, usado quando AI_CALLBACK_URL não está definida."""
+
+    def __init__(self, max_size: int = AI_JOB_HISTORY_SIZE):
+        self.max_size = max_size
+        self.deliveries: "OrderedDict[str, dict]" = OrderedDict()
+
+    async def deliver(self, body: dict):
+        self.deliveries[body["job_id"]] = body
+        while len(self.deliveries) > self.max_size:
+            self.deliveries.popitem(last=False)
+
+    def clear(self):
+        self.deliveries.clear()
+
+
+class WebhookQueue:
+    """
+    Fila limitada em processo para as mensagens do /ai. Quando está cheia, submit()
+    levanta QueueFullError (o /ai responde 429) em vez de acumular trabalho sem limite.
+    Os workers executam o handler de cada job e entregam as partes da resposta no callback.
+    """
+
+    def __init__(
+        self,
+        max_size: int = AI_QUEUE_MAX_SIZE,
+        workers: int = AI_QUEUE_WORKERS,
+        callback_url: str = AI_CALLBACK_URL,
+        history_size: int = AI_JOB_HISTORY_SIZE,
+    ):
+        self.max_size = max_size
+        self.workers = workers
+        self.callback_url = callback_url
+        self.history_size = history_size
+        self.stub = LocalCallbackStub()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._jobs: "OrderedDict[str, WebhookJob]" = OrderedDict()
+        self._handler: Optional[Callable[[dict], Awaitable[List[dict]]]] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self, handler: Callable[[dict], Awaitable[List[dict]]]):
+        """Inicia os workers. Deve ser chamado dentro do event loop da aplicação."""
+        if self.running:
+            return
+        self._handler = handler
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._client = httpx.AsyncClient(timeout=AI_CALLBACK_TIMEOUT_SECONDS)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        destino = self.callback_url or "stub local"
+        logger.info(f"WebhookQueue: {self.workers} worker(s) iniciados (max_size={self.max_size}, callback={destino}).")
+
+    async def stop(self, timeout: float = 30.0):
+        """Aguarda os jobs pendentes (até o timeout) e encerra os workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"WebhookQueue: {self._queue.qsize()} job(s) descartado(s) no encerramento.")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._client.aclose()
+        self._client = None
+
+    def submit(self, payload: dict) -> WebhookJob:
+        if not self.running:
+            raise RuntimeError("WebhookQueue não foi iniciada.")
+        job = WebhookJob(payload=payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Fila de mensagens cheia ({self.max_size} jobs pendentes).")
+        self._remember(job)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[WebhookJob]:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self._queue.qsize() if self._queue else 0,
+            "max_size": self.max_size,
+            "workers": len(self._tasks),
+        }
+
+    def _remember(self, job: WebhookJob):
+        self._jobs[job.job_id] = job
+        while len(self._jobs) > self.history_size:
+            self._jobs.popitem(last=False)
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run_job(job)
+            except Exception as e:
+                logger.error(f"WebhookQueue worker {index}: erro inesperado no job {job.job_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job: WebhookJob):
+        job.status = JOB_RUNNING
+        try:
+            job.response_parts = await self._handler(job.payload)
+            job.status = JOB_DONE
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = getattr(e, "detail", None) or str(e)
+            logger.error(f"WebhookQueue: job {job.job_id} falhou: {job.error}")
+        job.finished_at = time.time()
+        await self._deliver(job)
+
+    async def _deliver(self, job: WebhookJob):
+        body = job.to_callback()
+        if not self.callback_url:
+            await self.stub.deliver(body)
+            return
+
+        for attempt in range(1, AI_CALLBACK_MAX_RETRIES + 1):
+            try:
+                response = await self._client.post(self.callback_url, json=body)
+                response.raise_for_status()
+                return
+            except httpx.HTTPError as e:
+                logger.warning(f"WebhookQueue: falha ao entregar o job {job.job_id} (tentativa {attempt}/{AI_CALLBACK_MAX_RETRIES}): {e}")
+                if attempt < AI_CALLBACK_MAX_RETRIES:
+                    await asyncio.sleep(2 ** (attempt - 1))
+        logger.error(f"WebhookQueue: job {job.job_id} não foi entregue em {self.callback_url}.")
+
+
+webhook_queue = WebhookQueue()
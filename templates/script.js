@@ -167,13 +167,27 @@ async function authenticatedFetch(url, options = {}) {
     return response;
 }
 
+// Busca todas as páginas de uma listagem paginada por cursor (cabeçalho X-Next-Cursor).
+// As respostas têm ETag: o navegador revalida com If-None-Match e reaproveita o cache nos 304.
+async function fetchAllPages(url) {
+    const items = [];
+    let cursor = null;
+    do {
+        const separator = url.includes('?') ? '&' : '?';
+        const response = await authenticatedFetch(cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url);
+        if (!response.ok) throw new Error(`Erro ${response.status} ao buscar ${url}`);
+        items.push(...await response.json());
+        cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return items;
+}
+
 // --- Tenant Management ---
 
 async function fetchClients() {
     console.log("Fetching clients");
     try {
-        const response = await authenticatedFetch('/tenants/');
-        const clients = await response.json();
+        const clients = await fetchAllPages('/tenants/');
         console.log("Clients received:", clients);
         const clientList = document.getElementById('client-list');
         if (!clientList) return;
@@ -181,16 +195,8 @@ async function fetchClients() {
         clients.forEach(client => {
             const li = document.createElement('li');
             li.className = 'client-item';
-            li.innerHTML = `
-                <div>
-                    <strong>${client.nome_loja || client.tenant_id}</strong><br>
-                    <small>ID: ${client.tenant_id} | ${client.is_active ? 'Ativo' : 'Inativo'}</small>
-                </div>
-                <div class="button-group">
-                    <button onclick="editClient('${client.tenant_id}')">Editar</button>
-                    <button onclick="deleteClient('${client.tenant_id}')">Remover</button>
-                    <button onclick="toggleClientStatus('${client.tenant_id}', ${client.is_active})">${client.is_active ? 'Desativar' : 'Ativar'}</button>
-                </div>`;
+            li.id = `client-${client.tenant_id}`;
+            renderClientItem(li, client);
             clientList.appendChild(li);
         });
     } catch (error) {
@@ -198,6 +204,20 @@ async function fetchClients() {
     }
 }
 
+function renderClientItem(li, client) {
+    li.dataset.nomeLoja = client.nome_loja || '';
+    li.innerHTML = `
+        <div>
+            <strong>${client.nome_loja || client.tenant_id}</strong><br>
+            <small>ID: ${client.tenant_id} | ${client.is_active ? 'Ativo' : 'Inativo'}</small>
+        </div>
+        <div class="button-group">
+            <button onclick="editClient('${client.tenant_id}')">Editar</button>
+            <button onclick="deleteClient('${client.tenant_id}')">Remover</button>
+            <button onclick="toggleClientStatus('${client.tenant_id}', ${client.is_active})">${client.is_active ? 'Desativar' : 'Ativar'}</button>
+        </div>`;
+}
+
 async function toggleClientStatus(tenantId, currentStatus) {
     const newStatus = !currentStatus;
     if (confirm(`Tem certeza que deseja ${newStatus ? 'ativar' : 'desativar'} o cliente "${tenantId}"?`)) {
@@ -209,7 +229,13 @@ async function toggleClientStatus(tenantId, currentStatus) {
             });
             if (response.ok) {
                 alert(`Cliente ${tenantId} ${newStatus ? 'ativado' : 'desativado'} com sucesso!`);
-                await fetchClients(); // Recarrega a lista para atualizar o status
+                // Atualiza só o item alterado, sem recarregar a lista inteira
+                const li = document.getElementById(`client-${tenantId}`);
+                if (li) {
+                    renderClientItem(li, { tenant_id: tenantId, nome_loja: li.dataset.nomeLoja, is_active: newStatus });
+                } else {
+                    await fetchClients();
+                }
             } else {
                 const errorJson = await response.json().catch(() => ({ detail: 'Erro desconhecido' }));
                 alert(`Erro ao alterar status do cliente: ${errorJson.detail}`);
@@ -383,8 +409,7 @@ async function populateFreteSelect() {
     const select = document.getElementById('frete_tenant_id');
     if (!select) return;
     try {
-        const response = await authenticatedFetch('/tenants/');
-        const clients = await response.json();
+        const clients = await fetchAllPages('/tenants/');
         select.innerHTML = '<option value="">Selecione uma loja...</option>';
         clients.forEach(client => {
             if (client.is_active) {
@@ -442,8 +467,7 @@ async function loadProducts(tenantId) {
     if (!productList) return;
     productList.innerHTML = '<p>Carregando produtos...</p>';
     try {
-        const response = await authenticatedFetch(`/products/${tenantId}`);
-        const products = await response.json();
+        const products = await fetchAllPages(`/products/${tenantId}`);
         
         console.log(`Produtos recebidos para o tenant ${tenantId}:`, JSON.stringify(products, null, 2)); // Log dos produtos recebidos
 
@@ -540,7 +564,7 @@ async function loadOpcionais(tenantId) {
     if (!opcionalList) return;
     opcionalList.innerHTML = '<p>Carregando opcionais...</p>';
     try {
-        const opcionais = await (await authenticatedFetch(`/opcionais/${tenantId}`)).json();
+        const opcionais = await fetchAllPages(`/opcionais/${tenantId}`);
         opcionalList.innerHTML = '';
         if (opcionais.length === 0) {
             opcionalList.innerHTML = '<p>Nenhum opcional cadastrado.</p>';
@@ -627,8 +651,7 @@ async function loadPromocoes(tenantId) {
     if (!promocaoList) return;
     promocaoList.innerHTML = '<p>Carregando promoções...</p>';
     try {
-        const response = await authenticatedFetch(`/promocoes/${tenantId}`);
-        const promocoes = await response.json();
+        const promocoes = await fetchAllPages(`/promocoes/${tenantId}`);
 
         console.log(`Promoções recebidas para o tenant ${tenantId}:`, JSON.stringify(promocoes, null, 2)); // Log
 
@@ -722,13 +745,12 @@ async function loadProductOpcionalLinking(productId) {
     if (!linkingDiv) return;
 
     try {
-        const [linkedRes, allRes] = await Promise.all([
+        const [linkedRes, allOpcionais] = await Promise.all([
             authenticatedFetch(`/products/${productId}/opcionais`),
-            authenticatedFetch(`/opcionais/${editingTenantId}`)
+            fetchAllPages(`/opcionais/${editingTenantId}`)
         ]);
 
         const linkedOpcionais = await linkedRes.json();
-        const allOpcionais = await allRes.json();
         const linkedIds = new Set(linkedOpcionais.map(op => op.id_opcional));
 
         linkingDiv.innerHTML = '<h4>Vincular Opcionais</h4>';
@@ -8,11 +8,14 @@ from dotenv import load_dotenv
 
 # --- CARREGAR O ARQUIVO DE AMBIENTE DE TESTE PRIMEIRO ---
 load_dotenv(dotenv_path=".env.test")
+# Cada teste assíncrono roda no seu próprio event loop e as conexões do asyncpg não podem
+# passar de um loop para outro: sem pool, cada sessão abre (e fecha) a sua conexão.
+os.environ.setdefault("DB_POOL_SIZE", "0")
 
 # Adiciona o diretório raiz ao path para encontrar os módulos
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from core.database import Base
+from core.database import Base, PinnedAsyncSessionLocal
 from alembic.config import Config
 from alembic import command
 
@@ -21,6 +24,11 @@ from api.dependencies import get_db
 from api.main import app
 from core import models, schemas
 from crud import tenant_crud
+from core.tenant_cache import tenant_cache
+from core.catalog_cache import catalog_cache
+from services.intent_router import intent_cache
+from services.message_dedup import message_deduplicator
+from services.conversation_history import conversation_history
 
 # --- USAR A URL DE TESTE ---
 TEST_DATABASE_URL = os.getenv("DATABASE_URL")
@@ -46,25 +54,54 @@ def setup_database():
     # Limpa o banco de dados após a sessão de testes
     Base.metadata.drop_all(bind=engine)
 
-@pytest.fixture(scope="function")
-def db_session():
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Cada teste roda em uma transação revertida, então os caches em processo não podem vazar entre testes."""
+    tenant_cache.clear()
+    catalog_cache.clear()
+    intent_cache.clear()
+    message_deduplicator.clear()
+    conversation_history.clear()
+    yield
+    tenant_cache.clear()
+    catalog_cache.clear()
+    intent_cache.clear()
+    message_deduplicator.clear()
+    conversation_history.clear()
+
+@pytest.fixture(autouse=True)
+def clean_database():
     """
-    Cria uma nova sessão de banco de dados para cada teste, dentro de uma transação.
-    A transação é revertida no final do teste, isolando-o.
+    As sessões síncrona e assíncrona dos testes usam conexões diferentes, então os dados
+    são confirmados de verdade e apagados ao fim de cada teste (depois de fechadas as sessões).
     """
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
+    yield
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+@pytest.fixture(scope="function")
+def db_session():
+    """Sessão síncrona para preparar os dados dos testes e testar o CRUD síncrono."""
+    session = TestingSessionLocal()
     yield session
     session.close()
-    transaction.rollback()
-    connection.close()
+
+@pytest.fixture(scope="function")
+async def async_db_session(db_session: Session):
+    """
+    AsyncSession real, a mesma da dependência get_async_db (conexão pega na primeira
+    consulta e presa à sessão), para que lazy loading indevido, run_sync e o checkout
+    da conexão falhem nos testes como falhariam na aplicação.
+    """
+    async with PinnedAsyncSessionLocal() as session:
+        yield session
 
 @pytest.fixture(scope="function")
 def client(db_session: Session):
     """
-    Cria um cliente de teste para a API e sobrescreve a dependência do DB
-    para usar a sessão de teste transacional.
+    Cria um cliente de teste para a API. O get_db síncrono usa a sessão do teste; o
+    get_async_db é o da aplicação, que enxerga os dados confirmados pelo teste.
     """
     def override_get_db():
         yield db_session
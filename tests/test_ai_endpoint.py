@@ -95,4 +95,158 @@ def test_ai_endpoint_invalid_tenant_id(client: TestClient, db_session: Session):
     response = client.post("/ai", json=request_data)
 
     assert response.status_code == 404 # Esperamos 404 Not Found
-    assert response.json()["detail"] == "Cliente com o ID 'non_existent_tenant' não foi encontrado ou está inativo."
\ No newline at end of file
+    assert response.json()["detail"] == "Cliente com o ID 'non_existent_tenant' não foi encontrado ou está inativo."
+
+@pytest.mark.asyncio
+async def test_webhook_queue_acknowledges_and_delivers_to_stub():
+    import asyncio
+    from services.webhook_queue import WebhookQueue, QueueFullError, JOB_DONE
+
+    release = asyncio.Event()
+
+    async def handler(payload):
+        await release.wait()
+        return [{"part_id": 1, "type": "text", "text_content": f"eco: {payload['message_user']}"}]
+
+    queue = WebhookQueue(max_size=1, workers=1, callback_url="")
+    queue.start(handler=handler)
+    try:
+        first = queue.submit({"message_user": "oi", "tenant_id": "t1"})
+        await asyncio.sleep(0)  # o worker retira o primeiro job da fila
+        second = queue.submit({"message_user": "tudo bem?", "tenant_id": "t1"})
+        # Fila cheia: a próxima mensagem é recusada em vez de esperar
+        with pytest.raises(QueueFullError):
+            queue.submit({"message_user": "alô?", "tenant_id": "t1"})
+
+        release.set()
+        await queue.stop(timeout=5)
+    finally:
+        release.set()
+
+    assert queue.get_job(first.job_id).status == JOB_DONE
+    delivered = queue.stub.deliveries[second.job_id]
+    assert delivered["response_parts"][0]["text_content"] == "eco: tudo bem?"
+
+
+@pytest.mark.asyncio
+async def test_handle_message_coalesces_burst_into_single_turn():
+    import asyncio
+    from unittest.mock import AsyncMock
+    from services import chat_service
+
+    turn_result = {"response_text": "Anotado: 2 x-burger sem cebola.", "human_handoff": False, "send_menu": False}
+    with patch.object(chat_service, "CHAT_COALESCE_WINDOW_SECONDS", 0.05), \
+         patch.object(chat_service, "_process_turn", new_callable=AsyncMock, return_value=turn_result) as mock_turn, \
+         patch.object(chat_service, "get_tenant_snapshot", new_callable=AsyncMock, return_value=None):
+
+        async def send(session_id, message, delay):
+            await asyncio.sleep(delay)
+            return await chat_service.handle_message(
+                user_id="5511999999999", session_id=session_id, message=message,
+                tenant_id="burst_tenant", personality_prompt="test"
+            )
+
+        results = await asyncio.gather(
+            send("wa_1", "quero", 0), send("wa_2", "2 x-burger", 0.01), send("wa_3", "sem cebola", 0.02)
+        )
+
+    mock_turn.assert_called_once()
+    assert mock_turn.call_args.kwargs["messages"] == [("wa_1", "quero"), ("wa_2", "2 x-burger"), ("wa_3", "sem cebola")]
+    # Só a última requisição recebe a resposta; as anteriores não geram mensagem própria
+    assert results[2] == turn_result
+    assert results[0]["response_text"] == "" and results[1]["response_text"] == ""
+
+
+@pytest.mark.asyncio
+async def test_handle_message_retry_during_processing_reuses_result():
+    import asyncio
+    from unittest.mock import AsyncMock
+    from services import chat_service
+    from services.message_dedup import message_deduplicator
+
+    release = asyncio.Event()
+    turn_result = {"response_text": "Pedido anotado!", "human_handoff": False, "send_menu": False}
+
+    async def slow_turn(**kwargs):
+        await release.wait()
+        message_deduplicator.mark_processed(kwargs["messages"][-1][0])
+        return turn_result
+
+    with patch.object(chat_service, "_process_turn", side_effect=slow_turn) as mock_turn, \
+         patch.object(chat_service, "get_tenant_snapshot", new_callable=AsyncMock, return_value=None):
+        params = dict(user_id="5511999999999", session_id="wa_retry", message="1 pizza", tenant_id="dedup_tenant", personality_prompt="test")
+
+        original = asyncio.create_task(chat_service.handle_message(**params))
+        await asyncio.sleep(0)
+        retry = asyncio.create_task(chat_service.handle_message(**params))
+        await asyncio.sleep(0)
+        release.set()
+
+        # O retry durante o processamento recebe a mesma resposta, sem rodar o workflow de novo
+        assert await original == turn_result
+        assert await retry == turn_result
+        assert mock_turn.call_count == 1
+
+        # Depois de gravado, o id é respondido pelo conjunto de recentes, sem ir ao banco
+        late_retry = await chat_service.handle_message(**params)
+        assert late_retry["response_text"] == ""
+        assert mock_turn.call_count == 1
+
+
+def test_hash_ring_remaps_only_the_new_node_share():
+    from core.hash_ring import ConsistentHashRing, conversation_routing_key
+
+    ring = ConsistentHashRing(["http://n1", "http://n2", "http://n3"])
+    keys = [conversation_routing_key(f"55119{i:08d}", "loja") for i in range(2000)]
+    before = {key: ring.get_node(key) for key in keys}
+
+    ring.add_node("http://n4")
+    moved = [key for key in keys if ring.get_node(key) != before[key]]
+    # Só as chaves que passaram para o nó novo mudam de dono (~1/4 delas).
+    assert all(ring.get_node(key) == "http://n4" for key in moved)
+    assert 0.15 < len(moved) / len(keys) < 0.35
+
+    preference = ring.get_nodes(keys[0], 3)
+    assert len(set(preference)) == 3 and preference[0] == ring.get_node(keys[0])
+
+
+@pytest.mark.asyncio
+async def test_sticky_routing_forwards_to_owner_or_handles_locally():
+    import httpx
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+    from core.hash_ring import ConsistentHashRing, conversation_routing_key
+    from api.sticky_routing import StickyRoutingMiddleware
+
+    async def local_ai(request):
+        return JSONResponse({"node": "local", "body": await request.json()})
+
+    forwarded = []
+
+    def remote_node(request: httpx.Request):
+        forwarded.append(request)
+        return httpx.Response(200, json={"node": str(request.url.host)})
+
+    ring = ConsistentHashRing(["http://self", "http://other"])
+    app = StickyRoutingMiddleware(
+        Starlette(routes=[Route("/ai", local_ai, methods=["POST"])]),
+        ring=ring, self_node="http://self",
+        client=httpx.AsyncClient(transport=httpx.MockTransport(remote_node)),
+    )
+    phones = [f"5511{i:09d}" for i in range(50)]
+    local_phone = next(p for p in phones if ring.get_node(conversation_routing_key(p, "loja")) == "http://self")
+    remote_phone = next(p for p in phones if ring.get_node(conversation_routing_key(p, "loja")) == "http://other")
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://self") as client:
+        response = await client.post("/ai", json={"user_phone": local_phone, "tenant_id": "loja"})
+        assert response.json() == {"node": "local", "body": {"user_phone": local_phone, "tenant_id": "loja"}}
+
+        response = await client.post("/ai", json={"user_phone": remote_phone, "tenant_id": "loja"})
+        assert response.json() == {"node": "other"}
+        assert forwarded[0].headers["x-sticky-forwarded"] == "1"
+
+        # Requisição já encaminhada por outro nó não é encaminhada de novo.
+        response = await client.post("/ai", json={"user_phone": remote_phone, "tenant_id": "loja"}, headers={"X-Sticky-Forwarded": "1"})
+        assert response.json()["node"] == "local"
+        assert len(forwarded) == 1
@@ -49,3 +49,47 @@ def test_create_tenant_api(mock_load_data_to_vector_db, client: TestClient, db_s
     assert "id" in data
 
 # Adicione mais testes para os outros endpoints da API aqui...
+
+def test_catalog_list_keyset_pages_and_conditional_get(client: TestClient, db_session: Session):
+    from crud import tenant_crud, product_crud
+    tenant_crud.create_tenant(db_session, schemas.TenantCreate(tenant_id="etag_tenant", nome_loja="ETag Store", ia_personality="etag_p", ai_prompt_description="etag_desc", endereco="e", cep="c", latitude=0.0, longitude=0.0), "etag_config")
+    for nome in ("Produto A", "Produto B", "Produto C"):
+        product_crud.create_product(db_session, schemas.ProductCreate(nome_produto=nome, preco_base=10.0), "etag_tenant")
+
+    response = client.post("/login", data={"password": os.getenv("ADMIN_PASSWORD")})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    first = client.get("/products/etag_tenant?limit=2", headers=headers)
+    assert first.status_code == 200
+    assert [p["nome_produto"] for p in first.json()] == ["Produto A", "Produto B"]
+    assert "opcionais" not in first.json()[0]
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get(f"/products/etag_tenant?limit=2&cursor={cursor}", headers=headers)
+    assert [p["nome_produto"] for p in second.json()] == ["Produto C"]
+    assert "X-Next-Cursor" not in second.headers
+
+    # Sem alterações no catálogo: 304 sem corpo
+    etag = first.headers["ETag"]
+    cached = client.get("/products/etag_tenant?limit=2", headers={**headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    # Qualquer escrita no catálogo muda a versão e invalida o ETag
+    product_crud.create_product(db_session, schemas.ProductCreate(nome_produto="Produto D", preco_base=12.0), "etag_tenant")
+    changed = client.get("/products/etag_tenant?limit=2", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_product_opcional_batch_rejects_oversized_lists(client: TestClient):
+    response = client.post("/login", data={"password": os.getenv("ADMIN_PASSWORD")})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    # Acima do limite, o lote passaria dos 65535 parâmetros de uma query no Postgres: 422, não 500
+    pairs = [{"product_id": i, "opcional_id": i} for i in range(5001)]
+    response = client.post("/catalog/qualquer_tenant/produto-opcional", json={"link": pairs}, headers=headers)
+    assert response.status_code == 422
+
+    rule = {"opcional_ids": list(range(501))}
+    response = client.post("/catalog/qualquer_tenant/produto-opcional", json={"unlink_rules": [rule]}, headers=headers)
+    assert response.status_code == 422
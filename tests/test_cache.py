@@ -0,0 +1,388 @@
+import asyncio
+import pytest
+from datetime import datetime
+from unittest.mock import patch, AsyncMock
+
+from agno.memory.v2.db.postgres import PostgresMemoryDb
+from agno.memory.v2.db.schema import MemoryRow
+
+from core.memory_db import CachedPostgresMemoryDb
+
+
+@patch.object(PostgresMemoryDb, '__init__', return_value=None)
+def test_memory_db_caches_reads_until_write(mock_init):
+    memory_db = CachedPostgresMemoryDb(table_name="user_memories", cache_ttl=60)
+    row = MemoryRow(id="m1", user_id="5511999999999_loja", memory={"memory": "gosta de bacon"})
+
+    with patch.object(PostgresMemoryDb, 'read_memories', return_value=[row]) as mock_read, \
+         patch.object(PostgresMemoryDb, 'upsert_memory', return_value=row):
+        memory_db.read_memories(user_id="5511999999999_loja")
+        memory_db.read_memories(user_id="5511999999999_loja")
+        assert mock_read.call_count == 1
+
+        # Uma escrita do mesmo usuário invalida o cache
+        memory_db.upsert_memory(row)
+        memory_db.read_memories(user_id="5511999999999_loja")
+        assert mock_read.call_count == 2
+
+
+@patch('core.vector_db.VectorDBManager')
+def test_vector_db_manager_cache_evicts_least_recently_used(MockVectorDBManager):
+    from core.vector_db import VectorDBManagerCache
+
+    MockVectorDBManager.side_effect = lambda collection_name: object()
+    cache = VectorDBManagerCache(max_size=2)
+
+    tenant_a = cache.get("tenant_a")
+    cache.get("tenant_b")
+    assert cache.get("tenant_a") is tenant_a  # tenant_a passa a ser o mais recente
+
+    cache.get("tenant_c")  # remove tenant_b
+    assert len(cache) == 2
+    assert cache.get("tenant_a") is tenant_a
+    assert MockVectorDBManager.call_count == 3
+
+    cache.invalidate("tenant_a")
+    assert cache.get("tenant_a") is not tenant_a
+
+
+async def test_tenant_snapshot_cache_is_invalidated_on_toggle(db_session, async_db_session, test_tenant):
+    from core.tenant_cache import get_tenant_snapshot
+    from crud import tenant_crud
+
+    snapshot = await get_tenant_snapshot(test_tenant.tenant_id, async_db_session)
+    assert snapshot.is_active is True
+    assert snapshot.nome_loja == "Loja de Teste"
+
+    # Com o cache quente, nenhuma query de tenant é feita
+    with patch('crud.tenant_crud.get_tenant_by_id_async', new_callable=AsyncMock) as mock_get:
+        assert await get_tenant_snapshot(test_tenant.tenant_id, async_db_session) is snapshot
+        mock_get.assert_not_called()
+
+    tenant_crud.toggle_tenant_status(db_session, test_tenant.tenant_id, False)
+    # A próxima leitura é de outra requisição: a sessão não guarda o Tenant já carregado
+    await async_db_session.rollback()
+    snapshot = await get_tenant_snapshot(test_tenant.tenant_id, async_db_session)
+    assert snapshot.is_active is False
+
+
+async def test_tenant_snapshot_cache_caches_unknown_tenants(async_db_session):
+    from core.tenant_cache import get_tenant_snapshot
+
+    assert await get_tenant_snapshot("tenant_inexistente", async_db_session) is None
+    with patch('crud.tenant_crud.get_tenant_by_id_async', new_callable=AsyncMock) as mock_get:
+        assert await get_tenant_snapshot("tenant_inexistente", async_db_session) is None
+        mock_get.assert_not_called()
+
+
+async def test_catalog_snapshot_indexes_and_is_rebuilt_after_catalog_write(db_session, async_db_session, test_tenant):
+    from core import schemas
+    from core.catalog_cache import get_catalog_snapshot
+    from crud import product_crud, opcional_crud
+
+    tenant_id = test_tenant.tenant_id
+    burger = product_crud.create_product(db_session, schemas.ProductCreate(nome_produto="X-Búrguer", categoria_produto="Lanches", preco_base=20.0), tenant_id)
+    bacon = opcional_crud.create_opcional(db_session, schemas.OpcionalCreate(nome_opcional="Bacon", tipo_opcional="Adicional", preco_adicional=4.0), tenant_id)
+    product_crud.link_opcional_to_product(db_session, burger.id_produto, bacon.id_opcional)
+
+    catalog = await get_catalog_snapshot(tenant_id, async_db_session)
+    assert catalog.product_by_name("  x-burguer ").id == burger.id_produto
+    assert [p.nome for p in catalog.products_in_category("lanches")] == ["X-Búrguer"]
+    assert [o.nome for o in catalog.product(burger.id_produto).opcionais] == ["Bacon"]
+
+    # Sem alteração do catálogo, o snapshot é reaproveitado sem ir ao banco
+    with patch('core.catalog_cache.load_catalog_snapshot') as mock_load:
+        assert await get_catalog_snapshot(tenant_id, async_db_session) is catalog
+        mock_load.assert_not_called()
+
+    # O commit de uma alteração do catálogo invalida o snapshot
+    product_crud.create_product(db_session, schemas.ProductCreate(nome_produto="Suco", categoria_produto="Bebidas", preco_base=8.0), tenant_id)
+    await async_db_session.rollback()
+    rebuilt = await get_catalog_snapshot(tenant_id, async_db_session)
+    assert rebuilt.version > catalog.version
+    assert rebuilt.product_by_name("suco") is not None
+    assert catalog.product_by_name("suco") is None
+
+
+async def test_invalidation_bus_publishes_after_commit_and_applies_remote_events(db_session, async_db_session, test_tenant):
+    from core import models
+    from core.catalog_cache import catalog_cache, get_catalog_snapshot
+    from core.invalidation_bus import ENTITY_TENANT, InvalidationBus, InvalidationEvent
+    from core.tenant_cache import get_tenant_snapshot, tenant_cache
+    from crud import tenant_crud
+
+    tenant_id = test_tenant.tenant_id
+    tenant_crud.toggle_tenant_status(db_session, tenant_id, False)
+    event = db_session.query(models.CacheInvalidation).order_by(models.CacheInvalidation.id.desc()).first()
+    assert (event.entity, event.tenant_id) == (ENTITY_TENANT, tenant_id)
+
+    await get_tenant_snapshot(tenant_id, async_db_session)
+    await get_catalog_snapshot(tenant_id, async_db_session)
+    bus = InvalidationBus(mode="poll")
+
+    # Eventos do próprio worker já foram aplicados no commit
+    bus.handle(InvalidationEvent.from_row(event))
+    assert tenant_cache.peek(tenant_id)[0] is True
+    assert bus.applied == 0
+
+    remote = InvalidationEvent(entity=ENTITY_TENANT, tenant_id=tenant_id, origin="outro_worker", id=event.id + 1)
+    bus.handle(InvalidationEvent.from_payload(remote.to_payload()))
+    assert tenant_cache.peek(tenant_id)[0] is False
+    assert catalog_cache.peek(tenant_id)[0] is None
+
+    # O mesmo evento relido do outbox não é aplicado de novo
+    bus.handle(remote)
+    assert bus.applied == 1
+
+
+def test_intent_cache_normalizes_and_bypasses_open_orders():
+    from core.schemas import AnaliseDeIntencao, TarefaIdentificada, OrderState, OrderItem
+    from services.intent_router import IntentCache
+
+    cache = IntentCache(max_size=10, ttl=60)
+    analise = AnaliseDeIntencao(
+        tarefas=[TarefaIdentificada(tipo_tarefa="fazer_pergunta_geral", detalhes="saudação")],
+        contem_urgencia=False
+    )
+
+    cache.put("loja", "Oi!", analise, OrderState())
+    assert cache.get("loja", "  oi ", OrderState()).tarefas[0].tipo_tarefa == "fazer_pergunta_geral"
+    assert cache.get("outra_loja", "oi", OrderState()) is None
+
+    # Com itens no carrinho, "sim" muda de significado: o cache é ignorado
+    pedido_aberto = OrderState(items=[OrderItem(product_name="X-Burger", quantity=1)])
+    cache.put("loja", "sim", analise, pedido_aberto)
+    assert cache.get("loja", "sim", pedido_aberto) is None
+
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "bypasses": 1}
+
+
+def test_order_state_compact_serialization_roundtrip():
+    from core.conversation_state import serialize_order_state, deserialize_order_state
+    from core.schemas import OrderState, OrderItem
+
+    assert serialize_order_state(OrderState()) == b"{}"
+
+    state = OrderState(items=[OrderItem(product_name="X-Burguer", quantity=2)], address="Rua A, 10", status="pending_delivery_method")
+    raw = serialize_order_state(state)
+    assert len(raw) < len(state.model_dump_json())
+    assert deserialize_order_state(raw) == state
+
+
+async def test_conversation_state_stores_share_interface_and_ttl():
+    import fakeredis
+    from core.conversation_state import InMemoryStateStore, RedisStateStore
+    from core.schemas import OrderState, OrderItem
+
+    state = OrderState(items=[OrderItem(product_name="Pizza", quantity=1)])
+    for store in (InMemoryStateStore(), RedisStateStore(client=fakeredis.FakeAsyncRedis())):
+        assert await store.get_order_state("5511_loja") == OrderState()
+
+        await store.save_order_state("5511_loja", state)
+        assert await store.get_order_state("5511_loja") == state
+
+        # TTL por chave: o estado some quando expira
+        await store.save_order_state("5511_loja", state, ttl=0.001)
+        await asyncio.sleep(0.01)
+        assert await store.get_order_state("5511_loja") == OrderState()
+        await store.close()
+
+
+async def test_in_memory_state_store_is_bounded_and_archives_abandoned_carts():
+    from core.conversation_state import InMemoryStateStore
+    from core.schemas import OrderState, OrderItem
+
+    archived = []
+    release = asyncio.Event()
+
+    async def archiver(session_id, state, last_activity_at):
+        await release.wait()
+        archived.append((session_id, state))
+
+    store = InMemoryStateStore(max_entries=2, idle_ttl=3600, abandoned_cart_seconds=3600, archiver=archiver)
+    cart = OrderState(items=[OrderItem(product_name="Pizza", quantity=1)])
+
+    await store.save_order_state("5511_loja", cart)
+    await store.save_last_interaction("5511_loja", datetime.now())
+    assert store.stats()["entries"] == 2
+    assert store.stats()["estimated_bytes"] > 0
+
+    # O limite de entradas remove a mais antiga; um carrinho em aberto é arquivado, não descartado
+    # (em segundo plano: o set() não espera pelo arquivamento)
+    await store.save_order_state("5522_loja", OrderState())
+    assert store.stats()["entries"] == 2
+    assert archived == []
+    release.set()
+    await store.wait_archived()
+    assert archived == [("5511_loja", cart)]
+
+    # O sweeper remove entradas inativas
+    store.idle_ttl = 0
+    assert await store.sweep() == 2
+    assert store.stats() == {"entries": 0, "estimated_bytes": 0, "evictions": 3, "archived_carts": 1}
+
+
+
+async def test_postgres_state_store_purges_expired_rows_in_background(db_session):
+    from core import models
+    from core.conversation_state import PostgresStateStore
+
+    store = PostgresStateStore()
+    await store.set("order:expirado_loja", b"{}", ttl=0.01)
+    await store.set("order:ativo_loja", b"{}", ttl=3600)
+    await asyncio.sleep(0.05)
+
+    # O purge periódico iniciado por start() apaga as linhas expiradas, não só as ignora na leitura
+    store.start(purge_interval=0.01)
+    try:
+        for _ in range(100):
+            if store.stats()["purged"]:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await store.close()
+
+    keys = [row.key for row in db_session.query(models.ConversationState).all()]
+    assert keys == ["order:ativo_loja"]
+    assert store.stats()["purged"] == 1
+
+async def test_conversation_lock_serializes_same_conversation_only():
+    from core.conversation_lock import ConversationLockManager
+
+    locks = ConversationLockManager(distributed=False)
+    events = []
+
+    async def turn(session_id, name):
+        async with locks.lock(session_id):
+            events.append(f"{name}:start")
+            await asyncio.sleep(0.01)
+            events.append(f"{name}:end")
+
+    await asyncio.gather(turn("5511_loja", "a1"), turn("5511_loja", "a2"), turn("5522_loja", "b1"))
+
+    # a1 e a2 (mesma conversa) não se sobrepõem; b1 roda em paralelo com a1
+    assert events.index("a1:end") < events.index("a2:start")
+    assert events.index("b1:start") < events.index("a1:end")
+    # Os locks locais são descartados quando ninguém mais os usa
+    assert len(locks) == 0
+
+
+
+async def test_conversation_lock_fails_instead_of_running_without_the_distributed_lock():
+    from core.conversation_lock import ConversationLockManager, ConversationBusyError
+
+    # Dois gerenciadores simulam dois workers disputando a mesma conversa
+    worker_a = ConversationLockManager(distributed=True, timeout=0.2)
+    worker_b = ConversationLockManager(distributed=True, timeout=0.2)
+    try:
+        async with worker_a.lock("5511_loja"):
+            with pytest.raises(ConversationBusyError):
+                async with worker_b.lock("5511_loja"):
+                    pass
+            # Outra conversa não é afetada
+            async with worker_b.lock("5522_loja"):
+                pass
+        # Encerrado o turno, o lock é liberado
+        async with worker_b.lock("5511_loja"):
+            pass
+    finally:
+        await worker_a.close()
+        await worker_b.close()
+
+async def test_unit_of_work_shares_one_connection_per_request():
+    from sqlalchemy import text
+    from core.unit_of_work import unit_of_work, unit_of_work_session, run_sync
+
+    async with unit_of_work() as idle:
+        pass
+    # Sem consulta, nenhuma conexão é pega (ex.: o 202 do modo assíncrono)
+    assert idle.connections_opened == 0
+
+    async with unit_of_work() as uow:
+        assert uow.connections_opened == 0
+        await uow.db.execute(text("SELECT 1"))
+        await uow.db.commit()
+        # Acessos concorrentes (como no fan-out) usam a mesma sessão, em sequência
+        async def query():
+            async with unit_of_work_session() as db:
+                await db.execute(text("SELECT 1"))
+
+        await asyncio.gather(query(), query(), run_sync(lambda db: db.execute(text("SELECT 1"))))
+        async with unit_of_work() as nested:
+            assert nested is uow
+
+        # Regressão: código no caminho do /ai não deve abrir conexões próprias
+        assert uow.connections_opened == 1
+
+
+async def test_interaction_writer_batches_and_flushes_on_stop():
+    from core.schemas import InteractionCreate
+    from services.interaction_writer import InteractionWriter
+
+    batches = []
+
+    class FakeSession:
+        bind = type("Bind", (), {"dialect": type("Dialect", (), {"name": "postgresql"})()})()
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def execute(self, stmt, rows):
+            batches.append([row["whatsapp_message_id"] for row in rows])
+
+        async def commit(self):
+            pass
+
+    writer = InteractionWriter(batch_size=2, flush_interval=60, session_factory=FakeSession)
+    writer.start()
+    for i in range(3):
+        await writer.write(None, InteractionCreate(user_phone="5511", whatsapp_message_id=f"m{i}", message_from_user="oi", personality_id=1, tenant_id="loja"))
+
+    # O lote cheio é gravado sem esperar o intervalo, em um único INSERT
+    await asyncio.sleep(0.01)
+    assert batches == [["m0", "m1"]]
+
+    # O restante é gravado no encerramento
+    await writer.stop()
+    assert batches == [["m0", "m1"], ["m2"]]
+    assert writer.stats()["pending"] == 0 and writer.stats()["rows_written"] == 3
+
+
+async def test_interaction_writer_drops_rows_rejected_by_the_database():
+    from sqlalchemy.exc import IntegrityError
+    from core.schemas import InteractionCreate
+    from services.interaction_writer import InteractionWriter
+
+    batches = []
+
+    class FakeSession:
+        bind = type("Bind", (), {"dialect": type("Dialect", (), {"name": "postgresql"})()})()
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def execute(self, stmt, rows):
+            ids = [row["whatsapp_message_id"] for row in rows]
+            if "bad" in ids:
+                raise IntegrityError("INSERT INTO interactions", rows, Exception("violates foreign key constraint"))
+            batches.append(ids)
+
+        async def commit(self):
+            pass
+
+    writer = InteractionWriter(batch_size=3, flush_interval=60, session_factory=FakeSession)
+    writer.start()
+    for message_id in ("m0", "bad", "m1"):
+        await writer.write(None, InteractionCreate(user_phone="5511", whatsapp_message_id=message_id, message_from_user="oi", personality_id=1, tenant_id="loja"))
+    await writer.stop()
+
+    # O lote recusado é regravado linha a linha; só a linha inválida se perde, sem voltar ao buffer
+    assert batches == [["m0"], ["m1"]]
+    stats = writer.stats()
+    assert stats["pending"] == 0 and stats["rows_written"] == 2 and stats["rejected"] == 1
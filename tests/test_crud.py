@@ -168,6 +168,64 @@ def test_link_and_unlink_opcional_to_product(db_session: Session):
     linked_opcionais = product_crud.get_linked_opcionais(db_session, product.id_produto)
     assert len(linked_opcionais) == 0
 
+def test_import_catalog_upserts_and_reports_row_errors(db_session: Session):
+    import io
+    from services import catalog_import
+    tenant_crud.create_tenant(db_session, schemas.TenantCreate(tenant_id="import_tenant", nome_loja="Import Store", ia_personality="import_p", ai_prompt_description="import_desc", endereco="e", cep="c", latitude=0.0, longitude=0.0), "import_config")
+    product_crud.create_product(db_session, schemas.ProductCreate(nome_produto="Pizza Calabresa", preco_base=30.0), "import_tenant")
+
+    produtos = "nome_produto;preco_base;categoria_produto\npizza calabresa;42,50;Pizzas\nSuco;8;Bebidas\n;10;Sem nome\nRefri;abc;Bebidas\nSuco;9;Bebidas\n"
+    report = catalog_import.import_catalog(db_session, "import_tenant", io.BytesIO(produtos.encode("utf-8")), "produtos.csv", entity="produtos")
+
+    assert report["entidades"]["produtos"] == {"linhas": 5, "gravadas": 2, "erros": 3, "colunas_ignoradas": []}
+    assert [(e["linha"], e["erro"]) for e in report["erros"]] == [
+        (4, "nome_produto é obrigatório"),
+        (5, "preco_base deve ser um número maior ou igual a zero"),
+        (6, "nome_produto repetido no arquivo (linha 3)"),
+    ]
+    products = {p.nome_produto: p for p in product_crud.get_products_by_tenant(db_session, "import_tenant")}
+    # O produto existente foi atualizado pelo ON CONFLICT, não duplicado
+    assert set(products) == {"pizza calabresa", "Suco"}
+    assert products["pizza calabresa"].preco_base == 42.5
+
+    opcional_crud.create_opcional(db_session, schemas.OpcionalCreate(nome_opcional="Borda Recheada", tipo_opcional="Adicional", preco_adicional=5.0), "import_tenant")
+    links = "produto,opcional\nPizza Calabresa,borda recheada\nPizza Calabresa,Borda Recheada\nSuco,Gelo Extra\n"
+    report = catalog_import.import_catalog(db_session, "import_tenant", io.BytesIO(links.encode("utf-8")), "links.csv", entity="produto_opcional")
+
+    assert report["erros"] == [{"entidade": "produto_opcional", "linha": 4, "erro": "opcional 'Gelo Extra' não encontrado"}]
+    linked = product_crud.get_linked_opcionais(db_session, products["pizza calabresa"].id_produto)
+    assert [o.nome_opcional for o in linked] == ["Borda Recheada"]
+
+def test_product_opcional_batch_links_by_pairs_and_rules(db_session: Session):
+    from crud import catalog_crud
+    tenant_crud.create_tenant(db_session, schemas.TenantCreate(tenant_id="batch_tenant", nome_loja="Batch Store", ia_personality="batch_p", ai_prompt_description="batch_desc", endereco="e", cep="c", latitude=0.0, longitude=0.0), "batch_config")
+    tenant_crud.create_tenant(db_session, schemas.TenantCreate(tenant_id="other_batch_tenant", nome_loja="Other Store", ia_personality="other_batch_p", ai_prompt_description="other_desc", endereco="e", cep="c", latitude=0.0, longitude=0.0), "other_config")
+    pizza = product_crud.create_product(db_session, schemas.ProductCreate(nome_produto="Pizza", categoria_produto="Pizzas", preco_base=30.0), "batch_tenant")
+    calzone = product_crud.create_product(db_session, schemas.ProductCreate(nome_produto="Calzone", categoria_produto="pizzas", preco_base=35.0), "batch_tenant")
+    suco = product_crud.create_product(db_session, schemas.ProductCreate(nome_produto="Suco", categoria_produto="Bebidas", preco_base=8.0), "batch_tenant")
+    borda = opcional_crud.create_opcional(db_session, schemas.OpcionalCreate(nome_opcional="Borda", tipo_opcional="Adicional", preco_adicional=5.0), "batch_tenant")
+    gelo = opcional_crud.create_opcional(db_session, schemas.OpcionalCreate(nome_opcional="Sem gelo", tipo_opcional="Remoção"), "batch_tenant")
+    alheio = opcional_crud.create_opcional(db_session, schemas.OpcionalCreate(nome_opcional="Alheio", tipo_opcional="Adicional"), "other_batch_tenant")
+
+    # Uma única consulta aponta ids inexistentes ou de outro tenant
+    assert catalog_crud.get_foreign_ids(db_session, "batch_tenant", [pizza.id_produto, 999999], [borda.id_opcional, alheio.id_opcional]) == {
+        "produtos": [999999], "opcionais": [alheio.id_opcional],
+    }
+
+    batch = schemas.ProductOpcionalBatch(
+        link=[schemas.ProductOpcionalPair(product_id=suco.id_produto, opcional_id=gelo.id_opcional)],
+        link_rules=[schemas.ProductOpcionalRule(opcional_ids=[borda.id_opcional], categoria_produto="Pizzas")],
+    )
+    assert catalog_crud.apply_product_opcional_batch(db_session, "batch_tenant", batch) == {"linked": 3, "unlinked": 0}
+    assert [o.nome_opcional for o in product_crud.get_linked_opcionais(db_session, calzone.id_produto)] == ["Borda"]
+    assert [o.nome_opcional for o in product_crud.get_linked_opcionais(db_session, suco.id_produto)] == ["Sem gelo"]
+
+    # Reaplicar não duplica; desligar por regra remove de todos os produtos do tenant
+    assert catalog_crud.apply_product_opcional_batch(db_session, "batch_tenant", batch)["linked"] == 0
+    unlink = schemas.ProductOpcionalBatch(unlink_rules=[schemas.ProductOpcionalRule(opcional_ids=[borda.id_opcional])])
+    assert catalog_crud.apply_product_opcional_batch(db_session, "batch_tenant", unlink) == {"linked": 0, "unlinked": 2}
+    assert product_crud.get_linked_opcionais(db_session, pizza.id_produto) == []
+
 # Testes para Opcional CRUD
 def test_create_opcional(db_session: Session):
     tenant_crud.create_tenant(db_session, schemas.TenantCreate(tenant_id="opc_tenant", nome_loja="Opc Store", ia_personality="opc_p", ai_prompt_description="opc_desc", endereco="e", cep="c", latitude=0.0, longitude=0.0), "opc_config")
@@ -1,6 +1,7 @@
 import pytest
 from sqlalchemy.orm import Session
 from services.rules_engine import RulesEngine
+from core.catalog_cache import load_catalog_snapshot
 from crud import product_crud, opcional_crud, promocao_crud, tenant_crud # Import tenant_crud
 from core import schemas
 
@@ -34,7 +35,7 @@ def test_get_contextual_suggestions(db_session: Session):
     product_crud.link_opcional_to_product(db_session, db_product.id_produto, db_opcional2.id_opcional)
 
     # 3. Executar a lógica e verificar
-    rules_engine = RulesEngine(db_session)
+    rules_engine = RulesEngine(load_catalog_snapshot(db_session, tenant_id))
     suggestions = rules_engine.get_contextual_suggestions(db_product.id_produto)
 
     assert len(suggestions) == 2
@@ -43,3 +44,95 @@ def test_get_contextual_suggestions(db_session: Session):
     assert "Queijo Extra" in suggestion_names
 
 # Adicione mais testes para a lógica de promoções e o orchestrator aqui...
+
+
+def test_intent_router_fast_path():
+    from services.intent_router import IntentRouter
+
+    router = IntentRouter.from_config()
+
+    assert router.classify("Cardápio, por favor!").tarefas[0].tipo_tarefa == "menu"
+    assert router.classify("quero falar com um ATENDENTE").tarefas[0].tipo_tarefa == "falar_com_humano"
+    assert router.classify("qual o frete?").tarefas[0].tipo_tarefa == "frete"
+
+    # Mensagens com mais de uma intenção ou com conteúdo extra ficam para o LLM
+    assert router.classify("quero um x-burger e qual o frete?") is None
+    assert router.classify("manda o cardápio e chama um atendente") is None
+    assert router.classify("que horas vocês fecham?") is None
+
+
+def test_intent_router_tenant_rules():
+    from services.intent_router import IntentRouter
+
+    router = IntentRouter.from_config({"rules": {"menu": {"keywords": ["lanches"], "patterns": [r"^opcoes?$"]}}})
+    assert router.classify("ver os lanches").tarefas[0].tipo_tarefa == "menu"
+    assert router.classify("Opções").tarefas[0].tipo_tarefa == "menu"
+
+    assert IntentRouter.from_config({"enabled": False}).classify("cardápio") is None
+
+
+def test_response_templates_render_with_tone_variables():
+    import json
+    from core.tenant_cache import TenantSnapshot
+    from services.response_templates import (
+        render_template, build_template_response, parse_response_templates,
+        TEMPLATE_MENU, TEMPLATE_HUMAN_HANDOFF, TEMPLATE_UNSUPPORTED_FILE
+    )
+
+    tenant = TenantSnapshot(
+        tenant_id="templates_tenant", nome_loja="Pizzaria Teste", is_active=True, endereco=None,
+        latitude=None, longitude=None, freight_config=None, intent_rules=None,
+        response_templates=json.dumps({"menu": "Olha o cardápio da {nome_loja} {emoji}", "arquivo_nao_suportado": "Não consigo abrir esse arquivo, {tratamento}!"}),
+        personality_id=1, personality_name="divertida", personality_prompt="prompt",
+        personality_tone_variables=json.dumps({"emoji": "🍕", "tratamento": "meu querido"}),
+    )
+
+    assert render_template(tenant, TEMPLATE_MENU) == "Olha o cardápio da Pizzaria Teste 🍕"
+    assert render_template(tenant, TEMPLATE_UNSUPPORTED_FILE) == "Não consigo abrir esse arquivo, meu querido!"
+    # Sem template próprio, vale o texto padrão
+    assert "Um de nossos atendentes" in render_template(tenant, TEMPLATE_HUMAN_HANDOFF)
+
+    response = build_template_response(tenant, TEMPLATE_HUMAN_HANDOFF)
+    assert response["human_handoff"] is True and response["send_menu"] is False
+
+    with pytest.raises(ValueError):
+        parse_response_templates('["não é um objeto"]')
+
+
+@pytest.mark.asyncio
+async def test_conversation_history_keyset_pages_and_recent_window(db_session: Session, async_db_session, test_tenant):
+    from datetime import datetime, timedelta, timezone
+    from core import models
+    from services.conversation_history import ConversationHistory
+
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for i in range(5):
+        db_session.add(models.Interaction(
+            user_phone="5511999990000", whatsapp_message_id=f"hist_{i}", message_from_user=f"msg {i}",
+            ai_response=f"resp {i}", created_at=start + timedelta(minutes=i),
+            personality_id=test_tenant.personality_id, tenant_id=test_tenant.tenant_id,
+        ))
+    db_session.commit()
+
+    history = ConversationHistory(recent_turns=3)
+    first, cursor = await history.page(async_db_session, test_tenant.tenant_id, "5511999990000", limit=2)
+    second, cursor = await history.page(async_db_session, test_tenant.tenant_id, "5511999990000", limit=2, cursor=cursor)
+    third, cursor = await history.page(async_db_session, test_tenant.tenant_id, "5511999990000", limit=2, cursor=cursor)
+    assert [t.whatsapp_message_id for t in first + second + third] == ["hist_4", "hist_3", "hist_2", "hist_1", "hist_0"]
+    assert cursor is None
+
+    # Um turno ainda no buffer do InteractionWriter entra na janela junto com os do banco
+    history.record_turn(test_tenant.tenant_id, "5511999990000", "hist_5", "msg 5", "resp 5")
+    recent = await history.recent(async_db_session, test_tenant.tenant_id, "5511999990000")
+    assert [t.whatsapp_message_id for t in recent] == ["hist_3", "hist_4", "hist_5"]
+
+    # A segunda leitura vem da memória
+    await history.recent(async_db_session, test_tenant.tenant_id, "5511999990000")
+    assert history.stats()["hits"] == 1
+
+    # Limites fora da faixa são ajustados como em page(): no mínimo 1, no máximo a janela
+    for limit in (0, -2):
+        recent = await history.recent(async_db_session, test_tenant.tenant_id, "5511999990000", limit=limit)
+        assert [t.whatsapp_message_id for t in recent] == ["hist_5"]
+    recent = await history.recent(async_db_session, test_tenant.tenant_id, "5511999990000", limit=50)
+    assert len(recent) == 3
@@ -6,21 +6,20 @@ from services.orchestrator_agent import OrchestratorAgent
 from core.schemas import AnaliseDeIntencao, TarefaIdentificada, FinalResponseData, AIResponse
 from core.models import Tenant
 
-# Os fixtures 'db_session' e 'test_tenant' são fornecidos pelo conftest.py
+# Os fixtures 'async_db_session' e 'test_tenant' são fornecidos pelo conftest.py
 
 @pytest.mark.asyncio
-@patch('services.orchestrator_agent.RulesEngine')
-@patch('services.orchestrator_agent.VectorDBManager')
+@patch('services.orchestrator_agent.get_vector_db_manager')
 @patch('services.orchestrator_agent.Memory')
 async def test_orchestrator_routes_to_menu(
-    MockMemory, MockVectorDBManager, MockRulesEngine, db_session: Session, test_tenant: Tenant
+    MockMemory, MockVectorDBManager, async_db_session, test_tenant: Tenant
 ):
     """
     Testa se o orquestrador direciona corretamente para o 'menu_step'
     quando a intenção do usuário é 'menu'.
     """
     # Configuração
-    orchestrator = OrchestratorAgent(db=db_session, session_id="test_session_menu", tenant_id=test_tenant.tenant_id, user_id="user_menu_test")
+    orchestrator = OrchestratorAgent(db=async_db_session, session_id="test_session_menu", tenant_id=test_tenant.tenant_id, user_id="user_menu_test")
 
     # Simula a resposta do agente recepcionista
     receptionist_response = AnaliseDeIntencao(
@@ -51,25 +50,24 @@ async def test_orchestrator_routes_to_menu(
         )
 
         # Verificação
-        mock_receptionist_run.assert_called_once() # Garante que o recepcionista foi chamado
+        mock_receptionist_run.assert_not_called() # Pedidos de cardápio são resolvidos pelas regras, sem LLM
         assert result['send_menu'] is True
         assert "Claro! Aqui está o nosso cardápio." in result['response_text']
         assert "Olá! Bem-vindo(a) ao Atendente Virtual da Loja de Teste." in result['response_text']
 
 
 @pytest.mark.asyncio
-@patch('services.orchestrator_agent.RulesEngine')
-@patch('services.orchestrator_agent.VectorDBManager')
+@patch('services.orchestrator_agent.get_vector_db_manager')
 @patch('services.orchestrator_agent.Memory')
 async def test_orchestrator_routes_to_human_handoff(
-    MockMemory, MockVectorDBManager, MockRulesEngine, db_session: Session, test_tenant: Tenant
+    MockMemory, MockVectorDBManager, async_db_session, test_tenant: Tenant
 ):
     """
     Testa se o orquestrador direciona para o 'human_handoff_step'
     quando a intenção do usuário é 'falar_com_humano'.
     """
     # Configuração
-    orchestrator = OrchestratorAgent(db=db_session, session_id="test_session_handoff", tenant_id=test_tenant.tenant_id, user_id="user_handoff_test")
+    orchestrator = OrchestratorAgent(db=async_db_session, session_id="test_session_handoff", tenant_id=test_tenant.tenant_id, user_id="user_handoff_test")
 
     # Simula a resposta do agente recepcionista
     receptionist_response = AnaliseDeIntencao(
@@ -99,22 +97,21 @@ async def test_orchestrator_routes_to_human_handoff(
         )
 
         # Verificação
-        mock_receptionist_run.assert_called_once()
+        mock_receptionist_run.assert_not_called() # Pedidos de atendente são resolvidos pelas regras, sem LLM
         assert result['human_handoff'] is True
         assert "Um de nossos atendentes" in result['response_text']
 
 @pytest.mark.asyncio
-@patch('services.orchestrator_agent.RulesEngine')
-@patch('services.orchestrator_agent.VectorDBManager')
+@patch('services.orchestrator_agent.get_vector_db_manager')
 @patch('services.orchestrator_agent.Memory')
 async def test_orchestrator_routes_to_general_question(
-    MockMemory, MockVectorDBManager, MockRulesEngine, db_session: Session, test_tenant: Tenant
+    MockMemory, MockVectorDBManager, async_db_session, test_tenant: Tenant
 ):
     """
     Testa se o orquestrador usa o 'general_response_agent' para perguntas gerais.
     """
     # Configuração
-    orchestrator = OrchestratorAgent(db=db_session, session_id="test_session_general", tenant_id=test_tenant.tenant_id, user_id="user_general_test")
+    orchestrator = OrchestratorAgent(db=async_db_session, session_id="test_session_general", tenant_id=test_tenant.tenant_id, user_id="user_general_test")
 
     # Simula a resposta do agente recepcionista
     receptionist_response = AnaliseDeIntencao(
@@ -149,3 +146,152 @@ async def test_orchestrator_routes_to_general_question(
         assert result['send_menu'] is False
         assert "Nós fechamos às 23h." in result['response_text']
         assert "Olá! Bem-vindo(a) ao Atendente Virtual da Loja de Teste." in result['response_text']
+
+
+@patch('services.orchestrator_agent.get_vector_db_manager')
+def test_orchestrator_reuses_runtime_from_registry(
+    MockVectorDBManager, async_db_session, test_tenant: Tenant
+):
+    """
+    Testa se os agentes e o workflow são reaproveitados entre conversas
+    em vez de serem reconstruídos a cada mensagem.
+    """
+    first = OrchestratorAgent(db=async_db_session, session_id="registry_1", tenant_id=test_tenant.tenant_id, user_id="user_registry_1")
+    runtime = first.runtime
+    first.close()
+
+    second = OrchestratorAgent(db=async_db_session, session_id="registry_2", tenant_id=test_tenant.tenant_id, user_id="user_registry_2")
+    try:
+        assert second.runtime is runtime
+        assert second.receptionist_agent is runtime.receptionist_agent
+        assert second.composite_session_id == f"user_registry_2_{test_tenant.tenant_id}"
+    finally:
+        second.close()
+
+
+@pytest.mark.asyncio
+@patch('services.orchestrator_agent.get_vector_db_manager')
+@patch('services.orchestrator_agent._call_tool', new_callable=AsyncMock)
+async def test_orchestrator_runs_all_tasks_before_single_formulation(
+    mock_call_tool, MockVectorDBManager, async_db_session, test_tenant: Tenant
+):
+    """
+    Testa se todas as tarefas identificadas são executadas (não só a primeira)
+    e se o agente de formulação é chamado uma única vez ao final.
+    """
+    orchestrator = OrchestratorAgent(db=async_db_session, session_id="test_session_fan_out", tenant_id=test_tenant.tenant_id, user_id="user_fan_out_test")
+
+    receptionist_response = AnaliseDeIntencao(
+        tarefas=[
+            TarefaIdentificada(tipo_tarefa="menu", detalhes="quer o cardápio"),
+            TarefaIdentificada(tipo_tarefa="frete", detalhes="quer saber o frete"),
+        ],
+        contem_urgencia=False
+    )
+    mock_call_tool.return_value = {"valor_frete": 7.5}
+
+    with patch.object(orchestrator.receptionist_agent, 'arun', new_callable=AsyncMock) as mock_receptionist_run, \
+         patch.object(orchestrator.response_formulation_agent, 'arun', new_callable=AsyncMock) as mock_formulation_run:
+
+        mock_receptionist_run.return_value.content = receptionist_response
+        mock_formulation_run.return_value.content = FinalResponseData(text_response="Segue o cardápio. O frete fica R$ 7,50.")
+
+        result = await orchestrator.process_message(
+            message="me manda o cardapio e quanto fica o frete pra minha casa?",
+            personality_prompt="test",
+            client_latitude=-23.5,
+            client_longitude=-46.6
+        )
+
+    mock_formulation_run.assert_called_once()
+    context = mock_formulation_run.call_args.args[0]
+    assert '"valor_frete": 7.5' in context
+    assert '"send_menu_requested": true' in context
+    # A flag definida pelo handler do menu é preservada mesmo que a formulação não a repita.
+    assert result['send_menu'] is True
+    assert "O frete fica R$ 7,50." in result['response_text']
+    orchestrator.close()
+
+
+@pytest.mark.asyncio
+@patch('services.orchestrator_agent.get_vector_db_manager')
+async def test_pooled_runtime_keeps_sessions_of_different_users_apart(
+    MockVectorDBManager, async_db_session, test_tenant: Tenant
+):
+    """
+    Testa se dois usuários atendidos pelo mesmo runtime do pool rodam os agentes
+    em sessões diferentes, sem herdar o session_id da conversa anterior.
+    """
+    receptionist_response = AnaliseDeIntencao(
+        tarefas=[TarefaIdentificada(tipo_tarefa="fazer_pergunta_geral", detalhes="que horas voces fecham?")],
+        contem_urgencia=False
+    )
+    session_ids = []
+    memories = []
+    runtime = None
+    for user_id in ("user_pool_a", "user_pool_b"):
+        orchestrator = OrchestratorAgent(db=async_db_session, session_id=user_id, tenant_id=test_tenant.tenant_id, user_id=user_id, runtime=runtime)
+        runtime = orchestrator.runtime
+        with patch.object(runtime.receptionist_agent, 'arun', new_callable=AsyncMock) as mock_receptionist_run, \
+             patch.object(runtime.response_formulation_agent, 'arun', new_callable=AsyncMock) as mock_formulation_run:
+            mock_receptionist_run.return_value.content = receptionist_response
+            mock_formulation_run.return_value.content = FinalResponseData(text_response="Nós fechamos às 23h.")
+
+            await orchestrator.process_message(message="que horas voces fecham?", personality_prompt="test")
+
+        assert mock_receptionist_run.call_args.kwargs["session_id"] == orchestrator.composite_session_id
+        session_ids.append(mock_formulation_run.call_args.kwargs["session_id"])
+        memory = orchestrator.memory
+        assert runtime.response_formulation_agent.memory is memory
+        orchestrator.close()
+        assert all(agent.session_id is None for agent in runtime.agents)
+        # A Memory do agno (runs e memórias em dicionários do processo) não sobrevive à conversa.
+        assert runtime.memory is None and runtime.order_taking_agent.memory is None
+        memories.append(memory)
+
+    assert memories[0] is not memories[1]
+    assert memories[0].db is memories[1].db
+
+    assert session_ids == [f"user_pool_a_{test_tenant.tenant_id}", f"user_pool_b_{test_tenant.tenant_id}"]
+
+
+@pytest.mark.asyncio
+@patch('services.orchestrator_agent.get_vector_db_manager')
+@patch('services.orchestrator_agent._call_tool', new_callable=AsyncMock)
+async def test_orchestrator_reports_failed_handlers_and_aborts_on_order_taking_failure(
+    mock_call_tool, MockVectorDBManager, async_db_session, test_tenant: Tenant
+):
+    """
+    Testa se a falha de um handler opcional chega à formulação em 'failed_tasks'
+    e se a falha da tomada de pedido interrompe a mensagem em vez de ser engolida.
+    """
+    orchestrator = OrchestratorAgent(db=async_db_session, session_id="test_session_failures", tenant_id=test_tenant.tenant_id, user_id="user_failures_test")
+    mock_call_tool.side_effect = RuntimeError("serviço de frete fora do ar")
+
+    with patch.object(orchestrator.receptionist_agent, 'arun', new_callable=AsyncMock) as mock_receptionist_run, \
+         patch.object(orchestrator.response_formulation_agent, 'arun', new_callable=AsyncMock) as mock_formulation_run:
+
+        mock_receptionist_run.return_value.content = AnaliseDeIntencao(
+            tarefas=[TarefaIdentificada(tipo_tarefa="frete", detalhes="quer saber o frete")],
+            contem_urgencia=False
+        )
+        mock_formulation_run.return_value.content = FinalResponseData(text_response="Não consegui calcular o frete agora.")
+
+        await orchestrator.process_message(
+            message="quanto fica o frete pra minha casa?",
+            personality_prompt="test",
+            client_latitude=-23.5,
+            client_longitude=-46.6
+        )
+        context = mock_formulation_run.call_args.args[0]
+        assert '"failed_tasks": ["frete"]' in context
+
+        mock_receptionist_run.return_value.content = AnaliseDeIntencao(
+            tarefas=[TarefaIdentificada(tipo_tarefa="adicionar_item", detalhes="uma pizza")],
+            contem_urgencia=False
+        )
+        with patch.object(orchestrator, '_handle_order_taking_wrapper', new_callable=AsyncMock) as mock_order_taking:
+            mock_order_taking.side_effect = RuntimeError("falha ao registrar o pedido")
+            with pytest.raises(RuntimeError, match="falha ao registrar o pedido"):
+                await orchestrator.process_message(message="quero uma pizza grande", personality_prompt="test")
+    orchestrator.close()